@@ -0,0 +1,687 @@
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+USAGE = (
+    "python sra_pipeline.py PRJNA390610 /abs/path/outdir --cores 16 "
+    "--fetch_workers 4 --convert_workers 2 --compress_workers 2 --tmp_limit_gb 200"
+)
+
+STAGES = ["fetch", "convert", "compress", "cleanup"]
+
+# Written to logs/<SRR>.log once a run is finished; also the last line of
+# download_bioproject_sra.sh's run logs, so its finished runs are skipped too
+DONE_LINE = "[INFO] DONE {srr}"
+
+SUMMARY_FILENAME = "pipeline_summary.json"
+
+# fasterq-dump's scratch is about the size of its FASTQ output, several
+# times the .sra file
+SCRATCH_FACTOR = 7.0
+
+SRR_PATTERN = re.compile(r"^SRR[0-9]+$")
+
+_print_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    with _print_lock:
+        print(message, flush=True)
+
+
+def format_size(nbytes: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TB"
+
+
+def env_flag(name: str, default: int = 1) -> bool:
+    """
+    The 0/1 environment switches of download_bioproject_sra.sh
+    (DO_PREFETCH, KEEP_SRA, PIGZ).
+    """
+    return os.environ.get(name, str(default)).strip() not in ("0", "")
+
+
+def dir_size(path: Path) -> int:
+    """
+    Bytes held by the files under `path` (0 if it does not exist).
+    """
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def fetch_srr_list(bioproject: str, outdir: Path, refresh: bool = False) -> List[str]:
+    """
+    SRR accessions of a BioProject, from `pysradb metadata --detailed` like
+    download_bioproject_sra.sh: first column, SRR tokens only, sorted and
+    unique. The metadata table and list are kept in meta/; an existing list
+    is reused on restart unless `refresh` is set.
+    """
+    meta_tsv = outdir / "meta" / f"{bioproject}.metadata.tsv"
+    srr_list = outdir / "meta" / f"{bioproject}.srr.txt"
+    if srr_list.exists() and srr_list.stat().st_size and not refresh:
+        log(f"[INFO] Reusing SRR list: {srr_list}")
+    else:
+        log("[INFO] Fetching metadata via pysradb...")
+        with meta_tsv.open("w", encoding="utf-8") as handle:
+            subprocess.run(["pysradb", "metadata", bioproject, "--detailed"], stdout=handle, check=True)
+        log("[INFO] Extracting SRR accessions...")
+        runs = set()
+        with meta_tsv.open(encoding="utf-8") as handle:
+            next(handle, None)
+            for line in handle:
+                fields = line.split()
+                if fields and SRR_PATTERN.match(fields[0]):
+                    runs.add(fields[0])
+        srr_list.write_text("".join(f"{srr}\n" for srr in sorted(runs)), encoding="utf-8")
+    return [line.strip() for line in srr_list.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+class StageStats:
+    """
+    Runs and bytes handled by one stage, and the time its workers spent on
+    them.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.runs = 0
+        self.failed = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            if ok:
+                self.runs += 1
+                self.bytes += nbytes
+            else:
+                self.failed += 1
+            self.busy += seconds
+            self.finished = time.monotonic()
+
+    def mark_start(self) -> None:
+        with self._lock:
+            if self.started is None:
+                self.started = time.monotonic()
+
+    def wall(self) -> float:
+        if self.started is None:
+            return 0.0
+        return max((self.finished or time.monotonic()) - self.started, 1e-9)
+
+    def as_dict(self) -> Dict:
+        wall = self.wall()
+        return {
+            "workers": self.workers,
+            "runs": self.runs,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "busy_seconds": round(self.busy, 1),
+            "wall_seconds": round(wall, 1),
+            "runs_per_hour": round(self.runs * 3600 / wall, 2) if wall else 0.0,
+            "mb_per_second": round(self.bytes / wall / 1024 / 1024, 2) if wall else 0.0,
+            "utilization": round(self.busy / (wall * self.workers), 2) if wall else 0.0,
+        }
+
+    def line(self) -> str:
+        stats = self.as_dict()
+        failed = f", {self.failed} failed" if self.failed else ""
+        return (
+            f"{self.name:<8} {self.runs} runs{failed}, {format_size(self.bytes)} in {stats['wall_seconds']}s "
+            f"({stats['mb_per_second']} MB/s, {stats['runs_per_hour']} runs/h, "
+            f"{self.workers} workers {int(stats['utilization'] * 100)}% busy)"
+        )
+
+
+class ScratchBudget:
+    """
+    Byte budget for fasterq-dump scratch in tmp/.
+
+    A conversion reserves its estimated scratch before it starts and waits
+    while the reservations already held would exceed `limit_bytes`. A run
+    is always admitted when nothing else holds scratch, so a single run
+    larger than the budget still converts, alone. A limit of 0 disables the
+    budget.
+    """
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = max(0, int(limit_bytes))
+        self.reserved = 0
+        self.peak_reserved = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int) -> Iterator[None]:
+        nbytes = max(0, int(nbytes))
+        with self._cond:
+            while self.limit_bytes and self.reserved and self.reserved + nbytes > self.limit_bytes:
+                self._cond.wait()
+            self.reserved += nbytes
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.reserved -= nbytes
+                self._cond.notify_all()
+
+
+class Run:
+    """
+    One SRR accession moving through the stages, with its run log.
+    """
+
+    def __init__(self, srr: str, outdir: Path):
+        self.srr = srr
+        self.outdir = outdir
+        self.log_path = outdir / "logs" / f"{srr}.log"
+        self.sra_path: Optional[Path] = None
+        self.started = time.monotonic()
+
+    def note(self, message: str) -> None:
+        with self.log_path.open("a", encoding="utf-8") as handle:
+            handle.write(message + "\n")
+
+    def call(self, command: List[str]) -> None:
+        """
+        Run a tool with its output appended to the run log.
+        """
+        self.note(f"[INFO] $ {' '.join(command)}")
+        with self.log_path.open("a", encoding="utf-8") as handle:
+            subprocess.run(command, cwd=self.outdir, stdout=handle, stderr=subprocess.STDOUT, check=True)
+
+    @property
+    def scratch_dir(self) -> Path:
+        return self.outdir / "tmp" / self.srr
+
+    @property
+    def staging_dir(self) -> Path:
+        return self.outdir / "fastq" / f".{self.srr}.part"
+
+    def fastq_files(self) -> List[Path]:
+        """
+        Uncompressed FASTQ of this run in fastq/ (SRR1.fastq, SRR1_1.fastq,
+        ...; not SRR10.fastq).
+        """
+        return self._fastq_glob(".fastq")
+
+    def gzipped_files(self) -> List[Path]:
+        """
+        Compressed FASTQ of this run in fastq/ (SRR1.fastq.gz,
+        SRR1_1.fastq.gz, ...).
+        """
+        return self._fastq_glob(".fastq.gz")
+
+    def _fastq_glob(self, suffix: str) -> List[Path]:
+        fastq = self.outdir / "fastq"
+        return sorted([*fastq.glob(f"{self.srr}{suffix}"), *fastq.glob(f"{self.srr}_*{suffix}")])
+
+
+def is_complete(outdir: Path, srr: str) -> bool:
+    """
+    True when a previous run of this script, or of download_bioproject_sra.sh,
+    finished `srr`: its log ends with the DONE line.
+    """
+    log_path = outdir / "logs" / f"{srr}.log"
+    try:
+        with log_path.open("rb") as handle:
+            handle.seek(max(0, log_path.stat().st_size - 256))
+            tail = handle.read().decode("utf-8", errors="replace").splitlines()
+    except OSError:
+        return False
+    return bool(tail) and tail[-1].strip() == DONE_LINE.format(srr=srr)
+
+
+def find_sra(outdir: Path, srr: str) -> Optional[Path]:
+    """
+    The .sra prefetch wrote for `srr`, directly in sra/ or nested under it.
+    """
+    direct = outdir / "sra" / f"{srr}.sra"
+    if direct.is_file():
+        return direct
+    for depth in range(1, 4):
+        for candidate in (outdir / "sra").glob("/".join(["*"] * depth) + f"/{srr}.sra"):
+            if candidate.is_file():
+                return candidate
+    return None
+
+
+class SRAPipeline:
+    """
+    prefetch, fasterq-dump and pigz for the runs of a BioProject as four
+    stages with their own worker pools:
+
+      fetch     prefetch the .sra (network bound)
+      convert   fasterq-dump into FASTQ (CPU and disk bound)
+      compress  pigz the FASTQ files (CPU bound)
+      cleanup   drop scratch and, unless kept, the .sra; mark the run done
+
+    Runs move from one stage to the next through bounded queues, so a fast
+    fetch stage waits instead of filling the disk with .sra files nobody is
+    converting yet. Conversions reserve their estimated scratch from a
+    ScratchBudget before starting, and FASTQ is written to a hidden staging
+    directory and moved into fastq/ only once complete, so a killed job
+    never leaves a partial file that looks finished.
+    """
+
+    def __init__(
+        self,
+        outdir: Path,
+        fetch_workers: int,
+        convert_workers: int,
+        convert_threads: int,
+        compress_workers: int,
+        compress_threads: int,
+        cleanup_workers: int = 1,
+        queue_size: int = 2,
+        budget: Optional[ScratchBudget] = None,
+        scratch_factor: float = SCRATCH_FACTOR,
+        prefetch: bool = True,
+        compress: bool = True,
+        keep_sra: bool = True,
+        printer: Callable[[str], None] = log,
+    ):
+        self.outdir = outdir
+        self.convert_threads = max(1, convert_threads)
+        self.compress_threads = max(1, compress_threads)
+        self.budget = budget or ScratchBudget(0)
+        self.scratch_factor = scratch_factor
+        self.prefetch = prefetch
+        self.compress = compress
+        self.keep_sra = keep_sra
+        self.printer = printer
+        self.workers = {
+            "fetch": max(1, fetch_workers) if prefetch else 1,
+            "convert": max(1, convert_workers),
+            "compress": max(1, compress_workers),
+            "cleanup": max(1, cleanup_workers),
+        }
+        self.stats = {stage: StageStats(stage, self.workers[stage]) for stage in STAGES}
+        self.handlers = {
+            "fetch": self.fetch,
+            "convert": self.convert,
+            "compress": self.compress_run,
+            "cleanup": self.cleanup,
+        }
+        # One inbox per stage; the fetch inbox is fed by run()
+        self.inboxes = {stage: queue.Queue(maxsize=max(1, queue_size)) for stage in STAGES}
+        self.failed: List[str] = []
+        self.done: List[str] = []
+        self._lock = threading.Lock()
+        self._remaining = dict(self.workers)
+        self.peak_scratch = 0
+
+    # Stages -------------------------------------------------------------
+
+    def fetch(self, run: Run) -> int:
+        if not self.prefetch:
+            return 0
+        run.note(f"[INFO] prefetch {run.srr} -> sra/")
+        run.call(["prefetch", "-O", "sra", run.srr])
+        run.sra_path = find_sra(self.outdir, run.srr)
+        if run.sra_path is None:
+            raise FileNotFoundError(f"Could not locate downloaded .sra for {run.srr}")
+        return run.sra_path.stat().st_size
+
+    def convert(self, run: Run) -> int:
+        if self.prefetch:
+            source = str(run.sra_path.relative_to(self.outdir))
+            estimate = int(run.sra_path.stat().st_size * self.scratch_factor)
+        else:
+            # Streaming from the accession: no size to go by, so take the whole budget
+            source = run.srr
+            estimate = self.budget.limit_bytes
+        shutil.rmtree(run.scratch_dir, ignore_errors=True)
+        shutil.rmtree(run.staging_dir, ignore_errors=True)
+        run.staging_dir.mkdir(parents=True)
+        with self.budget.reserve(estimate):
+            run.scratch_dir.mkdir(parents=True, exist_ok=True)
+            run.note(f"[INFO] fasterq-dump from {source} (scratch estimate {format_size(estimate)})")
+            try:
+                run.call([
+                    "fasterq-dump", "--threads", str(self.convert_threads), "--split-files",
+                    "--temp", str(run.scratch_dir.relative_to(self.outdir)),
+                    "-O", str(run.staging_dir.relative_to(self.outdir)), source,
+                ])
+            finally:
+                shutil.rmtree(run.scratch_dir, ignore_errors=True)
+        nbytes = 0
+        for path in sorted(run.staging_dir.iterdir()):
+            nbytes += path.stat().st_size
+            os.replace(path, self.outdir / "fastq" / path.name)
+        run.staging_dir.rmdir()
+        return nbytes
+
+    def compress_run(self, run: Run) -> int:
+        files = run.fastq_files()
+        if not self.compress or not files:
+            return 0
+        nbytes = sum(path.stat().st_size for path in files)
+        run.note(f"[INFO] pigz compress fastq/{run.srr}*.fastq")
+        run.call(
+            ["pigz", "-f", "-p", str(self.compress_threads)]
+            + [str(path.relative_to(self.outdir)) for path in files]
+        )
+        return nbytes
+
+    def cleanup(self, run: Run) -> int:
+        freed = 0
+        if self.prefetch and not self.keep_sra and run.sra_path is not None and run.sra_path.exists():
+            run.note(f"[INFO] Removing cached .sra for {run.srr}")
+            freed = run.sra_path.stat().st_size
+            run.sra_path.unlink()
+            if run.sra_path.parent.name == run.srr:
+                shutil.rmtree(run.sra_path.parent, ignore_errors=True)
+        run.note(DONE_LINE.format(srr=run.srr))
+        return freed
+
+    # Plumbing -----------------------------------------------------------
+
+    def _next_stage(self, stage: str) -> Optional[str]:
+        index = STAGES.index(stage)
+        return STAGES[index + 1] if index + 1 < len(STAGES) else None
+
+    def _worker(self, stage: str) -> None:
+        inbox = self.inboxes[stage]
+        following = self._next_stage(stage)
+        stats = self.stats[stage]
+        while True:
+            run = inbox.get()
+            if run is None:
+                break
+            stats.mark_start()
+            start = time.monotonic()
+            try:
+                nbytes = self.handlers[stage](run)
+            except Exception as exc:
+                stats.record(0, time.monotonic() - start, ok=False)
+                run.note(f"[ERROR] {stage} failed: {exc}")
+                self.printer(f"[ERROR] {run.srr}: {stage} failed ({exc}); see {run.log_path}")
+                with self._lock:
+                    self.failed.append(run.srr)
+                continue
+            stats.record(nbytes, time.monotonic() - start)
+            if following is not None:
+                self.inboxes[following].put(run)
+            else:
+                with self._lock:
+                    self.done.append(run.srr)
+                self.printer(f"[INFO] DONE {run.srr} ({time.monotonic() - run.started:.0f}s)")
+        # The last worker of a stage to stop closes the next stage
+        with self._lock:
+            self._remaining[stage] -= 1
+            last = self._remaining[stage] == 0
+        if last and following is not None:
+            for _ in range(self.workers[following]):
+                self.inboxes[following].put(None)
+
+    def _monitor(self, stop: threading.Event, interval: float) -> None:
+        scratch = self.outdir / "tmp"
+        while not stop.wait(min(interval, 5.0) if interval else 5.0):
+            self.peak_scratch = max(self.peak_scratch, dir_size(scratch))
+            if interval and time.monotonic() - self._last_report >= interval:
+                self._last_report = time.monotonic()
+                self.printer(self.progress())
+
+    def progress(self) -> str:
+        parts = [
+            f"{stage} {self.stats[stage].runs} (queued {self.inboxes[stage].qsize()})" for stage in STAGES
+        ]
+        return (
+            f"[INFO] Progress: {', '.join(parts)}; scratch reserved "
+            f"{format_size(self.budget.reserved)} of {format_size(self.budget.limit_bytes) if self.budget.limit_bytes else 'unlimited'}"
+        )
+
+    def resume_stage(self, run: Run) -> str:
+        """
+        First stage an unfinished run still needs. Once FASTQ has been moved
+        into fastq/ the conversion is over: compress while uncompressed FASTQ
+        is left (pigz -f redoes a file it was killed in), cleanup when only
+        .fastq.gz remains, as after a kill before cleanup or a
+        download_bioproject_sra.sh rerun that skipped the run without a DONE
+        line. Fetch otherwise (prefetch itself skips a complete .sra).
+        """
+        if run.staging_dir.exists():
+            return "fetch"
+        if run.fastq_files():
+            stage = "compress"
+        elif run.gzipped_files():
+            stage = "cleanup"
+        else:
+            return "fetch"
+        run.sra_path = find_sra(self.outdir, run.srr)
+        return stage
+
+    def run(self, srrs: List[str], progress_interval: float = 60.0) -> None:
+        threads = [
+            threading.Thread(target=self._worker, args=(stage,), name=f"{stage}-{index}", daemon=True)
+            for stage in STAGES
+            for index in range(self.workers[stage])
+        ]
+        for thread in threads:
+            thread.start()
+        stop = threading.Event()
+        self._last_report = time.monotonic()
+        monitor = threading.Thread(target=self._monitor, args=(stop, progress_interval), daemon=True)
+        monitor.start()
+
+        runs = []
+        for srr in srrs:
+            run = Run(srr, self.outdir)
+            run.note(f"[INFO] ===== {srr} =====")
+            run.note(f"[INFO] date: {time.strftime('%Y-%m-%dT%H:%M:%S%z')}")
+            runs.append((self.resume_stage(run), run))
+        # Runs resuming at a later stage go in first: a stage is closed once
+        # the one before it finishes, which cannot happen before fetch is fed
+        for stage, run in runs:
+            if stage == "compress":
+                run.note(f"[INFO] FASTQ already converted for {run.srr}, resuming at compress")
+                self.inboxes["compress"].put(run)
+            elif stage == "cleanup":
+                run.note(f"[INFO] FASTQ already compressed for {run.srr}, resuming at cleanup")
+                self.inboxes["cleanup"].put(run)
+        for stage, run in runs:
+            if stage == "fetch":
+                self.inboxes["fetch"].put(run)
+        for _ in range(self.workers["fetch"]):
+            self.inboxes["fetch"].put(None)
+
+        for thread in threads:
+            thread.join()
+        stop.set()
+        monitor.join()
+        self.peak_scratch = max(self.peak_scratch, dir_size(self.outdir / "tmp"))
+
+    def summary(self) -> Dict:
+        return {
+            "stages": {stage: self.stats[stage].as_dict() for stage in STAGES},
+            "done": len(self.done),
+            "failed": sorted(self.failed),
+            "scratch_limit_bytes": self.budget.limit_bytes,
+            "scratch_peak_reserved_bytes": self.budget.peak_reserved,
+            "scratch_peak_bytes": self.peak_scratch,
+        }
+
+
+def default_workers(cores: int) -> Dict[str, int]:
+    """
+    Stage sizes for `cores` CPUs. prefetch is network bound and needs little
+    CPU, so it gets its own small pool on top; fasterq-dump and pigz split
+    the cores between them.
+    """
+    cores = max(1, cores)
+    convert_workers = max(1, cores // 8)
+    compress_workers = max(1, cores // 8)
+    return {
+        "fetch_workers": min(4, max(2, cores // 2)),
+        "convert_workers": convert_workers,
+        "convert_threads": max(1, (cores // 2) // convert_workers),
+        "compress_workers": compress_workers,
+        "compress_threads": max(1, (cores - cores // 2) // compress_workers),
+        "cleanup_workers": 1,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Download the SRA runs of an NCBI BioProject with prefetch, fasterq-dump and pigz "
+            "running as separate, pipelined stages."
+        ),
+        epilog=f"Example:\n  {USAGE}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("bioproject", help="BioProject ID (e.g. PRJNA390610).")
+    parser.add_argument("outdir", type=Path, help="Output directory (meta/, sra/, fastq/, tmp/, logs/).")
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=int(os.environ.get("THREADS", 8)),
+        help="CPUs to size the stages from (default: THREADS env var or 8).",
+    )
+    parser.add_argument("--memory", default="", help="Memory allocation of the job, for the log only (e.g. 120G).")
+    for name, text in [
+        ("fetch_workers", "Concurrent prefetch downloads"),
+        ("convert_workers", "Concurrent fasterq-dump conversions"),
+        ("convert_threads", "Threads per fasterq-dump"),
+        ("compress_workers", "Concurrent pigz compressions"),
+        ("compress_threads", "Threads per pigz"),
+        ("cleanup_workers", "Cleanup workers"),
+    ]:
+        parser.add_argument(f"--{name}", type=int, default=None, help=f"{text} (default: derived from --cores).")
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=2,
+        help="Runs that may wait between two stages before the earlier stage pauses (default: 2).",
+    )
+    parser.add_argument(
+        "--tmp_limit_gb",
+        type=float,
+        default=0,
+        help="Byte budget for fasterq-dump scratch in tmp/, in GB; 0 for no limit (default: 0).",
+    )
+    parser.add_argument(
+        "--scratch_factor",
+        type=float,
+        default=SCRATCH_FACTOR,
+        help=f"Scratch reserved per conversion, as a multiple of the .sra size (default: {SCRATCH_FACTOR}).",
+    )
+    parser.add_argument(
+        "--refresh_metadata",
+        action="store_true",
+        help="Query pysradb again even when meta/<BIOPROJECT>.srr.txt exists.",
+    )
+    parser.add_argument(
+        "--progress_interval",
+        type=float,
+        default=60,
+        help="Seconds between progress lines; 0 to disable (default: 60).",
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    prefetch = env_flag("DO_PREFETCH")
+    keep_sra = env_flag("KEEP_SRA")
+    compress = env_flag("PIGZ") and shutil.which("pigz") is not None
+
+    for command in ["prefetch", "fasterq-dump", "pysradb"]:
+        if shutil.which(command) is None:
+            print(f"[ERROR] Required command not found: {command}")
+            print("        Make sure your micromamba env contains it, or install it system-wide.")
+            return 2
+
+    sizes = default_workers(args.cores)
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = max(1, getattr(args, name))
+
+    outdir = args.outdir.expanduser().resolve()
+    for sub in ["meta", "sra", "fastq", "tmp", "logs"]:
+        (outdir / sub).mkdir(parents=True, exist_ok=True)
+
+    log(f"[INFO] BioProject: {args.bioproject}")
+    log(f"[INFO] Output dir: {outdir}")
+    if args.memory:
+        log(f"[INFO] Memory allocation: {args.memory}")
+    log(
+        f"[INFO] fetch={sizes['fetch_workers']} convert={sizes['convert_workers']}x{sizes['convert_threads']} "
+        f"compress={sizes['compress_workers']}x{sizes['compress_threads']} cleanup={sizes['cleanup_workers']} "
+        f"DO_PREFETCH={int(prefetch)} KEEP_SRA={int(keep_sra)} PIGZ={int(compress)}"
+    )
+
+    srrs = fetch_srr_list(args.bioproject, outdir, args.refresh_metadata)
+    if not srrs:
+        log(f"[ERROR] No SRR runs found for {args.bioproject}. Check metadata file: meta/{args.bioproject}.metadata.tsv")
+        return 3
+    pending = [srr for srr in srrs if not is_complete(outdir, srr)]
+    log(f"[INFO] Found {len(srrs)} SRR runs, {len(srrs) - len(pending)} already complete")
+
+    budget = ScratchBudget(int(args.tmp_limit_gb * 1024 ** 3))
+    if budget.limit_bytes:
+        log(f"[INFO] Scratch limit: {format_size(budget.limit_bytes)} in tmp/")
+    pipeline = SRAPipeline(
+        outdir,
+        budget=budget,
+        scratch_factor=args.scratch_factor,
+        queue_size=args.queue_size,
+        prefetch=prefetch,
+        compress=compress,
+        keep_sra=keep_sra,
+        **sizes,
+    )
+    log("[INFO] Downloading & converting runs...")
+    pipeline.run(pending, args.progress_interval)
+
+    summary = pipeline.summary()
+    summary.update({"bioproject": args.bioproject, "runs": len(srrs), "skipped": len(srrs) - len(pending)})
+    summary_path = outdir / "logs" / SUMMARY_FILENAME
+    summary_path.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+
+    log("\n[INFO] Stage throughput:")
+    for stage in STAGES:
+        log(f"[INFO]   {pipeline.stats[stage].line()}")
+    log(
+        f"[INFO] Scratch: peak {format_size(pipeline.peak_scratch)} used, "
+        f"{format_size(budget.peak_reserved)} reserved"
+        + (f" (limit {format_size(budget.limit_bytes)})" if budget.limit_bytes else "")
+    )
+    log(f"[INFO] Summary: {summary_path}")
+    if pipeline.failed:
+        log(f"[ERROR] {len(pipeline.failed)} runs failed: {' '.join(sorted(pipeline.failed))}")
+        return 1
+    log("[SUCCESS] All runs processed.")
+    log(f"[INFO] Metadata: meta/{args.bioproject}.metadata.tsv")
+    log(f"[INFO] SRR list:  meta/{args.bioproject}.srr.txt")
+    log(f"[INFO] FASTQ dir: {outdir / 'fastq'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
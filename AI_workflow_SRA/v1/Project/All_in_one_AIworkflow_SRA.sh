@@ -335,8 +335,23 @@ run_option2_direct() {
         return 1
     fi
     
+    if [ "${USE_SRA_PIPELINE:-0}" = "1" ] && [ ! -f "$SRA_PIPELINE_PATH" ]; then
+        echo "✗ Error: SRA pipeline script not found: $SRA_PIPELINE_PATH"
+        return 1
+    fi
+    
     echo "Running SRA download directly..."
-    /bin/bash "$SRA_SCRIPT_PATH" "$bioproject_id" "$SRA_OUTPUT_DIR"
+    if [ "${USE_SRA_PIPELINE:-0}" = "1" ]; then
+        # micromamba is activated first, as the LSF job does; in a subshell so
+        # this script's own environment is left alone.
+        # SRA_PIPELINE_ARGS is split into separate flags on purpose
+        (
+            eval "$(micromamba shell hook --shell bash)" && micromamba activate base &&
+                python3 "$SRA_PIPELINE_PATH" "$bioproject_id" "$SRA_OUTPUT_DIR" ${SRA_PIPELINE_ARGS}
+        )
+    else
+        /bin/bash "$SRA_SCRIPT_PATH" "$bioproject_id" "$SRA_OUTPUT_DIR"
+    fi
     local exit_code=$?
     
     if [ $exit_code -eq 0 ]; then
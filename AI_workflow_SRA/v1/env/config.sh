@@ -80,4 +80,12 @@ mkdir -p "$CONDA_ENVS_DIRS" "$CONDA_PKGS_DIRS"
 #################################################################
 # Path to download_bioproject_sra.sh script
 # The calling script will check for existence and try alternative paths
-SRA_SCRIPT_PATH="${WORKING_DIR}/AI_workflow_SRA/PY_function/download_bioproject_sra.sh"
\ No newline at end of file
+SRA_SCRIPT_PATH="${WORKING_DIR}/AI_workflow_SRA/PY_function/download_bioproject_sra.sh"
+
+# Pipelined Python orchestrator (PY_function/sra_pipeline.py): prefetch, fasterq-dump
+# and pigz run as separate worker pools instead of per-run slots of download_bioproject_sra.sh.
+# Set USE_SRA_PIPELINE=1 to use it; SRA_PIPELINE_ARGS adds stage sizes or a scratch limit,
+# e.g. "--fetch_workers 4 --tmp_limit_gb 200".
+SRA_PIPELINE_PATH="${WORKING_DIR}/AI_workflow_SRA/PY_function/sra_pipeline.py"
+USE_SRA_PIPELINE="${USE_SRA_PIPELINE:-0}"
+SRA_PIPELINE_ARGS="${SRA_PIPELINE_ARGS:-}"
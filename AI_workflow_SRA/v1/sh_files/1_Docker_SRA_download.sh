@@ -65,6 +65,18 @@ if [ ! -f "$SRA_SCRIPT_PATH" ]; then
     exit 1
 fi
 
+# Pipelined Python orchestrator instead of download_bioproject_sra.sh (USE_SRA_PIPELINE=1 in config.sh)
+# micromamba is activated first, as download_bioproject_sra.sh does for itself
+if [ "${USE_SRA_PIPELINE:-0}" = "1" ]; then
+    if [ ! -f "$SRA_PIPELINE_PATH" ]; then
+        echo "Error: SRA pipeline script not found: $SRA_PIPELINE_PATH"
+        exit 1
+    fi
+    sra_command="eval \"\$(micromamba shell hook --shell bash)\" && micromamba activate base && python3 \"${SRA_PIPELINE_PATH}\" \"${bioproject_id}\" \"${SRA_OUTPUT_DIR}\" --cores \"${CORES}\" --memory \"${MEMORY}\" ${SRA_PIPELINE_ARGS}"
+else
+    sra_command="/bin/bash \"${SRA_SCRIPT_PATH}\" \"${bioproject_id}\" \"${SRA_OUTPUT_DIR}\" \"${CORES}\" \"${MEMORY}\""
+fi
+
 # Validate SRA output directory can be created
 mkdir -p "$SRA_OUTPUT_DIR"
 if [ ! -d "$SRA_OUTPUT_DIR" ]; then
@@ -81,7 +93,11 @@ echo "=========================================="
 echo "Job Name: $job_name"
 echo "BioProject ID: $bioproject_id"
 echo "Output Directory: $SRA_OUTPUT_DIR"
-echo "SRA Script: $SRA_SCRIPT_PATH"
+if [ "${USE_SRA_PIPELINE:-0}" = "1" ]; then
+    echo "SRA Script: $SRA_PIPELINE_PATH ${SRA_PIPELINE_ARGS}"
+else
+    echo "SRA Script: $SRA_SCRIPT_PATH"
+fi
 echo "Docker Image: $docker_sra"
 echo "Memory: $MEMORY"
 echo "Cores: $CORES"
@@ -92,10 +108,11 @@ echo "=========================================="
 
 # Submit the job to LSF
 # The -a "docker($docker_sra)" flag ensures the entire command runs inside the Docker container
-# Pass bioproject_id and SRA_OUTPUT_DIR as arguments to download_bioproject_sra.sh
+# Pass bioproject_id and SRA_OUTPUT_DIR as arguments to download_bioproject_sra.sh (or sra_pipeline.py)
 # Also pass CORES and MEMORY as arguments
 # Note: The Docker image (aibiologist/sra-tools:v1) has micromamba with pysradb, sra-tools, and pigz
-# THREADS and PARALLEL are calculated by download_bioproject_sra.sh from CORES argument
+# THREADS and PARALLEL are calculated by download_bioproject_sra.sh from CORES argument;
+# sra_pipeline.py sizes its fetch/convert/compress pools from --cores unless SRA_PIPELINE_ARGS sets them
 # Capture job ID from bsub output (bsub returns: "Job <job_id> is submitted to queue <queue>")
 bsub_output=$(bsub -cwd "$Project_path" \
      -q general \
@@ -108,7 +125,7 @@ bsub_output=$(bsub -cwd "$Project_path" \
      -e "$error_file" \
      -J "$job_name" \
      -R "rusage[mem=$MEMORY] span[hosts=1]" \
-     /bin/bash -c "/bin/bash \"${SRA_SCRIPT_PATH}\" \"${bioproject_id}\" \"${SRA_OUTPUT_DIR}\" \"${CORES}\" \"${MEMORY}\"" 2>&1)
+     /bin/bash -c "$sra_command" 2>&1)
 
 # Extract job ID from bsub output
 # bsub returns format: "Job <job_id> is submitted to queue <queue>"
@@ -0,0 +1,103 @@
+import threading
+
+from sra_pipeline import DONE_LINE, Run, SRAPipeline, ScratchBudget, default_workers, is_complete
+
+
+def make_outdir(tmp_path):
+    for sub in ["meta", "sra", "fastq", "tmp", "logs"]:
+        (tmp_path / sub).mkdir()
+    return tmp_path
+
+
+def pipeline(outdir, **kwargs):
+    return SRAPipeline(
+        outdir, fetch_workers=1, convert_workers=1, convert_threads=1, compress_workers=1,
+        compress_threads=1, printer=lambda message: None, **kwargs,
+    )
+
+
+def touch(outdir, *names):
+    for name in names:
+        (outdir / "fastq" / name).write_bytes(b"@r\nACGT\n+\nIIII\n")
+
+
+def test_default_workers_split_the_cores():
+    sizes = default_workers(16)
+    assert sizes["convert_workers"] * sizes["convert_threads"] == 8
+    assert sizes["compress_workers"] * sizes["compress_threads"] == 8
+    assert sizes["fetch_workers"] == 4
+    assert default_workers(1) == {
+        "fetch_workers": 2, "convert_workers": 1, "convert_threads": 1,
+        "compress_workers": 1, "compress_threads": 1, "cleanup_workers": 1,
+    }
+
+
+def test_scratch_budget_admits_a_run_larger_than_the_limit_alone():
+    budget = ScratchBudget(100)
+    with budget.reserve(500):
+        assert budget.reserved == 500
+    assert budget.reserved == 0
+    assert budget.peak_reserved == 500
+
+
+def test_scratch_budget_waits_until_the_reservation_fits():
+    budget = ScratchBudget(100)
+    admitted = threading.Event()
+
+    def second():
+        with budget.reserve(60):
+            admitted.set()
+
+    with budget.reserve(60):
+        thread = threading.Thread(target=second)
+        thread.start()
+        assert not admitted.wait(0.2)
+    thread.join(5)
+    assert admitted.is_set()
+    assert budget.peak_reserved == 60
+
+
+def test_is_complete_needs_the_done_line_last(tmp_path):
+    outdir = make_outdir(tmp_path)
+    assert not is_complete(outdir, "SRR1")
+    log_path = outdir / "logs" / "SRR1.log"
+    log_path.write_text(f"[INFO] ===== SRR1 =====\n{DONE_LINE.format(srr='SRR1')}\n")
+    assert is_complete(outdir, "SRR1")
+    log_path.write_text(f"{DONE_LINE.format(srr='SRR1')}\n[INFO] ===== SRR1 =====\n")
+    assert not is_complete(outdir, "SRR1")
+
+
+def test_resume_stage_follows_the_files_on_disk(tmp_path):
+    outdir = make_outdir(tmp_path)
+    stages = pipeline(outdir)
+    run = Run("SRR1", outdir)
+    assert stages.resume_stage(run) == "fetch"
+
+    # Another run's files do not count
+    touch(outdir, "SRR10_1.fastq.gz")
+    assert stages.resume_stage(run) == "fetch"
+
+    touch(outdir, "SRR1_1.fastq.gz", "SRR1_2.fastq")
+    assert stages.resume_stage(run) == "compress"
+
+    (outdir / "fastq" / "SRR1_2.fastq").rename(outdir / "fastq" / "SRR1_2.fastq.gz")
+    assert stages.resume_stage(run) == "cleanup"
+
+    run.staging_dir.mkdir()
+    assert stages.resume_stage(run) == "fetch"
+
+
+def test_compressed_run_without_done_line_only_gets_cleanup(tmp_path):
+    outdir = make_outdir(tmp_path)
+    touch(outdir, "SRR1_1.fastq.gz", "SRR1_2.fastq.gz")
+    (outdir / "logs" / "SRR1.log").write_text("[INFO] FASTQ already exists for SRR1, skipping.\n")
+    (outdir / "sra" / "SRR1").mkdir()
+    (outdir / "sra" / "SRR1" / "SRR1.sra").write_bytes(b"sra")
+    stages = pipeline(outdir, keep_sra=False)
+
+    stages.run(["SRR1"], progress_interval=0)
+
+    assert stages.done == ["SRR1"]
+    assert stages.stats["fetch"].runs == 0
+    assert is_complete(outdir, "SRR1")
+    assert not (outdir / "sra" / "SRR1").exists()
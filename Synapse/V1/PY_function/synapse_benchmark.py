@@ -0,0 +1,981 @@
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+USAGE = (
+    "python synapse_benchmark.py "
+    "--scenario many_small --workers 8 --latency_ms 40 --bandwidth_mbps 50"
+)
+
+FILE_TYPE = "org.sagebionetworks.repo.model.FileEntity"
+FOLDER_TYPE = "org.sagebionetworks.repo.model.Folder"
+PROJECT_TYPE = "org.sagebionetworks.repo.model.Project"
+CHILD_TYPES = {"file": FILE_TYPE, "folder": FOLDER_TYPE}
+
+CHILDREN_PAGE_SIZE = 50
+ZERO_BLOCK = bytes(1024 * 1024)
+
+# How often run_in_child() checks that a phase's process is still alive
+CHILD_POLL_SECONDS = 5.0
+
+SCENARIOS = {
+    # name: (number of files, file size in bytes, folder depth, folder fanout)
+    "many_small": (2000, 32 * 1024, 2, 6),
+    "few_huge": (4, 256 * 1024 * 1024, 1, 1),
+    "deep": (486, 1024 * 1024, 5, 3),
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used for request-rate throttling and for
+    bandwidth limits (one token per byte).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1.0) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    def take(self, amount: float) -> None:
+        """
+        Block until `amount` tokens are available.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 0.25))
+
+
+def zero_md5(size: int, _cache: Dict[int, str] = {}) -> str:
+    """
+    MD5 of `size` zero bytes: the content of every synthetic remote file.
+    """
+    if size not in _cache:
+        digest = hashlib.md5()
+        remaining = size
+        while remaining:
+            block = ZERO_BLOCK[:min(remaining, len(ZERO_BLOCK))]
+            digest.update(block)
+            remaining -= len(block)
+        _cache[size] = digest.hexdigest()
+    return _cache[size]
+
+
+class StandInState:
+    """
+    In-memory Synapse: entities, file handles and the synthetic tree.
+    File contents are never stored; remote files are all zeros and uploads
+    keep only their size and MD5. Only the zips built for bulk downloads
+    are kept, in `blobs`.
+    """
+
+    def __init__(self):
+        self.entities: Dict[str, Dict] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.file_handles: Dict[str, Dict] = {}
+        self.blobs: Dict[str, bytes] = {}
+        self.bulk_jobs: Dict[str, Dict] = {}
+        self._next_id = 1000
+        # Re-entrant: update_entity() allocates a new etag while holding it
+        self._lock = threading.RLock()
+
+    def new_id(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def add_file_handle(self, size: int, md5: str, name: str) -> Dict:
+        handle_id = str(self.new_id())
+        file_handle = {
+            "id": handle_id,
+            "fileName": name,
+            "contentSize": size,
+            "contentMd5": md5,
+            "concreteType": "org.sagebionetworks.repo.model.file.S3FileHandle",
+        }
+        self.file_handles[handle_id] = file_handle
+        return file_handle
+
+    def add_entity(self, name: str, parent_id: Optional[str], concrete_type: str, **fields) -> Dict:
+        entity_id = f"syn{self.new_id()}"
+        entity = {
+            "id": entity_id,
+            "name": name,
+            "parentId": parent_id,
+            "concreteType": concrete_type,
+            "versionNumber": 1,
+            "etag": f"etag-{entity_id}-1",
+            "modifiedOn": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            **fields,
+        }
+        with self._lock:
+            self.entities[entity_id] = entity
+            self.children.setdefault(parent_id, []).append(entity_id)
+        return entity
+
+    def update_entity(self, entity_id: str, changes: Dict) -> Dict:
+        with self._lock:
+            entity = self.entities[entity_id]
+            new_content = changes.get("dataFileHandleId") not in (None, entity.get("dataFileHandleId"))
+            entity.update({key: value for key, value in changes.items() if key not in ("id", "versionNumber", "etag")})
+            if new_content:
+                entity["versionNumber"] += 1
+            entity["etag"] = f"etag-{entity_id}-{self.new_id()}"
+            entity["modifiedOn"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+            return entity
+
+    def bulk_zip(self, requested: List[Dict]) -> Dict:
+        """
+        Package the requested file handles into a deflated zip laid out like
+        Synapse's CommandLineCache format and keep it as a new file handle.
+        Returns the BulkFileDownloadResponse.
+        """
+        buffer = io.BytesIO()
+        summaries = []
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for item in requested:
+                file_handle = self.file_handles.get(str(item.get("fileHandleId")))
+                if file_handle is None:
+                    summaries.append({
+                        "fileHandleId": item.get("fileHandleId"), "status": "FAILURE", "failureMessage": "not found",
+                    })
+                    continue
+                entry = f"{int(file_handle['id']) % 1000}/{file_handle['id']}/{file_handle['fileName']}"
+                with archive.open(entry, "w") as member:
+                    remaining = file_handle["contentSize"]
+                    while remaining:
+                        block = ZERO_BLOCK[:min(remaining, len(ZERO_BLOCK))]
+                        member.write(block)
+                        remaining -= len(block)
+                summaries.append({
+                    "fileHandleId": file_handle["id"],
+                    "associateObjectId": item.get("associateObjectId"),
+                    "status": "SUCCESS",
+                    "zipEntryName": entry,
+                })
+        data = buffer.getvalue()
+        zip_handle = self.add_file_handle(len(data), hashlib.md5(data).hexdigest(), "bulk.zip")
+        with self._lock:
+            self.blobs[zip_handle["id"]] = data
+        return {
+            "concreteType": "org.sagebionetworks.repo.model.file.BulkFileDownloadResponse",
+            "resultZipFileHandleId": zip_handle["id"],
+            "fileSummary": summaries,
+        }
+
+    def child_named(self, parent_id: str, name: str) -> Optional[Dict]:
+        for child_id in self.children.get(parent_id, []):
+            if self.entities[child_id]["name"] == name:
+                return self.entities[child_id]
+        return None
+
+    def build_tree(self, files: int, file_size: int, depth: int, fanout: int) -> str:
+        """
+        Create a project with `depth` levels of `fanout` folders and spread
+        `files` files of `file_size` bytes over the deepest folders.
+        Returns the project ID.
+        """
+        project = self.add_entity("benchmark", None, PROJECT_TYPE)
+        level = [project["id"]]
+        for depth_index in range(depth):
+            next_level = []
+            for parent_id in level:
+                for branch in range(fanout):
+                    folder = self.add_entity(f"level{depth_index}_{branch}", parent_id, FOLDER_TYPE)
+                    next_level.append(folder["id"])
+            level = next_level or level
+        for number in range(files):
+            parent_id = level[number % len(level)]
+            name = f"sample_{number:06d}.bam"
+            file_handle = self.add_file_handle(file_size, zero_md5(file_size), name)
+            self.add_entity(name, parent_id, FILE_TYPE, dataFileHandleId=file_handle["id"])
+        return project["id"]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Implements the slice of the Synapse REST API used by the transfer
+    scripts, with simulated latency, bandwidth limits and throttling.
+    The server instance carries `state`, `latency`, `stream_rate`,
+    `total_bucket` and `request_bucket`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:  # keep benchmark output clean
+        pass
+
+    # -- helpers -----------------------------------------------------------
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self) -> Dict:
+        body = self._read_body()
+        return json.loads(body) if body else {}
+
+    def _admit(self) -> bool:
+        """
+        Apply latency and request throttling; False if a 429 was sent.
+        """
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.request_bucket is not None and not server.request_bucket.try_take():
+            self._read_body()
+            server.throttled += 1
+            self._send_json(429, {"reason": "Too many requests"}, {"Retry-After": "1"})
+            return False
+        return True
+
+    def _not_found(self, what: str) -> None:
+        self._send_json(404, {"reason": f"{what} does not exist"})
+
+    # -- routing -----------------------------------------------------------
+
+    def do_GET(self) -> None:
+        if not self._admit():
+            return
+        path = urlsplit(self.path).path
+        state = self.server.state
+        match = re.fullmatch(r"/repo/v1/entity/(syn\d+)", path)
+        if match:
+            entity = state.entities.get(match.group(1))
+            return self._send_json(200, entity) if entity else self._not_found(match.group(1))
+        match = re.fullmatch(r"/repo/v1/entity/(syn\d+)/version/(\d+)", path)
+        if match:
+            # Only the current version is kept
+            entity = state.entities.get(match.group(1))
+            if not entity or entity["versionNumber"] != int(match.group(2)):
+                return self._not_found(path)
+            return self._send_json(200, entity)
+        match = re.fullmatch(r"/repo/v1/entity/(syn\d+)/annotations2", path)
+        if match:
+            entity = state.entities.get(match.group(1))
+            if not entity:
+                return self._not_found(match.group(1))
+            return self._send_json(200, {
+                "id": entity["id"], "etag": entity["etag"], "annotations": entity.get("annotations", {}),
+            })
+        match = re.fullmatch(r"/data/(\d+)", path)
+        if match:
+            return self._send_data(match.group(1))
+        match = re.fullmatch(r"/file/v1/fileHandle/(\d+)/url", path)
+        if match:
+            return self._send_json(200, f"http://{self.headers.get('Host')}/data/{match.group(1)}")
+        match = re.fullmatch(r"/file/v1/file/bulk/async/get/(\d+)", path)
+        if match:
+            job = state.bulk_jobs.get(match.group(1))
+            return self._send_json(200, job) if job else self._not_found(match.group(1))
+        self._not_found(path)
+
+    def do_POST(self) -> None:
+        if not self._admit():
+            return
+        path = urlsplit(self.path).path
+        state = self.server.state
+        if path == "/repo/v1/entity/children":
+            return self._children(self._json_body())
+        if path == "/repo/v1/entity/header":
+            references = self._json_body().get("references", [])
+            results = []
+            for reference in references:
+                entity = state.entities.get(reference.get("targetId"))
+                if entity:
+                    results.append(self._header(entity))
+            return self._send_json(200, {"results": results, "totalNumberOfResults": len(results)})
+        if path == "/repo/v1/entity/child":
+            body = self._json_body()
+            entity = state.child_named(body.get("parentId"), body.get("entityName"))
+            return self._send_json(200, {"id": entity["id"]}) if entity else self._not_found(body.get("entityName"))
+        if path == "/repo/v1/entity":
+            body = self._json_body()
+            if state.child_named(body.get("parentId"), body.get("name")):
+                return self._send_json(409, {"reason": f"An entity named {body.get('name')} already exists"})
+            fields = {key: value for key, value in body.items() if key not in ("name", "parentId", "concreteType")}
+            entity = state.add_entity(body["name"], body["parentId"], body.get("concreteType", FILE_TYPE), **fields)
+            return self._send_json(201, entity)
+        if path == "/file/v1/fileHandle/batch":
+            return self._file_handle_batch(self._json_body())
+        if path == "/file/v1/upload":
+            return self._receive_upload()
+        if path == "/file/v1/file/bulk/async/start":
+            token = str(state.new_id())
+            state.bulk_jobs[token] = state.bulk_zip(self._json_body().get("requestedFiles", []))
+            return self._send_json(201, {"token": token})
+        self._not_found(path)
+
+    def do_PUT(self) -> None:
+        if not self._admit():
+            return
+        path = urlsplit(self.path).path
+        state = self.server.state
+        match = re.fullmatch(r"/repo/v1/entity/(syn\d+)", path)
+        if match and match.group(1) in state.entities:
+            return self._send_json(200, state.update_entity(match.group(1), self._json_body()))
+        match = re.fullmatch(r"/repo/v1/entity/(syn\d+)/annotations2", path)
+        if match and match.group(1) in state.entities:
+            body = self._json_body()
+            entity = state.update_entity(match.group(1), {"annotations": body.get("annotations", {})})
+            return self._send_json(200, {"id": entity["id"], "etag": entity["etag"], "annotations": entity["annotations"]})
+        self._not_found(path)
+
+    # -- endpoints ---------------------------------------------------------
+
+    @staticmethod
+    def _header(entity: Dict) -> Dict:
+        return {
+            "id": entity["id"],
+            "name": entity["name"],
+            "type": entity["concreteType"],
+            "versionNumber": entity["versionNumber"],
+            "modifiedOn": entity["modifiedOn"],
+        }
+
+    def _children(self, body: Dict) -> None:
+        state = self.server.state
+        all_ids = state.children.get(body.get("parentId"), [])
+        types = {CHILD_TYPES[name] for name in body.get("includeTypes") or CHILD_TYPES if name in CHILD_TYPES}
+        child_ids = [child_id for child_id in all_ids if state.entities[child_id]["concreteType"] in types]
+        start = int(body.get("nextPageToken") or 0)
+        page = [self._header(state.entities[child_id]) for child_id in child_ids[start:start + CHILDREN_PAGE_SIZE]]
+        response = {"page": page}
+        if start + CHILDREN_PAGE_SIZE < len(child_ids):
+            response["nextPageToken"] = str(start + CHILDREN_PAGE_SIZE)
+        if body.get("includeSumFileSizes"):
+            response["sumFileSizesBytes"] = sum(
+                state.file_handles[state.entities[child_id]["dataFileHandleId"]]["contentSize"]
+                for child_id in all_ids
+                if state.entities[child_id]["concreteType"] == FILE_TYPE
+            )
+        if body.get("includeTotalChildCount"):
+            response["totalChildCount"] = len(child_ids)
+        self._send_json(200, response)
+
+    def _file_handle_batch(self, body: Dict) -> None:
+        state = self.server.state
+        base = f"http://{self.headers.get('Host')}"
+        results = []
+        for requested in body.get("requestedFiles", []):
+            file_handle = state.file_handles.get(requested.get("fileHandleId"))
+            if file_handle is None:
+                results.append({"fileHandleId": requested.get("fileHandleId"), "failureCode": "NOT_FOUND"})
+                continue
+            result = {"fileHandleId": file_handle["id"]}
+            if body.get("includeFileHandles"):
+                result["fileHandle"] = file_handle
+            if body.get("includePreSignedURLs"):
+                result["preSignedURL"] = f"{base}/data/{file_handle['id']}"
+            results.append(result)
+        self._send_json(200, {"requestedFiles": results})
+
+    def _throttle_bytes(self, nbytes: int) -> None:
+        server = self.server
+        if server.total_bucket is not None:
+            server.total_bucket.take(nbytes)
+        if server.stream_rate:
+            time.sleep(nbytes / server.stream_rate)
+
+    def _send_data(self, handle_id: str) -> None:
+        file_handle = self.server.state.file_handles.get(handle_id)
+        if file_handle is None:
+            return self._not_found(handle_id)
+        blob = self.server.state.blobs.get(handle_id)
+        size = file_handle["contentSize"]
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header.strip())
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+                status = 206
+        length = max(0, end - start + 1)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        position = start
+        remaining = length
+        while remaining:
+            count = min(remaining, len(ZERO_BLOCK))
+            block = blob[position:position + count] if blob is not None else ZERO_BLOCK[:count]
+            self._throttle_bytes(len(block))
+            self.wfile.write(block)
+            position += count
+            remaining -= count
+
+    def _receive_upload(self) -> None:
+        remaining = int(self.headers.get("Content-Length") or 0)
+        size = remaining
+        digest = hashlib.md5()
+        while remaining:
+            block = self.rfile.read(min(remaining, len(ZERO_BLOCK)))
+            if not block:
+                break
+            self._throttle_bytes(len(block))
+            digest.update(block)
+            remaining -= len(block)
+        md5 = digest.hexdigest()
+        claimed = self.headers.get("Content-MD5")
+        if claimed and claimed != md5:
+            return self._send_json(400, {"reason": "MD5 mismatch"})
+        file_handle = self.server.state.add_file_handle(size, md5, self.headers.get("X-File-Name", "upload"))
+        self._send_json(201, file_handle)
+
+
+def start_server(
+    state: StandInState,
+    latency_ms: float = 0.0,
+    bandwidth_mbps: float = 0.0,
+    total_mbps: float = 0.0,
+    throttle_rps: float = 0.0,
+) -> ThreadingHTTPServer:
+    """
+    Serve `state` on a free localhost port from a background thread.
+    bandwidth_mbps limits each transfer stream, total_mbps the whole server,
+    and throttle_rps answers requests beyond that rate with 429.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.state = state
+    server.latency = latency_ms / 1000.0
+    server.stream_rate = bandwidth_mbps * 1024 * 1024 if bandwidth_mbps else 0
+    server.total_bucket = TokenBucket(total_mbps * 1024 * 1024) if total_mbps else None
+    server.request_bucket = TokenBucket(throttle_rps, burst=max(1.0, throttle_rps)) if throttle_rps else None
+    server.throttled = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StandInEntity(dict):
+    """
+    Entity returned by StandInClient.get(): a dict with a `path` attribute,
+    like the synapseclient entities the scripts read.
+    """
+
+    path = None
+
+
+class StandInClient:
+    """
+    Minimal stand-in for synapseclient.Synapse that talks to the stand-in
+    server. It offers the calls the scripts make (get, getChildren,
+    findEntityId, store, restGET/restPOST/restPUT, _waitForAsync) and, like synapseclient,
+    retries throttled (429) and 5xx responses itself.
+    """
+
+    def __init__(self, base_url: str, max_retries: int = 8):
+        self.base_url = base_url.rstrip("/")
+        self.repoEndpoint = f"{self.base_url}/repo/v1"
+        self.fileHandleEndpoint = f"{self.base_url}/file/v1"
+        self.cache = None
+        self.max_threads = 1
+        self.max_retries = max_retries
+        self.requests = 0
+        self.retries = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # -- HTTP --------------------------------------------------------------
+
+    def _connection(self, netloc: str) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if netloc not in connections:
+            connections[netloc] = http.client.HTTPConnection(netloc, timeout=300)
+        return connections[netloc]
+
+    def _request(self, method: str, url: str, body=None, headers: Optional[Dict] = None, stream: bool = False):
+        from synapseclient.core.exceptions import SynapseHTTPError
+
+        parts = urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        for attempt in range(self.max_retries + 1):
+            connection = self._connection(parts.netloc)
+            with self._lock:
+                self.requests += 1
+            if hasattr(body, "seek"):
+                body.seek(0)
+            try:
+                connection.request(method, target, body=body, headers=headers or {})
+                response = connection.getresponse()
+            except (ConnectionError, http.client.HTTPException):
+                connection.close()
+                self._local.connections.pop(parts.netloc, None)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            if response.status == 429 or response.status >= 500:
+                response.read()
+                with self._lock:
+                    self.retries += 1
+                if attempt == self.max_retries:
+                    raise SynapseHTTPError(f"{response.status} Client Error: throttled ({url})")
+                delay = float(response.getheader("Retry-After") or 0.5)
+                time.sleep(delay * (1 + random.random()) * min(2 ** attempt, 8) / 2)
+                continue
+            if response.status >= 400:
+                payload = response.read().decode("utf-8", "replace")
+                raise SynapseHTTPError(f"{response.status} Client Error: {payload}")
+            if stream:
+                return response
+            payload = response.read()
+            return json.loads(payload) if payload else {}
+        raise SynapseHTTPError(f"Request failed: {url}")
+
+    def _endpoint(self, uri: str, endpoint: Optional[str]) -> str:
+        return f"{endpoint or self.repoEndpoint}{uri}"
+
+    def restGET(self, uri: str, endpoint: Optional[str] = None, **kwargs) -> Dict:
+        return self._request("GET", self._endpoint(uri, endpoint))
+
+    def restPOST(self, uri: str, body, endpoint: Optional[str] = None, **kwargs) -> Dict:
+        return self._request("POST", self._endpoint(uri, endpoint), body=body, headers={"Content-Type": "application/json"})
+
+    def restPUT(self, uri: str, body=None, endpoint: Optional[str] = None, **kwargs) -> Dict:
+        return self._request("PUT", self._endpoint(uri, endpoint), body=body, headers={"Content-Type": "application/json"})
+
+    # -- synapseclient-like API ----------------------------------------------
+
+    def _file_handle(self, entity: Dict, with_url: bool = False) -> Dict:
+        body = json.dumps({
+            "requestedFiles": [{
+                "fileHandleId": entity["dataFileHandleId"],
+                "associateObjectId": entity["id"],
+                "associateObjectType": "FileEntity",
+            }],
+            "includeFileHandles": True,
+            "includePreSignedURLs": with_url,
+        })
+        return self.restPOST("/fileHandle/batch", body, endpoint=self.fileHandleEndpoint)["requestedFiles"][0]
+
+    def get(self, entity, downloadFile: bool = True, downloadLocation: Optional[str] = None, **kwargs) -> StandInEntity:
+        entity_id = entity if isinstance(entity, str) else entity["id"]
+        result = StandInEntity(self.restGET(f"/entity/{entity_id}"))
+        if result.get("concreteType") != FILE_TYPE:
+            return result
+        batch = self._file_handle(result, with_url=downloadFile)
+        result["_file_handle"] = batch["fileHandle"]
+        if downloadFile:
+            location = Path(downloadLocation or tempfile.gettempdir())
+            location.mkdir(parents=True, exist_ok=True)
+            target = location / result["name"]
+            self.download_url(batch["preSignedURL"], target)
+            result.path = str(target)
+        return result
+
+    def download_url(self, url: str, destination: Path) -> None:
+        """
+        Stream a (pre-signed) URL to `destination`; replaces
+        synapse_download.fetch_url() in benchmarks.
+        """
+        response = self._request("GET", url, stream=True)
+        with Path(destination).open("wb") as handle:
+            while True:
+                block = response.read(1024 * 1024)
+                if not block:
+                    break
+                handle.write(block)
+
+    def download_range(self, url: str, start: int, end: int, fd: int) -> int:
+        """
+        Fetch bytes start..end of a URL into `fd` at the same offsets;
+        replaces synapse_ranged.fetch_range() in benchmarks.
+        """
+        response = self._request("GET", url, headers={"Range": f"bytes={start}-{end}"}, stream=True)
+        offset = start
+        while True:
+            block = response.read(1024 * 1024)
+            if not block:
+                break
+            os.pwrite(fd, block, offset)
+            offset += len(block)
+        return offset - start
+
+    def _waitForAsync(self, uri: str, request: Dict, endpoint: Optional[str] = None) -> Dict:
+        token = self.restPOST(f"{uri}/start", json.dumps(request), endpoint=endpoint)["token"]
+        return self.restGET(f"{uri}/get/{token}", endpoint=endpoint)
+
+    def getChildren(self, parent, includeTypes=None, **kwargs) -> Iterator[Dict]:
+        parent_id = parent if isinstance(parent, str) else parent["id"]
+        token = None
+        while True:
+            body = {"parentId": parent_id, "includeTypes": includeTypes or ["folder", "file"]}
+            if token:
+                body["nextPageToken"] = token
+            response = self.restPOST("/entity/children", json.dumps(body))
+            yield from response.get("page", [])
+            token = response.get("nextPageToken")
+            if not token:
+                return
+
+    def findEntityId(self, name: str, parent=None) -> Optional[str]:
+        parent_id = parent if isinstance(parent, str) or parent is None else parent["id"]
+        try:
+            return self.restPOST("/entity/child", json.dumps({"parentId": parent_id, "entityName": name}))["id"]
+        except Exception:
+            return None
+
+    def upload_file_handle(self, path: str, md5: Optional[str] = None) -> Dict:
+        size = os.path.getsize(path)
+        with open(path, "rb") as body:
+            headers = {"Content-Length": str(size), "X-File-Name": os.path.basename(path)}
+            if md5:
+                headers["Content-MD5"] = md5
+            return self._request("POST", f"{self.fileHandleEndpoint}/upload", body=body, headers=headers)
+
+    def store(self, entity, **kwargs) -> Dict:
+        properties = dict(getattr(entity, "properties", None) or entity)
+        path = getattr(entity, "path", None)
+        name = properties.get("name") or os.path.basename(path)
+        parent_id = properties.get("parentId") or properties.get("parent")
+        concrete_type = properties.get("concreteType") or (FOLDER_TYPE if path is None and not properties.get("dataFileHandleId") else FILE_TYPE)
+        body = {"name": name, "parentId": parent_id, "concreteType": concrete_type}
+        if concrete_type == FILE_TYPE:
+            if path:
+                body["dataFileHandleId"] = self.upload_file_handle(path)["id"]
+            else:
+                body["dataFileHandleId"] = properties["dataFileHandleId"]
+        annotations = getattr(entity, "annotations", None)
+        if annotations:
+            body["annotations"] = {
+                key: {"type": "STRING", "value": [str(item) for item in (value if isinstance(value, list) else [value])]}
+                for key, value in dict(annotations).items()
+            }
+
+        existing_id = self.findEntityId(name, parent_id)
+        if existing_id:
+            return self.restPUT(f"/entity/{existing_id}", json.dumps(body))
+        return self.restPOST("/entity", json.dumps(body))
+
+
+def standin_upload_file_handle(syn: StandInClient, parent_id: str, path: str, md5: Optional[str] = None, **kwargs) -> Dict:
+    """
+    Replacement for synapseclient's upload_file_handle() in benchmarks.
+    """
+    return syn.upload_file_handle(path, md5)
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process in MB (ru_maxrss is KB on Linux).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def bench_download(
+    base_url: str, root_id: str, workers: int, small_file_bytes: int, large_file_bytes: int, results
+) -> None:
+    """
+    Child process: time a listing of the tree, then a full folder download.
+    """
+    import synapse_download
+    import synapse_ranged
+
+    client = StandInClient(base_url)
+    synapse_download.fetch_url = client.download_url
+    synapse_ranged.fetch_range = client.download_range
+    ranged = synapse_ranged.RangedDownloader(large_file_bytes) if large_file_bytes else None
+    target = Path(tempfile.mkdtemp(prefix="synapse_bench_download_"))
+    try:
+        started = time.monotonic()
+        listed = sum(1 for _ in synapse_download.walk_folder_tree(client, root_id, target, workers))
+        listing_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        counts = synapse_download.download_files_in_folder(
+            client, root_id, target, workers=workers, small_file_bytes=small_file_bytes, ranged=ranged
+        )
+        seconds = time.monotonic() - started
+        nbytes = sum(path.stat().st_size for path in target.rglob("*") if path.is_file())
+        results.put({
+            "phase": "download",
+            "files": counts.get(synapse_download.DOWNLOADED, 0),
+            "failed": counts.get(synapse_download.FAILED, 0),
+            "listed": listed,
+            "bytes": nbytes,
+            "seconds": seconds,
+            "listing_seconds": listing_seconds,
+            "requests": client.requests,
+            "retries": client.retries,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+
+
+def bench_upload(
+    base_url: str, parent_id: str, files: int, file_size: int, workers: int, small_file_bytes: int, results
+) -> None:
+    """
+    Child process: write `files` local files and time uploading them.
+    """
+    import synapse_uploading2
+    from synapse_hashing import FileHasher
+
+    client = StandInClient(base_url)
+    synapse_uploading2.upload_file_handle = standin_upload_file_handle
+    source = Path(tempfile.mkdtemp(prefix="synapse_bench_upload_"))
+    try:
+        rows = []
+        for number in range(files):
+            path = source / f"upload_{number:06d}.bam"
+            with path.open("wb") as handle:
+                remaining = file_size
+                while remaining:
+                    block = ZERO_BLOCK[:min(remaining, len(ZERO_BLOCK))]
+                    handle.write(block)
+                    remaining -= len(block)
+            rows.append({"files": str(path), "assay": "benchmark"})
+
+        hasher = FileHasher(max(1, workers // 2))
+        started = time.monotonic()
+        try:
+            counts = synapse_uploading2.upload_files(
+                client,
+                parent_id,
+                rows,
+                workers,
+                hasher=hasher,
+                small_file_bytes=small_file_bytes,
+                small_workers=4 * workers,
+            )
+        finally:
+            hasher.close()
+        seconds = time.monotonic() - started
+        results.put({
+            "phase": "upload",
+            "files": counts.get(synapse_uploading2.UPLOADED, 0),
+            "failed": counts.get(synapse_uploading2.FAILED, 0),
+            "listed": 0,
+            "bytes": files * file_size,
+            "seconds": seconds,
+            "listing_seconds": 0.0,
+            "requests": client.requests,
+            "retries": client.retries,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+    finally:
+        shutil.rmtree(source, ignore_errors=True)
+
+
+def _child_main(target, quiet: bool, *args) -> None:
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    target(*args)
+
+
+def run_in_child(target, quiet: bool, *args) -> Dict:
+    """
+    Run one benchmark phase in a fresh interpreter so its peak RSS is its own.
+    The scripts' per-file output is discarded when `quiet` is set.
+    A child that dies without a result (an exception, an OOM kill) stops
+    the benchmark with its exit code instead of leaving it waiting.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_child_main, args=(target, quiet, *args, results))
+    process.start()
+    try:
+        while True:
+            try:
+                result = results.get(timeout=CHILD_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+            # The child may have put its result just before exiting
+            try:
+                result = results.get(timeout=CHILD_POLL_SECONDS)
+                break
+            except queue.Empty:
+                process.join()
+                raise SystemExit(
+                    f"Benchmark phase '{target.__name__}' failed: child exited with code {process.exitcode}"
+                )
+    finally:
+        if process.is_alive():
+            process.join(CHILD_POLL_SECONDS)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    return result
+
+
+def run_scenario(name: str, args: argparse.Namespace) -> List[Dict]:
+    files, file_size, depth, fanout = SCENARIOS[name]
+    files = args.files or files
+    file_size = int(args.file_size_mb * 1024 * 1024) if args.file_size_mb else file_size
+    depth = args.depth if args.depth is not None else depth
+    fanout = args.fanout or fanout
+    small_file_bytes = int(args.small_file_mb * 1024 * 1024)
+    large_file_bytes = int(args.large_file_mb * 1024 * 1024)
+
+    state = StandInState()
+    root_id = state.build_tree(files, file_size, depth, fanout)
+    upload_parent = state.add_entity("uploads", None, PROJECT_TYPE)["id"]
+    server = start_server(state, args.latency_ms, args.bandwidth_mbps, args.total_mbps, args.throttle_rps)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        phases = []
+        if args.phase in ("download", "both"):
+            phases.append((bench_download, base_url, root_id, args.workers, small_file_bytes, large_file_bytes))
+        if args.phase in ("upload", "both"):
+            phases.append((bench_upload, base_url, upload_parent, files, file_size, args.workers, small_file_bytes))
+        results = []
+        for target, *phase_args in phases:
+            server.throttled = 0
+            result = run_in_child(target, not args.verbose, *phase_args)
+            result["scenario"] = name
+            result["throttled"] = server.throttled
+            results.append(result)
+        return results
+    finally:
+        server.shutdown()
+
+
+def print_results(results: List[Dict]) -> None:
+    print(f"\n📊 Benchmark Results:")
+    header = (
+        f"   {'scenario':<11} {'phase':<9} {'files':>6} {'failed':>6} {'MB':>9} {'sec':>8} "
+        f"{'files/s':>9} {'MB/s':>8} {'list s':>7} {'RSS MB':>7} {'req':>7} {'429s':>5}"
+    )
+    print(header)
+    for result in results:
+        megabytes = result["bytes"] / (1024 * 1024)
+        seconds = max(result["seconds"], 1e-9)
+        print(
+            f"   {result['scenario']:<11} {result['phase']:<9} {result['files']:>6} {result['failed']:>6} "
+            f"{megabytes:>9.1f} {seconds:>8.2f} {result['files'] / seconds:>9.1f} {megabytes / seconds:>8.1f} "
+            f"{result['listing_seconds']:>7.2f} {result['peak_rss_mb']:>7.1f} {result['requests']:>7} "
+            f"{result['throttled']:>5}"
+        )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark synapse_download.py and synapse_uploading2.py offline against a local "
+            "Synapse stand-in server with simulated latency, bandwidth and throttling."
+        ),
+        epilog=f"Example:\n  {USAGE}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--scenario",
+        choices=sorted(SCENARIOS) + ["all"],
+        default="all",
+        help="Synthetic tree: many_small, few_huge, deep, or all (default).",
+    )
+    parser.add_argument(
+        "--phase",
+        choices=["download", "upload", "both"],
+        default="both",
+        help="Which transfers to benchmark (default: both).",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent transfers (default: 4).")
+    parser.add_argument("--files", type=int, default=0, help="Override the scenario's number of files.")
+    parser.add_argument("--file_size_mb", type=float, default=0, help="Override the scenario's file size in MB.")
+    parser.add_argument("--depth", type=int, default=None, help="Override the scenario's folder depth.")
+    parser.add_argument("--fanout", type=int, default=0, help="Override the scenario's folders per level.")
+    parser.add_argument("--latency_ms", type=float, default=20.0, help="Added latency per request (default: 20).")
+    parser.add_argument(
+        "--bandwidth_mbps", type=float, default=0, help="Per-stream bandwidth limit in MB/s (default: unlimited)."
+    )
+    parser.add_argument(
+        "--total_mbps", type=float, default=0, help="Server-wide bandwidth limit in MB/s (default: unlimited)."
+    )
+    parser.add_argument(
+        "--throttle_rps", type=float, default=0, help="Answer requests beyond this rate with 429 (default: off)."
+    )
+    parser.add_argument(
+        "--small_file_mb",
+        type=float,
+        default=8,
+        help="Small-file threshold, as in the scripts: bulk zip downloads and the upload lane; 0 disables (default: 8).",
+    )
+    parser.add_argument(
+        "--large_file_mb",
+        type=float,
+        default=128,
+        help="Files from this size are downloaded over concurrent range requests; 0 disables (default: 128).",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the scripts' per-file output.")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the results to this JSON file.")
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    scenarios = sorted(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in scenarios:
+        print(f"Running scenario '{name}'...", flush=True)
+        results.extend(run_scenario(name, args))
+
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import errno
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from synapse_metrics import format_size
+
+MANAGED_CACHE_DIRNAME = "managed"
+LOCK_FILENAME = ".lock"
+
+# Temporary files older than this are leftovers of killed jobs
+STALE_TEMP_SECONDS = 24 * 3600
+
+
+class ManagedCache:
+    """
+    Size-capped, content-addressed file cache shared by download jobs.
+
+    Objects are stored under objects/<md5[:2]>/<md5>, next to a small
+    <md5>.meta file holding the object's size and mtime; the meta file's own
+    mtime is the object's last use, so LRU order never requires touching the
+    cached file itself (which may be hard-linked to a user's copy).
+
+    A finished download is hard-linked into the cache, which costs no space
+    while the downloaded copy exists. Only objects the cache alone holds
+    (link count 1) count towards `max_bytes`; trim() removes the least
+    recently used of those until the cache fits. A later download of the
+    same content, from any entity or project, is linked or copied from the
+    cache instead of fetched. Jobs on several hosts coordinate through POSIX
+    locks on a lock file: lookups share it, trimming takes it exclusively.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root).expanduser()
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self.hits = 0
+        self.hit_bytes = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self._stats_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        with open(self.root / LOCK_FILENAME, "a+") as handle:
+            fcntl.lockf(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.lockf(handle, fcntl.LOCK_UN)
+
+    def _paths(self, md5: str) -> Tuple[Path, Path]:
+        obj = self.objects / md5[:2] / md5
+        return obj, obj.with_name(md5 + ".meta")
+
+    def _count(self, **increments) -> None:
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def _lookup(self, md5: str, size: int) -> Tuple[Optional[os.stat_result], bool]:
+        """
+        (stat of the cached object, True if it is intact). The stat is None
+        when there is no object; an object whose size or mtime no longer
+        matches its meta file (its linked copy was modified in place) is not
+        intact.
+        """
+        obj, meta = self._paths(md5)
+        try:
+            stat = obj.stat()
+            info = json.loads(meta.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None, False
+        intact = stat.st_size == int(size) and (stat.st_size, stat.st_mtime_ns) == (info.get("size"), info.get("mtime_ns"))
+        return stat, intact
+
+    def contains(self, md5: str, size: int) -> bool:
+        """
+        True if fetch() would be a hit; nothing is linked or counted.
+        """
+        return self._lookup(md5, size)[1]
+
+    def fetch(self, md5: str, size: int, target: Path) -> bool:
+        """
+        Put the cached object with this MD5 at `target`, hard-linked when
+        possible and copied otherwise. Returns False on a miss; an object
+        that is no longer intact is dropped and counted as a miss.
+        """
+        obj, meta = self._paths(md5)
+        with self._locked(exclusive=False):
+            stat, intact = self._lookup(md5, size)
+            if not intact:
+                if stat is not None:
+                    self._discard(obj, meta)
+                self._count(misses=1)
+                return False
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temp = target.with_name(f".{target.name}.cache")
+            try:
+                os.link(obj, temp)
+            except OSError as exc:
+                if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                shutil.copyfile(obj, temp)
+            os.replace(temp, target)
+            os.utime(meta)
+        self._count(hits=1, hit_bytes=stat.st_size)
+        return True
+
+    def store(self, path: Path, md5: str) -> bool:
+        """
+        Hard-link a downloaded file into the cache under its MD5.
+        Files on another filesystem are not copied in; returns False then.
+        The meta file is written once the object is in place, so a lookup
+        never finds meta for a missing or half-replaced object.
+        """
+        obj, meta = self._paths(md5)
+        tag = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._locked(exclusive=False):
+            if obj.exists() and meta.exists():
+                os.utime(meta)
+                return True
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            temp = obj.with_name(f".{md5}.{tag}")
+            try:
+                os.link(path, temp)
+            except OSError:
+                return False
+            stat = temp.stat()
+            os.replace(temp, obj)
+            meta_temp = meta.with_name(f".{meta.name}.{tag}")
+            meta_temp.write_text(json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}), encoding="utf-8")
+            os.replace(meta_temp, meta)
+        self._count(stored=1)
+        return True
+
+    def drop(self, md5: str) -> None:
+        """
+        Remove the object with this MD5, e.g. after its content was found
+        not to match.
+        """
+        with self._locked(exclusive=True):
+            self._discard(*self._paths(md5))
+
+    def _discard(self, obj: Path, meta: Path) -> None:
+        for path in (obj, meta):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _entries(self) -> List[Tuple[float, int, bool, Path, Path]]:
+        """
+        (last use, size, owned by the cache alone, object, meta) for every
+        object; orphaned files and stale temporaries are removed on the way.
+        """
+        entries = []
+        now = time.time()
+        for bucket in self.objects.iterdir():
+            if not bucket.is_dir():
+                continue
+            for path in bucket.iterdir():
+                name = path.name
+                if name.endswith(".tmp"):
+                    try:
+                        if now - path.stat().st_mtime > STALE_TEMP_SECONDS:
+                            path.unlink()
+                    except OSError:
+                        pass
+                    continue
+                if name.endswith(".meta"):
+                    continue
+                obj, meta = self._paths(name)
+                try:
+                    stat = obj.stat()
+                    last_used = meta.stat().st_mtime
+                except OSError:
+                    self._discard(obj, meta)
+                    continue
+                entries.append((last_used, stat.st_size, stat.st_nlink == 1, obj, meta))
+        return entries
+
+    def usage(self) -> Tuple[int, int]:
+        """
+        (bytes held only by the cache, number of objects).
+        """
+        with self._locked(exclusive=True):
+            entries = self._entries()
+        return sum(size for _, size, owned, _, _ in entries if owned), len(entries)
+
+    def trim(self) -> int:
+        """
+        Evict least recently used objects held only by the cache until they
+        fit in max_bytes. Returns the number of bytes freed.
+        """
+        with self._locked(exclusive=True):
+            entries = self._entries()
+            owned = sorted(entry for entry in entries if entry[2])
+            total = sum(size for _, size, _, _, _ in owned)
+            freed = 0
+            for _, size, _, obj, meta in owned:
+                if total - freed <= self.max_bytes:
+                    break
+                self._discard(obj, meta)
+                freed += size
+                self._count(evicted=1, evicted_bytes=size)
+        return freed
+
+    def summary(self) -> str:
+        return (
+            f"{self.hits} hits ({format_size(self.hit_bytes)} served locally), {self.misses} misses, "
+            f"{self.stored} stored, {self.evicted} evicted ({format_size(self.evicted_bytes)})"
+        )
+
+
+def default_cache_root() -> Path:
+    """
+    The managed cache lives inside SYNAPSE_CACHE_FOLDER, which the LSF
+    wrappers point at shared storage, so every job shares it.
+    """
+    cache_dir = os.environ.get("SYNAPSE_CACHE_FOLDER", "/tmp/.synapseCache")
+    return Path(cache_dir) / MANAGED_CACHE_DIRNAME
+
+
+def open_cache(root: Optional[Path], max_gb: float, enabled: bool = True) -> Optional[ManagedCache]:
+    """
+    Open the managed cache at `root` (default: default_cache_root()), capped
+    at `max_gb`. Returns None when the cache is disabled.
+    """
+    if not enabled:
+        return None
+    cache = ManagedCache(root or default_cache_root(), int(max_gb * 1024 ** 3))
+    print(f"Managed cache: {cache.root} (cap {format_size(cache.max_bytes)})")
+    return cache
@@ -1,19 +1,60 @@
 import argparse
-import csv
+import errno
+import hashlib
+import json
+import os
+import queue
+import re
+import shutil
 import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 
 from synapseclient import Synapse
 from synapseclient.core.exceptions import SynapseError
 
+from synapse_cache import ManagedCache, open_cache
+from synapse_entities import is_file_type, is_folder_type
+from synapse_hashing import md5_file
+from synapse_ledger import TransferLedger, open_ledger
+from synapse_manifest import chunked, iter_manifest_rows, open_manifest
+from synapse_metrics import Transfer, TransferMetrics, format_size
+from synapse_plan import CONFLICT, DOWNLOAD, INVALID, SKIP, TransferPlan
+from synapse_ranged import RANGE_CHUNK_BYTES, RANGE_STREAMS, RangedDownloader, open_ranged, presigned_url
+from synapse_retry import RetryPolicy, build_retry_policy, call_with_retry, pool_size
+from synapse_snapshot import CHANGED, NEW, UNCHANGED, RemoteSnapshot, open_snapshot
+from synapse_verify import REPORT_FILENAME, downloaded_files, fetch_remote_content, print_summary, requeue, verify_files, write_report
+
 USAGE = (
     "python synapse_download.py "
     "--authToken synapse_token.txt "
     "--file_path files_to_download.csv "
-    "--output_dir /path/to/download/directory"
+    "--output_dir /path/to/download/directory "
+    "--workers 4"
 )
 
+# Outcome of a single file transfer
+DOWNLOADED = "downloaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# Worker threads print through log() so their lines never interleave
+_print_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    """
+    Print one progress line, flushed, without interleaving with other threads.
+    """
+    with _print_lock:
+        print(message, flush=True)
+
 
 def synapse_login(token_file_path: Path) -> Synapse:
     """
@@ -42,15 +83,16 @@ def synapse_login(token_file_path: Path) -> Synapse:
     return syn
 
 
-def load_file_list(csv_path: Path) -> List[Dict[str, str]]:
+def iter_file_list(csv_path: Path) -> Iterator[Dict[str, str]]:
     """
-    Load a CSV that contains 'synapse_id' and 'save_path' columns.
-    Returns a list of dicts, one per row.
+    Stream a manifest that contains 'synapse_id' and 'save_path' columns,
+    yielding one dict per row without loading the whole file.
+    CSV and TSV (.tsv) manifests are accepted, optionally gzip-compressed (.gz).
     """
     csv_file = csv_path.expanduser()
     try:
-        with csv_file.open(newline="", encoding="utf-8") as handle:
-            reader = csv.DictReader(handle)
+        with open_manifest(csv_file) as handle:
+            reader = iter_manifest_rows(handle, csv_file)
             if reader.fieldnames is None:
                 raise SystemExit("CSV file must contain a header row with 'synapse_id' and 'save_path' columns.")
 
@@ -60,10 +102,9 @@ def load_file_list(csv_path: Path) -> List[Dict[str, str]]:
             if "save_path" not in reader.fieldnames:
                 raise SystemExit("CSV file must contain a 'save_path' column.")
 
-            rows = []
             for row in reader:
-                synapse_id = row.get("synapse_id", "").strip()
-                save_path = row.get("save_path", "").strip()
+                synapse_id = (row.get("synapse_id") or "").strip()
+                save_path = (row.get("save_path") or "").strip()
                 
                 if not synapse_id:
                     continue
@@ -72,178 +113,1151 @@ def load_file_list(csv_path: Path) -> List[Dict[str, str]]:
                 row["synapse_id"] = synapse_id
                 # Map save_path to local_path for compatibility with download_files
                 row["local_path"] = save_path
-                rows.append(row)
-            return rows
+                yield row
     except OSError as exc:
         raise SystemExit(f"Unable to read CSV file '{csv_file}': {exc}") from exc
 
 
-def check_synapse_id(syn: Synapse, entity_id: str) -> Dict:
+SYNAPSE_ID_PATTERN = re.compile(r"^syn\d+$", re.IGNORECASE)
+
+
+class SynapseIdValidator:
+    """
+    Resolve Synapse IDs to entity headers in bulk for the download pre-flight.
+    IDs are sent in batches to POST /entity/header, with several batches in
+    flight at once. Synapse leaves IDs that do not exist or are not
+    accessible out of a batch response, so those are recorded as invalid
+    without a separate call. Headers are cached (up to `cache_limit`, least
+    recently used first out) so duplicate IDs are resolved only once.
+    Transient failures of a batch are retried under `retry` before the
+    batch is split up.
+    """
+
+    def __init__(
+        self,
+        syn: Synapse,
+        workers: int = 4,
+        batch_size: int = 100,
+        cache_limit: int = 100000,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.syn = syn
+        self.retry = retry
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.cache_limit = cache_limit
+        self.invalid: Dict[str, str] = {}
+        self._headers: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, synapse_id: str, header: Dict) -> None:
+        with self._lock:
+            self._headers[synapse_id] = header
+            self._headers.move_to_end(synapse_id)
+            while len(self._headers) > self.cache_limit:
+                self._headers.popitem(last=False)
+
+    def _fetch_batch(self, batch: List[str]) -> None:
+        body = json.dumps({"references": [{"targetId": synapse_id} for synapse_id in batch]})
+        try:
+            response = call_with_retry(self.retry, "entity headers", self.syn.restPOST, "/entity/header", body=body)
+        except Exception as exc:
+            if len(batch) > 1:
+                # One bad reference can fail the whole batch; retry one by one
+                for synapse_id in batch:
+                    self._fetch_batch([synapse_id])
+            else:
+                self.invalid[batch[0]] = f"cannot be accessed: {exc}"
+            return
+
+        found = set()
+        for header in response.get("results", []):
+            found.add(header["id"])
+            self._remember(header["id"], {
+                "name": header.get("name"),
+                "type": header.get("type", ""),
+                "versionNumber": header.get("versionNumber"),
+            })
+        for synapse_id in batch:
+            if synapse_id not in found:
+                self.invalid[synapse_id] = "does not exist or is not accessible"
+
+    def resolve(self, synapse_ids: Iterable[str]) -> None:
+        """
+        Resolve every ID not already cached or known to be invalid.
+        """
+        pending = []
+        seen = set()
+        for synapse_id in synapse_ids:
+            if synapse_id in seen or synapse_id in self.invalid or synapse_id in self._headers:
+                continue
+            seen.add(synapse_id)
+            if not SYNAPSE_ID_PATTERN.match(synapse_id):
+                self.invalid[synapse_id] = "is not a valid Synapse ID"
+                continue
+            pending.append(synapse_id)
+
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        if not batches:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self._fetch_batch, batches))
+
+    def header(self, synapse_id: str) -> Optional[Dict]:
+        """
+        Return the cached header of a valid ID, resolving it if it was evicted.
+        Returns None for an invalid ID.
+        """
+        if synapse_id in self.invalid:
+            return None
+        if synapse_id not in self._headers:
+            self.resolve([synapse_id])
+        return self._headers.get(synapse_id)
+
+
+def report_invalid_ids(invalid: Dict[str, str], report_path: Path, limit: int = 50) -> None:
+    """
+    Print one consolidated report of invalid Synapse IDs and write all of
+    them to a CSV file.
+    """
+    print(f"❌ ERROR: {len(invalid)} Synapse IDs are invalid or not accessible:")
+    for synapse_id, reason in islice(invalid.items(), limit):
+        print(f"   {synapse_id}: {reason}")
+    if len(invalid) > limit:
+        print(f"   ... and {len(invalid) - limit} more")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with report_path.open("w", encoding="utf-8") as handle:
+        handle.write("synapse_id,reason\n")
+        for synapse_id, reason in invalid.items():
+            handle.write(f"{synapse_id},{reason}\n")
+    print(f"   Full list written to {report_path}")
+    print("   Please check:")
+    print("   1. The Synapse IDs are correct")
+    print("   2. You have access to these entities")
+    print("   3. The entities are not private or restricted")
+
+
+def validate_manifest(
+    syn: Synapse, csv_path: Path, workers: int, chunk_size: int, retry: Optional[RetryPolicy] = None
+) -> SynapseIdValidator:
+    """
+    Pre-flight check of every Synapse ID in the manifest, streamed in chunks.
+    Returns the validator holding the cached headers and the invalid IDs.
+    """
+    started = time.time()
+    validator = SynapseIdValidator(syn, workers, retry=retry)
+    total_rows = 0
+    for chunk in chunked(iter_file_list(csv_path), chunk_size):
+        total_rows += len(chunk)
+        validator.resolve(row["synapse_id"] for row in chunk)
+    print(
+        f"Validated {total_rows} rows ({len(validator.invalid)} invalid IDs) "
+        f"in {time.time() - started:.1f}s"
+    )
+    return validator
+
+
+# How a downloaded file was put at its target path
+RENAMED = "renamed"
+LINKED = "linked"
+COPIED = "copied"
+
+
+class PlacementStats:
     """
-    Check if a Synapse ID exists and return entity information.
-    Raises SystemExit if the ID doesn't exist.
+    Thread-safe byte counters for place_file(), reported in the summary.
     """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes = {RENAMED: 0, LINKED: 0, COPIED: 0}
+
+    def record(self, mode: str, nbytes: int) -> None:
+        with self._lock:
+            self.bytes[mode] += nbytes
+
+    def reset(self) -> None:
+        with self._lock:
+            self.bytes = {RENAMED: 0, LINKED: 0, COPIED: 0}
+
+    def summary(self) -> str:
+        return (
+            f"{format_size(self.bytes[RENAMED])} renamed, "
+            f"{format_size(self.bytes[LINKED])} hard-linked, "
+            f"{format_size(self.bytes[COPIED])} copied"
+        )
+
+
+PLACEMENT = PlacementStats()
+
+
+def is_within(path: Path, directory: Optional[Path]) -> bool:
+    """
+    True if `path` lies inside `directory`.
+    """
+    if directory is None:
+        return False
     try:
-        print(f"Checking Synapse ID: {entity_id}")
-        entity = syn.get(entity_id, downloadFile=False)
-        
-        # Print entity information
-        print(f"✅ SUCCESS: Synapse ID '{entity_id}' exists")
-        print(f"   Name: {entity.get('name', 'Unknown')}")
-        print(f"   Type: {entity.get('concreteType', 'Unknown')}")
-        
-        # Try to get description if available
-        description = entity.get('description', '')
-        if description:
-            print(f"   Description: {description}")
-        else:
-            print("   Description: No description available")
-            
-        print("")
-        return entity
-        
-    except SynapseError as exc:
-        error_msg = str(exc)
-        if "404" in error_msg or "does not exist" in error_msg.lower():
-            print(f"❌ ERROR: Synapse ID '{entity_id}' does not exist or is not accessible")
-            print("   Please check:")
-            print("   1. The Synapse ID is correct")
-            print("   2. You have access to this entity")
-            print("   3. The entity is not private or restricted")
-            raise SystemExit(f"Pipeline stopped: Invalid Synapse ID '{entity_id}'") from exc
+        path.relative_to(directory)
+        return True
+    except ValueError:
+        return False
+
+
+def place_file(source: Path, target: Path, cache_dir: Optional[Path] = None) -> str:
+    """
+    Put a downloaded file at `target` without duplicating its bytes when possible.
+    Files inside the Synapse cache are hard-linked, so the cache keeps its copy;
+    any other file is moved with an atomic rename. Only when source and target
+    are on different filesystems are the bytes copied, streamed into a
+    temporary file beside the target that is then renamed into place.
+    Returns RENAMED, LINKED or COPIED.
+    """
+    nbytes = source.stat().st_size
+    from_cache = is_within(source, cache_dir)
+    try:
+        if from_cache:
+            if target.exists():
+                target.unlink()
+            os.link(source, target)
+            mode = LINKED
         else:
-            print(f"❌ ERROR: Failed to access Synapse ID '{entity_id}': {error_msg}")
-            raise SystemExit(f"Pipeline stopped: Cannot access Synapse ID '{entity_id}'") from exc
+            os.replace(source, target)
+            mode = RENAMED
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            raise
+        partial = target.with_name(f".{target.name}.part")
+        with source.open("rb") as src, partial.open("wb") as dst:
+            shutil.copyfileobj(src, dst, 16 * 1024 * 1024)
+        shutil.copystat(source, partial)
+        os.replace(partial, target)
+        if not from_cache:
+            source.unlink()
+        mode = COPIED
+
+    PLACEMENT.record(mode, nbytes)
+    return mode
 
 
-def download_single_file(syn: Synapse, synapse_id: str, save_path: str, overwrite: bool = False) -> bool:
+def synapse_cache_dir(syn: Synapse) -> Optional[Path]:
     """
-    Download a single file from Synapse to the specified save path.
-    save_path must be a complete file path (including filename).
-    Returns True if successful, False otherwise.
+    Root directory of the client's file cache, if it has one.
     """
-    import shutil
+    cache_root = getattr(getattr(syn, "cache", None), "cache_root_dir", None)
+    return Path(cache_root).expanduser().resolve() if cache_root else None
 
-    output_path = Path(save_path).expanduser().resolve()
 
-    if output_path.exists() and not overwrite:
-        print(f"⏭️  SKIPPED: '{output_path}' already exists", flush=True)
-        return False
+def prepare_download(
+    output_path: Path,
+    synapse_id: str,
+    transfer: Transfer,
+    overwrite: bool = False,
+    ledger: Optional[TransferLedger] = None,
+    version: Optional[int] = None,
+    cache: Optional[ManagedCache] = None,
+    md5: Optional[str] = None,
+    size: Optional[int] = None,
+) -> Optional[str]:
+    """
+    The local part of a download. Returns SKIPPED when the ledger has
+    verified the target or it already exists, DOWNLOADED when the managed
+    cache served it, and None when the file must be fetched; a target left
+    behind by an interrupted transfer is removed first.
+    """
+    if ledger is not None and not overwrite and ledger.is_verified("download", synapse_id, str(output_path), version):
+        log(f"⏭️  SKIPPED: '{output_path}' already downloaded (ledger)")
+        return transfer.finish(SKIPPED, output_path.stat().st_size)
+
+    stale = (
+        ledger is not None
+        and output_path.exists()
+        and ledger.is_stale("download", synapse_id, str(output_path), version)
+    )
+    if output_path.exists() and not overwrite and not stale:
+        log(f"⏭️  SKIPPED: '{output_path}' already exists")
+        return transfer.finish(SKIPPED, output_path.stat().st_size)
 
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    if stale:
+        log(f"🔁 RESUMING: '{output_path}' is incomplete or out of date; downloading again")
+        output_path.unlink()
+    if ledger is not None:
+        ledger.start("download", synapse_id, str(output_path), version)
+
+    if cache is not None and md5 and size is not None:
+        with transfer.phase("cache"):
+            hit = cache.fetch(md5, size, output_path)
+        if hit:
+            if ledger is not None:
+                ledger.finish("download", synapse_id, str(output_path), entity_id=synapse_id, version=version, md5=md5)
+            log(f"✅ DOWNLOADED (cache hit): '{output_path}'")
+            return transfer.finish(DOWNLOADED, size)
+    return None
+
+
+def finish_download(
+    synapse_id: str,
+    output_path: Path,
+    transfer: Transfer,
+    ledger: Optional[TransferLedger] = None,
+    version: Optional[int] = None,
+    md5: Optional[str] = None,
+    cache: Optional[ManagedCache] = None,
+    note: str = "",
+) -> str:
+    """
+    Record a file fetched from Synapse: add it to the cache, mark it
+    verified in the ledger and report it. Returns DOWNLOADED.
+    """
+    if cache is not None and md5:
+        cache.store(output_path, md5)
+    if ledger is not None:
+        ledger.finish("download", synapse_id, str(output_path), entity_id=synapse_id, version=version, md5=md5)
+    log(f"✅ DOWNLOADED{note}: '{output_path}'")
+    return transfer.finish(DOWNLOADED, output_path.stat().st_size, moved=True)
+
+
+def fail_download(
+    synapse_id: str, output_path: Path, transfer: Transfer, exc: Exception, ledger: Optional[TransferLedger] = None
+) -> str:
+    log(f"❌ FAILED: Could not download '{synapse_id}': {exc}")
+    if ledger is not None:
+        ledger.fail("download", synapse_id, str(output_path))
+    return transfer.finish(FAILED, error=str(exc))
 
+
+def fetch_file(
+    syn: Synapse,
+    synapse_id: str,
+    output_path: Path,
+    transfer: Transfer,
+    ledger: Optional[TransferLedger] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+) -> str:
+    """
+    Fetch one file with syn.get() and put it at `output_path`.
+    Returns DOWNLOADED or FAILED.
+    """
     try:
         # Download to parent directory first
-        entity = syn.get(synapse_id, downloadLocation=str(output_path.parent))
+        with transfer.phase("get"):
+            entity = call_with_retry(
+                retry,
+                synapse_id,
+                syn.get,
+                synapse_id,
+                downloadLocation=str(output_path.parent),
+                on_retry=transfer.count_retry,
+            )
         downloaded_path = Path(entity.path).expanduser().resolve()
 
-        # If the downloaded file is not at the target location, copy it
+        # If the downloaded file is not at the target location, move it there
         if downloaded_path != output_path:
             if downloaded_path.exists():
-                shutil.copy2(str(downloaded_path), str(output_path))
-                print(f"✅ DOWNLOADED: '{output_path}'", flush=True)
-                return True
+                with transfer.phase("place"):
+                    place_file(downloaded_path, output_path, synapse_cache_dir(syn))
             else:
-                print(f"❌ FAILED: Downloaded file not found at '{downloaded_path}'", flush=True)
-                return False
-        else:
-            print(f"✅ DOWNLOADED: '{output_path}'", flush=True)
-            return True
+                log(f"❌ FAILED: Downloaded file not found at '{downloaded_path}'")
+                if ledger is not None:
+                    ledger.fail("download", synapse_id, str(output_path))
+                return transfer.finish(FAILED, error=f"downloaded file not found at '{downloaded_path}'")
+
+        file_handle = entity.get('_file_handle') or {}
+        return finish_download(
+            synapse_id, output_path, transfer, ledger, entity.get('versionNumber'), file_handle.get('contentMd5'), cache
+        )
     except Exception as exc:
-        print(f"❌ FAILED: Could not download '{synapse_id}': {exc}", flush=True)
-        return False
+        return fail_download(synapse_id, output_path, transfer, exc, ledger)
+
+
+def fetch_ranged(
+    syn: Synapse,
+    synapse_id: str,
+    output_path: Path,
+    transfer: Transfer,
+    ranged: RangedDownloader,
+    file_handle_id: str,
+    size: int,
+    md5: Optional[str],
+    ledger: Optional[TransferLedger] = None,
+    version: Optional[int] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+) -> str:
+    """
+    Fetch one large file over concurrent range requests (see
+    RangedDownloader). A failed transfer keeps its partial file and chunk
+    sidecar, so the next run resumes it. Returns DOWNLOADED or FAILED.
+    """
+    try:
+        with transfer.phase("ranged"):
+            ranged.download(syn, synapse_id, file_handle_id, size, md5, output_path, retry, transfer.count_retry)
+        return finish_download(synapse_id, output_path, transfer, ledger, version, md5, cache, note=" (ranged)")
+    except Exception as exc:
+        return fail_download(synapse_id, output_path, transfer, exc, ledger)
 
 
-def get_folder_structure(syn: Synapse, folder_id: str, base_path: Optional[Path] = None) -> List[Dict[str, str]]:
+def fetch_handle(syn: Synapse, synapse_id: str, file_handle_id: str, destination: Path, md5: Optional[str]) -> None:
     """
-    Recursively get all files from a Synapse folder and return a list with synapse_id and save_path.
+    Stream the content of a file handle to `destination` from a fresh
+    pre-signed URL and check it against `md5` when one is known.
     """
-    files = []
+    fetch_url(presigned_url(syn, synapse_id, file_handle_id), destination)
+    if md5 and md5_file(str(destination)) != md5:
+        raise ValueError(f"MD5 of the downloaded file does not match Synapse ({md5})")
+
+
+def fetch_direct(
+    syn: Synapse,
+    synapse_id: str,
+    output_path: Path,
+    transfer: Transfer,
+    file_handle_id: str,
+    md5: Optional[str],
+    ledger: Optional[TransferLedger] = None,
+    version: Optional[int] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+) -> str:
+    """
+    Fetch one file whose file handle was already looked up (see
+    probe_file_sizes()), without another entity lookup by syn.get(). The
+    file is written to .<name>.part next to the target and moved into place
+    once complete. Returns DOWNLOADED or FAILED.
+    """
+    partial = output_path.with_name(f".{output_path.name}.part")
     try:
-        children = syn.getChildren(folder_id)
-        
-        for child in children:
-            child_id = child.get('id')
-            child_name = child.get('name', 'Unknown')
-            # Check both 'type' and 'concreteType' fields for compatibility
-            child_type = child.get('type') or child.get('concreteType', 'Unknown')
-            
-            # Check if it's a file (FileEntity)
-            is_file = (
-                child_type == 'org.sagebionetworks.repo.model.FileEntity' or
-                child_type == 'file' or
-                'FileEntity' in str(child_type)
+        with transfer.phase("get"):
+            call_with_retry(
+                retry, synapse_id, fetch_handle, syn, synapse_id, file_handle_id, partial, md5,
+                on_retry=transfer.count_retry,
             )
-            
-            # Check if it's a folder
-            is_folder = (
-                child_type == 'org.sagebionetworks.repo.model.Folder' or
-                child_type == 'folder' or
-                child_type == 'org.sagebionetworks.repo.model.Project' or
-                'Folder' in str(child_type) or
-                'Project' in str(child_type)
+        os.replace(partial, output_path)
+        return finish_download(synapse_id, output_path, transfer, ledger, version, md5, cache)
+    except Exception as exc:
+        partial.unlink(missing_ok=True)
+        return fail_download(synapse_id, output_path, transfer, exc, ledger)
+
+
+def download_single_file(
+    syn: Synapse,
+    synapse_id: str,
+    save_path: str,
+    overwrite: bool = False,
+    ledger: Optional[TransferLedger] = None,
+    version: Optional[int] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+    md5: Optional[str] = None,
+    size: Optional[int] = None,
+    file_handle_id: Optional[str] = None,
+    ranged: Optional[RangedDownloader] = None,
+) -> str:
+    """
+    Download a single file from Synapse to the specified save path.
+    save_path must be a complete file path (including filename).
+    With a ledger, a file it has verified is skipped without contacting
+    Synapse, and a file left behind by an interrupted transfer (or whose
+    remote version changed) is downloaded again.
+    Throttling and transient errors are retried under `retry`.
+    With a managed `cache`, a file whose remote `md5` and `size` are known
+    is served from the cache when it holds that content, and every file
+    downloaded is added to it.
+    A file whose `file_handle_id` and `size` are known and that `ranged`
+    considers large is fetched over several range requests, resumably;
+    any other file with a known `file_handle_id` is fetched by
+    fetch_direct(), and the rest with syn.get().
+    Returns DOWNLOADED, SKIPPED or FAILED.
+    """
+    output_path = Path(save_path).expanduser().resolve()
+    transfer = Transfer(metrics, synapse_id, str(output_path))
+    try:
+        status = prepare_download(output_path, synapse_id, transfer, overwrite, ledger, version, cache, md5, size)
+    except Exception as exc:
+        return fail_download(synapse_id, output_path, transfer, exc, ledger)
+    if status is not None:
+        return status
+    if ranged is not None and ranged.wants(size, file_handle_id):
+        return fetch_ranged(
+            syn, synapse_id, output_path, transfer, ranged, file_handle_id, size, md5, ledger, version, retry, cache
+        )
+    if file_handle_id is not None:
+        return fetch_direct(syn, synapse_id, output_path, transfer, file_handle_id, md5, ledger, version, retry, cache)
+    return fetch_file(syn, synapse_id, output_path, transfer, ledger, retry, cache)
+
+
+# Bulk download of small files: the server packages up to BULK_MAX_FILES
+# file handles into one zip, laid out as <handle id % 1000>/<handle id>/<name>
+BULK_DOWNLOAD_URI = "/file/bulk/async"
+BULK_MAX_FILES = 100
+BULK_REQUEST_TYPE = "org.sagebionetworks.repo.model.file.BulkFileDownloadRequest"
+
+
+def fetch_url(url: str, destination: Path) -> None:
+    """
+    Stream a pre-signed URL to `destination`.
+    """
+    import requests
+
+    with requests.get(url, stream=True, timeout=(30, 300)) as response:
+        response.raise_for_status()
+        with destination.open("wb") as handle:
+            for block in response.iter_content(16 * 1024 * 1024):
+                handle.write(block)
+
+
+def bulk_download_zip(
+    syn: Synapse, file_handles: Dict[str, str], zip_path: Path, retry: Optional[RetryPolicy] = None
+) -> Dict[str, Dict]:
+    """
+    Have Synapse package the given file handles ({file handle ID: entity
+    ID}) into one zip, wait for the job and download the zip to
+    `zip_path`. Returns the job's file summaries keyed by file handle ID.
+    """
+    request = {
+        "concreteType": BULK_REQUEST_TYPE,
+        "requestedFiles": [
+            {"fileHandleId": handle_id, "associateObjectId": synapse_id, "associateObjectType": "FileEntity"}
+            for handle_id, synapse_id in file_handles.items()
+        ],
+        "zipFileFormat": "CommandLineCache",
+    }
+    response = call_with_retry(
+        retry, "bulk download", syn._waitForAsync, uri=BULK_DOWNLOAD_URI, request=request, endpoint=syn.fileHandleEndpoint
+    )
+    zip_handle_id = response["resultZipFileHandleId"]
+    url = call_with_retry(
+        retry,
+        "bulk download",
+        syn.restGET,
+        f"/fileHandle/{zip_handle_id}/url?redirect=false",
+        endpoint=syn.fileHandleEndpoint,
+    )
+    call_with_retry(retry, "bulk download", fetch_url, url, zip_path)
+    return {str(summary.get("fileHandleId")): summary for summary in response.get("fileSummary", [])}
+
+
+def extract_member(archive: zipfile.ZipFile, member: str, target: Path, md5: Optional[str] = None) -> None:
+    """
+    Extract one zip member to `target` through a temporary file beside it,
+    checking its MD5 on the way when one is given.
+    """
+    partial = target.with_name(f".{target.name}.part")
+    digest = hashlib.md5()
+    with archive.open(member) as src, partial.open("wb") as dst:
+        for block in iter(lambda: src.read(1024 * 1024), b""):
+            digest.update(block)
+            dst.write(block)
+    if md5 and digest.hexdigest() != md5:
+        partial.unlink()
+        raise ValueError(f"MD5 mismatch for zip entry '{member}'")
+    os.replace(partial, target)
+
+
+def download_small_batch(
+    syn: Synapse,
+    batch: List[Dict],
+    overwrite: bool = False,
+    ledger: Optional[TransferLedger] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+) -> List[str]:
+    """
+    Download a batch of small files, whose plan entries carry their
+    'file_handle_id', with one bulk request and one zip instead of a
+    syn.get() each. Skip decisions, the cache, the ledger and metrics work
+    per file as in download_single_file(); each file is checked against its
+    MD5 as it is unpacked. Files missing from the zip, and the whole batch
+    if the bulk request fails, fall back to syn.get().
+    Returns the status of every entry.
+    """
+    statuses = []
+    pending = []
+    for file_info in batch:
+        synapse_id = file_info["synapse_id"]
+        output_path = Path(file_info["save_path"]).expanduser().resolve()
+        transfer = Transfer(metrics, synapse_id, str(output_path))
+        try:
+            status = prepare_download(
+                output_path,
+                synapse_id,
+                transfer,
+                overwrite or file_info.get("overwrite", False),
+                ledger,
+                file_info.get("version"),
+                cache,
+                file_info.get("md5"),
+                file_info.get("size"),
             )
-            
-            if is_file:
-                # It's a file
-                if base_path:
-                    save_path = str(base_path / child_name)
-                else:
-                    save_path = child_name
-                files.append({
-                    'synapse_id': child_id,
-                    'save_path': save_path
-                })
-            elif is_folder:
-                # It's a folder, recurse into it
-                if base_path:
-                    subfolder_path = base_path / child_name
+        except Exception as exc:
+            status = fail_download(synapse_id, output_path, transfer, exc, ledger)
+        if status is not None:
+            statuses.append(status)
+        else:
+            pending.append((file_info, output_path, transfer))
+    if not pending:
+        return statuses
+
+    started = time.monotonic()
+    leftovers = []
+    unpacked = set()
+    zip_path = pending[0][1].parent / f".synapse_bulk_{os.getpid()}_{threading.get_ident()}.zip"
+    try:
+        file_handles = {str(file_info["file_handle_id"]): file_info["synapse_id"] for file_info, _, _ in pending}
+        summaries = bulk_download_zip(syn, file_handles, zip_path, retry)
+        with zipfile.ZipFile(zip_path) as archive:
+            for file_info, output_path, transfer in pending:
+                summary = summaries.get(str(file_info["file_handle_id"])) or {}
+                if summary.get("status") != "SUCCESS":
+                    leftovers.append((file_info, output_path, transfer))
+                    continue
+                try:
+                    extract_member(archive, summary["zipEntryName"], output_path, file_info.get("md5"))
+                except Exception as exc:
+                    log(f"⚠️  Warning: Could not unpack '{output_path.name}' from the bulk zip: {exc}")
+                    leftovers.append((file_info, output_path, transfer))
+                    continue
+                statuses.append(finish_download(
+                    file_info["synapse_id"],
+                    output_path,
+                    transfer,
+                    ledger,
+                    file_info.get("version"),
+                    file_info.get("md5"),
+                    cache,
+                    note=" (bulk)",
+                ))
+                unpacked.add(id(transfer))
+    except Exception as exc:
+        log(f"⚠️  Warning: Bulk download of {len(pending)} files failed ({exc}); fetching them one by one")
+        leftovers = [item for item in pending if id(item[2]) not in unpacked]
+    finally:
+        zip_path.unlink(missing_ok=True)
+    if metrics is not None:
+        metrics.emit(
+            "bulk_batch",
+            files=len(pending),
+            fallback=len(leftovers),
+            duration=round(time.monotonic() - started, 3),
+        )
+
+    for file_info, output_path, transfer in leftovers:
+        statuses.append(fetch_file(syn, file_info["synapse_id"], output_path, transfer, ledger, retry, cache))
+    return statuses
+
+
+def probe_file_sizes(
+    syn: Synapse, download_plan: List[Dict], workers: int, retry: Optional[RetryPolicy] = None
+) -> None:
+    """
+    Fill in the 'size' (and the 'md5' and 'file_handle_id' used by the
+    managed cache, bulk, ranged and direct downloads) of every plan entry
+    that does not have a size yet.
+    Entities are looked up `workers` at a time and their file handles come
+    in /fileHandle/batch requests, as for verification, under `retry`.
+    Entries that cannot be resolved keep size None and are simply queued
+    after the files of known size.
+    """
+    pending = [file_info for file_info in download_plan if file_info.get("size") is None]
+    if not pending:
+        return
+    records = [{"synapse_id": file_info["synapse_id"], "version": file_info.get("version")} for file_info in pending]
+    fetch_remote_content(syn, records, workers, retry)
+    for file_info, record in zip(pending, records):
+        if record.get("detail"):
+            continue
+        file_info["size"] = record.get("remote_size")
+        file_info["md5"] = record.get("remote_md5")
+        file_info["file_handle_id"] = record.get("file_handle_id")
+
+
+def download_many(
+    syn: Synapse,
+    download_plan: Iterable[Dict],
+    workers: int = 1,
+    overwrite: bool = False,
+    window: int = 0,
+    ledger: Optional[TransferLedger] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+    small_file_bytes: int = 0,
+    batch_files: int = BULK_MAX_FILES,
+    ranged: Optional[RangedDownloader] = None,
+) -> Dict[str, int]:
+    """
+    Download the files of a plan using a pool of concurrent transfers.
+    Each entry needs 'synapse_id' and 'save_path' (full file path) and may carry
+    a 'size' in bytes, and 'overwrite' to replace that file even when
+    `overwrite` is off. Largest files are queued first so one big BAM does not
+    start last and keep the run going while the other workers sit idle.
+
+    The plan may be a list or a stream such as walk_folder_tree(). It is read
+    `window` entries at a time (all at once when window is 0) and ordered by
+    size within each window; no more than 2 * workers transfers are queued, so
+    a stream is consumed at the pace of the downloads.
+    Entries the ledger has already verified are not probed for their size.
+    Each window is announced to `metrics` so progress and ETA cover it.
+    With a `retry` policy whose adaptive limit may exceed `workers`, the pool
+    is sized to that limit and the policy decides how many run at once.
+    With a managed `cache`, every entry is probed so its MD5 can be looked up.
+    A probed entry carries its file handle, so it is fetched straight from a
+    pre-signed URL without looking the entity up again.
+    Files smaller than `small_file_bytes` are grouped `batch_files` at a time
+    and each group is fetched as one bulk zip by download_small_batch().
+    Files `ranged` considers large are fetched over several range requests.
+    Returns a dict with the number of DOWNLOADED, SKIPPED and FAILED files.
+    """
+    counts = {DOWNLOADED: 0, SKIPPED: 0, FAILED: 0}
+    workers = pool_size(workers, retry)
+    entries = iter(download_plan)
+    exhausted = False
+    pending = deque()
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if not pending and not exhausted:
+                if window:
+                    batch = list(islice(entries, window))
+                    exhausted = len(batch) < window
                 else:
-                    subfolder_path = Path(child_name)
-                subfolder_files = get_folder_structure(syn, child_id, subfolder_path)
-                files.extend(subfolder_files)
-                
-    except SynapseError as exc:
-        print(f"⚠️  Warning: Could not list children of {folder_id}: {exc}")
-    
-    return files
+                    batch = list(entries)
+                    exhausted = True
+                # Sizes only matter for scheduling when several files are in flight;
+                # cache lookups, bulk and ranged downloads need the MD5 and file handle
+                if workers > 1 or cache is not None or small_file_bytes or ranged is not None:
+                    probe_file_sizes(syn, [
+                        file_info for file_info in batch
+                        if ledger is None or not ledger.is_verified(
+                            "download", file_info["synapse_id"], file_info["save_path"], file_info.get("version")
+                        )
+                    ], workers, retry)
+                if metrics is not None:
+                    metrics.expect(len(batch), sum(file_info.get("size") or 0 for file_info in batch))
+                small = []
+                if small_file_bytes:
+                    small = [
+                        file_info for file_info in batch
+                        if file_info.get("file_handle_id")
+                        and file_info.get("size") is not None
+                        and file_info["size"] < small_file_bytes
+                    ]
+                    batched = {id(file_info) for file_info in small}
+                    batch = [file_info for file_info in batch if id(file_info) not in batched]
+                pending.extend(sorted(
+                    batch,
+                    key=lambda file_info: file_info.get("size") if file_info.get("size") is not None else -1,
+                    reverse=True,
+                ))
+                pending.extend(small[i:i + batch_files] for i in range(0, len(small), max(1, batch_files)))
+
+            while pending and len(in_flight) < 2 * workers:
+                file_info = pending.popleft()
+                if isinstance(file_info, list):
+                    future = pool.submit(
+                        download_small_batch, syn, file_info, overwrite, ledger, metrics, retry, cache
+                    )
+                    in_flight[future] = file_info
+                    continue
+                future = pool.submit(
+                    download_single_file,
+                    syn,
+                    file_info["synapse_id"],
+                    file_info["save_path"],
+                    overwrite or file_info.get("overwrite", False),
+                    ledger,
+                    file_info.get("version"),
+                    metrics,
+                    retry,
+                    cache,
+                    file_info.get("md5"),
+                    file_info.get("size"),
+                    file_info.get("file_handle_id"),
+                    ranged,
+                )
+                in_flight[future] = file_info
+
+            if not in_flight:
+                if exhausted and not pending:
+                    break
+                continue
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_info = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    if isinstance(file_info, list):
+                        log(f"❌ FAILED: Could not download a batch of {len(file_info)} small files: {exc}")
+                        result = [FAILED] * len(file_info)
+                    else:
+                        log(f"❌ FAILED: Could not download '{file_info['synapse_id']}': {exc}")
+                        result = FAILED
+                for status in result if isinstance(result, list) else [result]:
+                    counts[status] += 1
+
+    return counts
+
+
+def walk_folder_tree(
+    syn: Synapse, folder_id: str, base_path: Path, workers: int = 4, max_pending: int = 1000
+) -> Iterator[Dict]:
+    """
+    Walk a Synapse folder tree breadth-first and yield one
+    {'synapse_id', 'save_path', 'version'} dict per file.
+    Up to `workers` folders are listed concurrently and files are yielded as
+    soon as their folder has been listed, so downloads can start while the
+    rest of the tree is still being walked. At most `max_pending` file entries
+    are buffered; listing pauses until the consumer catches up.
+    """
+    done_marker = object()
+    folders = queue.Queue()
+    entries = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    state = {"outstanding": 1}
+    state_lock = threading.Lock()
+
+    def emit(item) -> bool:
+        # Block while the consumer is behind, but give up once it has stopped
+        while not stop.is_set():
+            try:
+                entries.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def lister() -> None:
+        while True:
+            item = folders.get()
+            if item is done_marker or stop.is_set():
+                return
+            current_id, current_path = item
+            subfolders = []
+            try:
+                for child in syn.getChildren(current_id):
+                    child_name = child.get('name', 'Unknown')
+                    # Check both 'type' and 'concreteType' fields for compatibility
+                    child_type = child.get('type') or child.get('concreteType', 'Unknown')
+                    if is_file_type(child_type):
+                        file_info = {
+                            'synapse_id': child.get('id'),
+                            'save_path': str(current_path / child_name),
+                            'version': child.get('versionNumber'),
+                        }
+                        if not emit(file_info):
+                            break
+                    elif is_folder_type(child_type):
+                        subfolders.append((child.get('id'), current_path / child_name))
+            except Exception as exc:
+                log(f"⚠️  Warning: Could not list children of {current_id}: {exc}")
+
+            with state_lock:
+                state["outstanding"] += len(subfolders) - 1
+                finished = state["outstanding"] == 0
+            for subfolder in subfolders:
+                folders.put(subfolder)
+            if finished:
+                for _ in range(workers):
+                    folders.put(done_marker)
+                emit(done_marker)
 
+    workers = max(1, workers)
+    folders.put((folder_id, Path(base_path)))
+    threads = [threading.Thread(target=lister, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
 
-def download_files_in_folder(syn: Synapse, synapse_id: str, output_dir: Path, overwrite: bool = False) -> None:
+    try:
+        while True:
+            item = entries.get()
+            if item is done_marker:
+                return
+            yield item
+    finally:
+        stop.set()
+        for _ in threads:
+            folders.put(done_marker)
+
+
+def download_files_in_folder(
+    syn: Synapse,
+    synapse_id: str,
+    output_dir: Path,
+    overwrite: bool = False,
+    workers: int = 1,
+    ledger: Optional[TransferLedger] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+    cache: Optional[ManagedCache] = None,
+    small_file_bytes: int = 0,
+    batch_files: int = BULK_MAX_FILES,
+    ranged: Optional[RangedDownloader] = None,
+    snapshot: Optional[RemoteSnapshot] = None,
+) -> Dict[str, int]:
     """
     Download all files from a Synapse folder to the specified output directory.
-    Recursively downloads all files maintaining the folder structure.
+    Recursively downloads all files maintaining the folder structure, with up
+    to `workers` folders listed and `workers` files in flight at once.
+    With a `snapshot`, the tree is refreshed in the snapshot index instead
+    and only files that are new or changed against the local copy are
+    handed to the downloader; the others count as skipped.
+    Returns the per-status file counts of the folder.
     """
     output_dir = output_dir.expanduser().resolve()
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Get all files in the folder structure
-    download_plan = get_folder_structure(syn, synapse_id, output_dir)
-    
-    if not download_plan:
+    print(f"📁 Downloading files from folder {synapse_id} with {workers} workers...")
+    unchanged = 0
+    if snapshot is not None:
+        snapshot.refresh(syn, synapse_id, workers, retry, printer=log)
+        delta = snapshot.delta(synapse_id, output_dir, ledger)
+        download_plan = delta[NEW] + delta[CHANGED]
+        if overwrite:
+            download_plan += delta[UNCHANGED]
+        else:
+            unchanged = len(delta[UNCHANGED])
+        print(
+            f"🗂️  Delta against {output_dir}: {len(delta[NEW])} new, {len(delta[CHANGED])} changed, "
+            f"{len(delta[UNCHANGED])} unchanged",
+            flush=True,
+        )
+    else:
+        # Files stream in from the tree walker while downloads are running
+        download_plan = walk_folder_tree(syn, synapse_id, output_dir, workers)
+    counts = download_many(
+        syn,
+        download_plan,
+        workers,
+        overwrite,
+        window=max(64, 16 * workers),
+        ledger=ledger,
+        metrics=metrics,
+        retry=retry,
+        cache=cache,
+        small_file_bytes=small_file_bytes,
+        batch_files=batch_files,
+        ranged=ranged,
+    )
+    counts[SKIPPED] += unchanged
+
+    if not sum(counts.values()):
         print(f"⚠️  No files found in folder {synapse_id}", flush=True)
-        return
+        return counts
     
-    # Download each file
-    downloaded_count = 0
-    skipped_count = 0
-    failed_count = 0
+    print(f"\n📊 Folder Download Summary:")
+    print(f"   ✅ Downloaded: {counts[DOWNLOADED]} files")
+    print(f"   ⏭️  Skipped: {counts[SKIPPED]} files")
+    print(f"   ❌ Failed: {counts[FAILED]} files")
+    return counts
+
+
+def resolve_rows(
+    validator: SynapseIdValidator, rows: List[Dict[str, str]], output_dir: Path
+) -> Tuple[List[Dict], List[Tuple[str, Path]], int, int]:
+    """
+    Turn a chunk of manifest rows into download work using the validated
+    entity headers: a plan of single files and a list of (folder_id,
+    target_dir) pairs. Only the fields needed for the transfer are kept, and
+    a row repeating a file target already in the chunk is dropped.
+    Returns (file_plan, folder_plan, rows that cannot be downloaded, duplicate rows).
+    """
+    file_plan = []
+    folder_plan = []
+    unresolved = 0
+    duplicates = 0
+    targets = set()
+    validator.resolve(row["synapse_id"] for row in rows)
+    for row in rows:
+        synapse_id = row["synapse_id"]
+        save_path = row.get("local_path", "") or row.get("save_path", "")
+        entity = validator.header(synapse_id)
+        if entity is None:
+            print(f"⚠️  Warning: Skipping invalid Synapse ID {synapse_id}", flush=True)
+            unresolved += 1
+            continue
+
+        # Determine if entity is a file or folder
+        entity_type = entity.get('type', '')
+        is_folder = entity_type == 'org.sagebionetworks.repo.model.Folder'
+
+        if not save_path:
+            print(f"⚠️  Warning: No save_path specified for {synapse_id}, skipping...", flush=True)
+            unresolved += 1
+            continue
+
+        # Resolve save_path: if relative, make it relative to output_dir; if absolute, use as-is
+        save_path_obj = Path(save_path)
+        if not save_path_obj.is_absolute():
+            # Relative path: resolve relative to output_dir
+            resolved_save_path = (output_dir / save_path_obj).expanduser().resolve()
+        else:
+            # Absolute path: use as-is
+            resolved_save_path = save_path_obj.expanduser().resolve()
 
-   
-    print(f"📁 Downloading {len(download_plan)} files from folder {synapse_id}...")
-    for file_info in download_plan:
-        save_path = file_info["save_path"]
-        if download_single_file(syn, file_info["synapse_id"], save_path, overwrite):
-            downloaded_count += 1
-        elif Path(save_path).exists():
-            skipped_count += 1
+        if is_folder:
+            # save_path is treated as the parent directory where the folder will be created
+            folder_name = entity.get('name') or synapse_id
+            folder_target = (resolved_save_path / folder_name).expanduser().resolve()
+            folder_plan.append((synapse_id, folder_target))
         else:
-            failed_count += 1
-    
-    print(f"\n📊 Folder Download Summary:")
-    print(f"   ✅ Downloaded: {downloaded_count} files")
-    print(f"   ⏭️  Skipped: {skipped_count} files")
-    print(f"   ❌ Failed: {failed_count} files")
+            # save_path is ALWAYS treated as a directory - the file will be saved with its original name
+            file_name = entity.get('name', 'downloaded_file')
+            file_target = (resolved_save_path / file_name).expanduser().resolve()
+            if str(file_target) in targets:
+                print(f"⏭️  SKIPPED: duplicate row for '{file_target}'", flush=True)
+                duplicates += 1
+                continue
+            targets.add(str(file_target))
+            file_plan.append({
+                'synapse_id': synapse_id,
+                'save_path': str(file_target),
+                'version': entity.get('versionNumber'),
+            })
+    return file_plan, folder_plan, unresolved, duplicates
+
+
+def plan_download_action(
+    file_info: Dict,
+    overwrite: bool = False,
+    ledger: Optional[TransferLedger] = None,
+    cache: Optional[ManagedCache] = None,
+) -> Tuple[str, str]:
+    """
+    The action download_single_file() would take for a plan entry, and why,
+    decided from the local file, the ledger and the entry's probed remote
+    size. A local file whose size differs from Synapse is a CONFLICT: a
+    real run keeps it unless --overwrite is given.
+    """
+    output_path = Path(file_info["save_path"])
+    synapse_id = file_info["synapse_id"]
+    version = file_info.get("version")
+    size = file_info.get("size")
+    if ledger is not None and not overwrite and ledger.is_verified("download", synapse_id, str(output_path), version):
+        return SKIP, "verified in ledger"
+    if output_path.exists():
+        if overwrite:
+            return DOWNLOAD, "overwrite"
+        if ledger is not None and ledger.is_stale("download", synapse_id, str(output_path), version):
+            return DOWNLOAD, "incomplete or out of date"
+        if size is not None and output_path.stat().st_size != size:
+            return CONFLICT, "local file differs in size from Synapse; kept (use --overwrite to replace)"
+        return SKIP, "already exists"
+    if cache is not None and file_info.get("md5") and size is not None and cache.contains(file_info["md5"], size):
+        return DOWNLOAD, "served from managed cache"
+    return DOWNLOAD, "not present locally"
+
+
+def plan_downloads(
+    syn: Synapse,
+    validator: SynapseIdValidator,
+    csv_path: Path,
+    output_dir: Path,
+    plan: TransferPlan,
+    workers: int = 1,
+    chunk_size: int = 1000,
+    overwrite: bool = False,
+    ledger: Optional[TransferLedger] = None,
+    cache: Optional[ManagedCache] = None,
+) -> Dict[str, Tuple[int, int]]:
+    """
+    --plan mode: resolve the manifest and walk its folders as a real run
+    would, probe remote sizes `workers` at a time and write the action of
+    every file to `plan`, without downloading anything. Entries the ledger
+    has verified are not probed. Returns the plan's totals per action.
+    """
+    def decide(batch: List[Dict]) -> None:
+        probe_file_sizes(syn, [
+            file_info for file_info in batch
+            if ledger is None or not ledger.is_verified(
+                "download", file_info["synapse_id"], file_info["save_path"], file_info.get("version")
+            )
+        ], workers)
+        for file_info in batch:
+            action, reason = plan_download_action(file_info, overwrite, ledger, cache)
+            size = file_info.get("size")
+            if size is None and action == SKIP:
+                size = os.path.getsize(file_info["save_path"])
+            plan.add(action, file_info["synapse_id"], file_info["save_path"], size, reason)
+
+    for synapse_id, reason in validator.invalid.items():
+        plan.add(INVALID, synapse_id, "", None, reason)
+    for chunk in chunked(iter_file_list(csv_path), chunk_size):
+        file_plan, folder_plan, _, _ = resolve_rows(validator, chunk, output_dir)
+        decide(file_plan)
+        for synapse_id, folder_target in folder_plan:
+            print(f"📁 Walking folder {synapse_id}...", flush=True)
+            for batch in chunked(walk_folder_tree(syn, synapse_id, folder_target, workers), max(64, 16 * workers)):
+                decide(batch)
+    return plan.close()
+
+
+def verify_downloads(
+    syn: Synapse,
+    ledger: TransferLedger,
+    output_dir: Path,
+    workers: int = 4,
+    hash_workers: int = 2,
+    retry: Optional[RetryPolicy] = None,
+    metrics: Optional[TransferMetrics] = None,
+    cache: Optional[ManagedCache] = None,
+    redownload: bool = False,
+    save_roots: Optional[Iterable[Path]] = None,
+) -> Dict[str, int]:
+    """
+    Verify every file the ledger holds as downloaded under `output_dir`,
+    or under one of `save_roots` (absolute save_paths of the manifest),
+    against its Synapse size and MD5 (see synapse_verify.verify_files()) and
+    write the mismatches to <output_dir>/verify_report.csv. With
+    `redownload`, missing and mismatched files are marked failed in the
+    ledger, fetched again without the managed cache (whose copy of a bad
+    file is dropped) and verified once more.
+    Returns the number of files per verification status.
+    """
+    records = downloaded_files(ledger, [output_dir, *(save_roots or [])])
+    print(f"\n🔍 Verifying {len(records)} downloaded files...")
+    counts = verify_files(syn, records, workers, hash_workers, retry, printer=log)
+    if redownload:
+        bad = requeue(ledger, records)
+        if bad:
+            print(f"🔁 Downloading {len(bad)} files again...")
+            if cache is not None:
+                for record in bad:
+                    if record.get("remote_md5"):
+                        cache.drop(record["remote_md5"])
+            download_many(
+                syn,
+                [
+                    {"synapse_id": record["synapse_id"], "save_path": record["local_path"], "version": record["version"]}
+                    for record in bad
+                ],
+                workers,
+                overwrite=True,
+                ledger=ledger,
+                metrics=metrics,
+                retry=retry,
+            )
+            recheck = [
+                {"synapse_id": record["synapse_id"], "local_path": record["local_path"], "version": record["version"]}
+                for record in bad
+            ]
+            verify_files(syn, recheck, workers, hash_workers, retry, printer=log)
+            checked = {record["local_path"]: record for record in recheck}
+            records = [checked.get(record["local_path"], record) for record in records]
+            counts = {}
+            for record in records:
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+    report = output_dir / REPORT_FILENAME
+    if write_report(report, records):
+        print(f"Mismatch report written to {report}")
+    print_summary(counts)
+    return counts
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -264,7 +1278,7 @@ def build_parser() -> argparse.ArgumentParser:
         "--file_path",
         required=True,
         type=Path,
-        help="Path to a CSV file with 'synapse_id' and 'save_path' columns.",
+        help="Path to a CSV/TSV file (optionally .gz) with 'synapse_id' and 'save_path' columns.",
     )
     parser.add_argument(
         "--output_dir",
@@ -277,102 +1291,338 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Overwrite existing files. By default, existing files are skipped.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of files downloaded concurrently (default: 4).",
+    )
+    parser.add_argument(
+        "--ledger",
+        type=Path,
+        default=None,
+        help=(
+            "SQLite transfer ledger used to skip verified files and resume interrupted ones "
+            "(default: <output_dir>/.synapse_ledger.sqlite)."
+        ),
+    )
+    parser.add_argument(
+        "--no_ledger",
+        action="store_true",
+        help="Do not use a transfer ledger; skip decisions rely on existing local paths only.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=1000,
+        help="Manifest rows validated and downloaded per chunk, which bounds memory use (default: 1000).",
+    )
+    parser.add_argument(
+        "--skip_invalid",
+        action="store_true",
+        help="Download the valid IDs even if some are invalid. By default any invalid ID stops the job.",
+    )
+    parser.add_argument(
+        "--event_log",
+        type=Path,
+        default=None,
+        help="Append a JSON-lines event per transfer and phase (timings, bytes, retries, errors) to this file.",
+    )
+    parser.add_argument(
+        "--progress_interval",
+        type=float,
+        default=60,
+        help="Seconds between progress lines with aggregate MB/s and ETA; 0 disables them (default: 60).",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Retries per request on throttling (429), 5xx and connection errors, with jittered backoff (default: 5).",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help=(
+            "Upper bound for the adaptive number of concurrent downloads, which starts at --workers, "
+            "halves when Synapse throttles and grows back while it is healthy (default: 2 x --workers)."
+        ),
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help=(
+            "Keep an index of every downloaded folder tree (IDs, paths, versions, sizes, MD5s) and refresh it "
+            "incrementally: only new or modified files are looked up, and only files that are new or changed "
+            "against the local copy are downloaded."
+        ),
+    )
+    parser.add_argument(
+        "--snapshot_path",
+        type=Path,
+        default=None,
+        help="SQLite file of the folder snapshots (default: <output_dir>/.synapse_snapshot.sqlite).",
+    )
+    parser.add_argument(
+        "--summary_json",
+        type=Path,
+        default=None,
+        help="Write the final counts, bytes and duration to this JSON file (used to merge sharded jobs).",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=Path,
+        default=None,
+        help=(
+            "Managed download cache shared by all jobs, keyed by MD5 "
+            "(default: $SYNAPSE_CACHE_FOLDER/managed)."
+        ),
+    )
+    parser.add_argument(
+        "--cache_max_gb",
+        type=float,
+        default=float(os.environ.get("SYNAPSE_CACHE_MAX_GB", 100)),
+        help=(
+            "Size cap of the managed cache; least recently used files only the cache still holds are "
+            "evicted beyond it (default: $SYNAPSE_CACHE_MAX_GB or 100)."
+        ),
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Do not use the managed cache; every file is fetched from Synapse.",
+    )
+    parser.add_argument(
+        "--small_file_mb",
+        type=float,
+        default=8,
+        help=(
+            "Files below this size (e.g. .bai indices) are fetched in batches as one bulk zip each "
+            "instead of one request per file; 0 disables batching (default: 8)."
+        ),
+    )
+    parser.add_argument(
+        "--batch_files",
+        type=int,
+        default=BULK_MAX_FILES,
+        help=f"Small files per bulk download (default and maximum: {BULK_MAX_FILES}).",
+    )
+    parser.add_argument(
+        "--large_file_gb",
+        type=float,
+        default=1,
+        help=(
+            "Files of at least this size are fetched over several concurrent HTTP range requests into a "
+            "preallocated file, and resume from their missing ranges after an interruption; "
+            "0 disables ranged downloads (default: 1)."
+        ),
+    )
+    parser.add_argument(
+        "--range_mb",
+        type=float,
+        default=RANGE_CHUNK_BYTES / 1024 / 1024,
+        help=f"Size in MB of each range request of a large file (default: {RANGE_CHUNK_BYTES // 1024 // 1024}).",
+    )
+    parser.add_argument(
+        "--range_streams",
+        type=int,
+        default=RANGE_STREAMS,
+        help=f"Concurrent range requests per large file (default: {RANGE_STREAMS}).",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help=(
+            "After the downloads, hash every file the ledger lists under --output_dir or under an absolute "
+            f"save_path of the manifest and compare it with the size and MD5 of its Synapse file handle; mismatches are written to {REPORT_FILENAME}."
+        ),
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="With --verify, download missing and mismatched files again and verify them once more.",
+    )
+    parser.add_argument(
+        "--hash_workers",
+        type=int,
+        default=2,
+        help="Processes hashing files for --verify (default: 2).",
+    )
+    parser.add_argument(
+        "--plan",
+        type=Path,
+        default=None,
+        help=(
+            "Dry run: resolve the manifest, walk folders and compare local and remote state, then write "
+            "the action of every file (download/skip/conflict/invalid, with sizes) to this CSV. "
+            "Nothing is downloaded."
+        ),
+    )
     return parser
 
 
-def main(argv=None) -> int:
+def main(argv=None, syn: Optional[Synapse] = None) -> int:
+    """
+    Run the download script. `syn` is a logged-in session to reuse
+    (synapse_service.py); without one, the token file is used to log in.
+    """
     parser = build_parser()
     args = parser.parse_args(argv)
+    if args.verify and args.no_ledger:
+        parser.error("--verify finds the downloaded files in the ledger and cannot be combined with --no_ledger")
+    if args.requeue and not args.verify:
+        parser.error("--requeue requires --verify")
 
     # Login to Synapse
-    syn = synapse_login(args.tokenfile_path)
-    
-    # Load file list from CSV
-    file_list = load_file_list(args.file_path)
+    if syn is None:
+        syn = synapse_login(args.tokenfile_path)
+    PLACEMENT.reset()
     
-    if not file_list:
-        print("No files found in the CSV; nothing to download.", flush=True)
-        return 0
-    
-    # Validate all synapse IDs exist first and determine if they are files or folders
+    # Resolve output_dir to absolute path
+    output_dir = args.output_dir.expanduser().resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ledger = open_ledger(args.ledger, output_dir, enabled=not args.no_ledger)
+    cache = open_cache(args.cache_dir, args.cache_max_gb, enabled=not args.no_cache)
+    retry = build_retry_policy(args.workers, args.max_workers, args.retries, printer=log)
+
+    # Validate all synapse IDs before any download; invalid IDs are reported together
     print("Validating Synapse IDs...")
-    entities_info = []
-    for row in file_list:
-        synapse_id = row["synapse_id"]
-        entity = check_synapse_id(syn, synapse_id)  # Raises SystemExit if invalid
-        
-        # Determine if entity is a file or folder
-        entity_type = entity.get('concreteType', '')
-        is_folder = entity_type == 'org.sagebionetworks.repo.model.Folder'
-        
-        entities_info.append({
-            'synapse_id': synapse_id,
-            'save_path': row.get("local_path", "") or row.get("save_path", ""),
-            'is_folder': is_folder,
-            'entity': entity
-        })
-    
-    # Download each entity (file or folder)
+    validator = validate_manifest(syn, args.file_path, args.workers, args.chunk_size, retry)
+    if validator.invalid:
+        report_invalid_ids(validator.invalid, output_dir / "invalid_synapse_ids.csv")
+        if args.plan:
+            print("   Listed as 'invalid' in the plan")
+        elif not args.skip_invalid:
+            if ledger is not None:
+                ledger.close()
+            raise SystemExit(f"Pipeline stopped: {len(validator.invalid)} invalid Synapse IDs")
+        else:
+            print("   Continuing with the valid IDs (--skip_invalid)")
+
+    if args.plan:
+        plan = TransferPlan(args.plan, DOWNLOAD)
+        plan_downloads(
+            syn, validator, args.file_path, output_dir, plan, args.workers, args.chunk_size, args.overwrite, ledger, cache
+        )
+        if ledger is not None:
+            ledger.close()
+        return 0
+
+    metrics = TransferMetrics("download", args.event_log, args.progress_interval, printer=log)
+    snapshot = None
     downloaded_count = 0
     skipped_count = 0
     failed_count = 0
-    
-    # Resolve output_dir to absolute path
-    output_dir = args.output_dir.expanduser().resolve()
-    
-    print("Starting downloads...")
-    for info in entities_info:
-        synapse_id = info["synapse_id"]
-        save_path = info["save_path"]
-        is_folder = info["is_folder"]
-        
-        if not save_path:
-            print(f"⚠️  Warning: No save_path specified for {synapse_id}, skipping...", flush=True)
-            failed_count += 1
-            continue
-        
-        # Resolve save_path: if relative, make it relative to output_dir; if absolute, use as-is
-        save_path_obj = Path(save_path)
-        if not save_path_obj.is_absolute():
-            # Relative path: resolve relative to output_dir
-            resolved_save_path = (output_dir / save_path_obj).expanduser().resolve()
-        else:
-            # Absolute path: use as-is
-            resolved_save_path = save_path_obj.expanduser().resolve()
-        
-        try:
-            if is_folder:
-                # Download folder recursively, preserving structure
-                # save_path is treated as the parent directory where the folder will be created
-                folder_name = info["entity"].get('name') or synapse_id
-                base_dir = resolved_save_path
-                folder_target = (base_dir / folder_name).expanduser().resolve()
-                print(f"📁 Downloading folder {synapse_id} to {folder_target}...")
-                download_files_in_folder(syn, synapse_id, folder_target, args.overwrite)
-                downloaded_count += 1  # Count folder as one download
-            else:
-                # Download single file
-                # save_path is ALWAYS treated as a directory - the file will be saved with its original name
-                file_name = info["entity"].get('name', 'downloaded_file')
-                # Force save_path to be treated as directory by appending the filename
-                file_target = (resolved_save_path / file_name).expanduser().resolve()
-                print(f"📄 Downloading file {synapse_id} to directory {resolved_save_path}...")
-                if download_single_file(syn, synapse_id, str(file_target), args.overwrite):
-                    downloaded_count += 1
-                elif file_target.exists():
-                    skipped_count += 1
-                else:
+    total_rows = 0
+    verify_counts = None
+    # Everything is closed on every path: inside synapse_service.py a failed
+    # job must not leave its progress thread, event log or SQLite
+    # connections behind
+    try:
+        small_file_bytes = int(args.small_file_mb * 1024 * 1024)
+        batch_files = min(max(1, args.batch_files), BULK_MAX_FILES)
+        ranged = open_ranged(args.large_file_gb * 1024, args.range_mb, args.range_streams, printer=log)
+        snapshot = open_snapshot(args.snapshot_path, output_dir, enabled=args.snapshot)
+        # Directories outside output_dir that rows saved to, for --verify
+        save_roots = set()
+
+        # The manifest is streamed and handled chunk by chunk: each chunk is
+        # resolved and downloaded before the next one is read.
+        for chunk in chunked(iter_file_list(args.file_path), args.chunk_size):
+            total_rows += len(chunk)
+            file_plan, folder_plan, unresolved, duplicates = resolve_rows(validator, chunk, output_dir)
+            failed_count += unresolved
+            skipped_count += duplicates
+            for target in [Path(entry['save_path']).parent for entry in file_plan] + [target for _, target in folder_plan]:
+                if not target.is_relative_to(output_dir):
+                    save_roots.add(target)
+
+            print("Starting downloads...")
+            if file_plan:
+                print(f"📄 Downloading {len(file_plan)} files with {args.workers} workers...")
+                counts = download_many(
+                    syn,
+                    file_plan,
+                    args.workers,
+                    args.overwrite,
+                    ledger=ledger,
+                    metrics=metrics,
+                    retry=retry,
+                    cache=cache,
+                    small_file_bytes=small_file_bytes,
+                    batch_files=batch_files,
+                    ranged=ranged,
+                )
+                downloaded_count += counts[DOWNLOADED]
+                skipped_count += counts[SKIPPED]
+                failed_count += counts[FAILED]
+
+            for synapse_id, folder_target in folder_plan:
+                try:
+                    # Download folder recursively, preserving structure
+                    print(f"📁 Downloading folder {synapse_id} to {folder_target}...")
+                    counts = download_files_in_folder(
+                        syn,
+                        synapse_id,
+                        folder_target,
+                        args.overwrite,
+                        args.workers,
+                        ledger,
+                        metrics,
+                        retry,
+                        cache,
+                        small_file_bytes,
+                        batch_files,
+                        ranged,
+                        snapshot,
+                    )
+                    downloaded_count += counts[DOWNLOADED]
+                    skipped_count += counts[SKIPPED]
+                    failed_count += counts[FAILED]
+                except Exception as exc:
+                    print(f"❌ FAILED: Unexpected error downloading '{synapse_id}': {exc}", flush=True)
                     failed_count += 1
-        except Exception as exc:
-            print(f"❌ FAILED: Unexpected error downloading '{synapse_id}': {exc}", flush=True)
-            failed_count += 1
-    
-    # Print summary
-    print(f"\n📊 Download Summary:")
-    print(f"   ✅ Downloaded: {downloaded_count} files")
-    print(f"   ⏭️  Skipped: {skipped_count} files")
-    print(f"   ❌ Failed: {failed_count} files")
-    print(f"   📁 Total processed: {downloaded_count + skipped_count + failed_count} files")
+
+            # Trim between chunks, while no transfer is linking out of the cache
+            if cache is not None:
+                cache.trim()
+
+        if total_rows:
+            # Print summary
+            print(f"\n📊 Download Summary:")
+            print(f"   ✅ Downloaded: {downloaded_count} files")
+            print(f"   ⏭️  Skipped: {skipped_count} files")
+            print(f"   ❌ Failed: {failed_count} files")
+            print(f"   📁 Total processed: {downloaded_count + skipped_count + failed_count} files")
+            if any(PLACEMENT.bytes.values()):
+                print(f"   📦 Placement: {PLACEMENT.summary()}")
+            if cache is not None:
+                print(f"   🗄️  Cache: {cache.summary()}")
+            if args.verify:
+                verify_counts = verify_downloads(
+                    syn, ledger, output_dir, args.workers, args.hash_workers, retry, metrics, cache, args.requeue, save_roots
+                )
+    finally:
+        metrics.close()
+        if ledger is not None:
+            ledger.close()
+        if snapshot is not None:
+            snapshot.close()
+
+    if not total_rows:
+        print("No files found in the CSV; nothing to download.", flush=True)
+        if args.summary_json:
+            metrics.write_summary(args.summary_json, {DOWNLOADED: 0, SKIPPED: 0, FAILED: 0}, manifest=str(args.file_path))
+        return 0
+    if args.summary_json:
+        metrics.write_summary(
+            args.summary_json,
+            {DOWNLOADED: downloaded_count, SKIPPED: skipped_count, FAILED: failed_count},
+            manifest=str(args.file_path),
+            cache_hits=cache.hits if cache is not None else 0,
+            verify=verify_counts,
+        )
     print("Download complete.", flush=True)
     return 0
 
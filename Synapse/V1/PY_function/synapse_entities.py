@@ -0,0 +1,35 @@
+from typing import Optional
+
+
+def is_file_type(child_type: str) -> bool:
+    """
+    True if a getChildren 'type' (or entity concreteType) is a FileEntity.
+    """
+    return (
+        child_type == 'org.sagebionetworks.repo.model.FileEntity' or
+        child_type == 'file' or
+        'FileEntity' in str(child_type)
+    )
+
+
+def is_folder_type(child_type: str) -> bool:
+    """
+    True if a getChildren 'type' (or entity concreteType) is a Folder or Project.
+    """
+    return (
+        child_type == 'org.sagebionetworks.repo.model.Folder' or
+        child_type == 'folder' or
+        child_type == 'org.sagebionetworks.repo.model.Project' or
+        'Folder' in str(child_type) or
+        'Project' in str(child_type)
+    )
+
+
+def file_size(entity) -> Optional[int]:
+    """
+    Return the content size in bytes of a FileEntity fetched with syn.get(),
+    or None if the file handle is not available.
+    """
+    file_handle = entity.get('_file_handle') or {}
+    size = file_handle.get('contentSize')
+    return int(size) if size is not None else None
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+HASH_CACHE_FILENAME = "md5_cache.sqlite"
+
+# Large sequential reads keep a single hashing process disk-bound, not
+# syscall-bound; one reused buffer keeps memory flat however big the file
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def md5_file(path: str, block_size: int = BLOCK_SIZE) -> str:
+    """
+    Return the hex MD5 of a local file.
+    The file is read sequentially into one reusable buffer, so memory use
+    stays at block_size even for files far larger than RAM.
+    """
+    digest = hashlib.md5()
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    try:
+        with open(path, "rb", buffering=0) as handle:
+            while True:
+                count = handle.readinto(view)
+                if not count:
+                    break
+                digest.update(view[:count])
+    finally:
+        view.release()
+    return digest.hexdigest()
+
+
+def file_key(path: str) -> tuple:
+    """
+    (device, inode, size, mtime_ns) of a file: the identity of its content
+    as far as the hash cache is concerned.
+    """
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class HashCache:
+    """
+    On-disk MD5 cache keyed by (device, inode, size, mtime_ns).
+    A file that has not been modified keeps its key, so reruns and retries
+    never hash it again; any write changes mtime and invalidates the entry.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS md5_cache ("
+            "dev INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, md5 TEXT NOT NULL, "
+            "PRIMARY KEY (dev, inode, size, mtime_ns))"
+        )
+        self._conn.commit()
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT md5 FROM md5_cache WHERE dev = ? AND inode = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: tuple, md5: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO md5_cache VALUES (?, ?, ?, ?, ?)", (*key, md5))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def default_hash_cache_path() -> Path:
+    """
+    The hash cache lives next to the Synapse client cache, which the LSF
+    wrappers keep on shared storage, so every job reuses it.
+    """
+    cache_dir = os.environ.get("SYNAPSE_CACHE_FOLDER", "/tmp/.synapseCache")
+    return Path(cache_dir) / HASH_CACHE_FILENAME
+
+
+class FileHasher:
+    """
+    Compute MD5s in a pool of worker processes, consulting a HashCache first.
+    submit() starts hashing in the background and returns a Future, so the
+    uploader can queue checksums ahead of the transfers that need them.
+    Requests for the same file share one computation.
+    """
+
+    def __init__(self, processes: int = 2, cache: Optional[HashCache] = None):
+        self.cache = cache
+        self._pool = ProcessPoolExecutor(max_workers=max(1, processes))
+        self._pending = {}
+        # Re-entrant: a future that is already done runs its callback inside submit()
+        self._lock = threading.RLock()
+
+    def submit(self, path: str) -> Future:
+        path = str(path)
+        key = file_key(path)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(md5_file, path)
+                self._pending[key] = future
+                future.add_done_callback(lambda done, key=key: self._store(key, done))
+        return future
+
+    def _store(self, key: tuple, future: Future) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+        if self.cache is not None and future.exception() is None:
+            self.cache.put(key, future.result())
+
+    def md5(self, path: str) -> str:
+        """
+        Return the MD5 of `path`, waiting for it if needed.
+        """
+        return self.submit(path).result()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        if self.cache is not None:
+            self.cache.close()
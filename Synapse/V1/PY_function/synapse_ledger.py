@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Transfer state of a ledger row
+STARTED = "started"
+DONE = "done"
+FAILED = "failed"
+
+LEDGER_FILENAME = ".synapse_ledger.sqlite"
+
+COLUMNS = (
+    "direction", "synapse_id", "local_path", "entity_id", "version", "size", "mtime_ns", "md5", "state", "updated_at"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    direction   TEXT NOT NULL,
+    synapse_id  TEXT NOT NULL,
+    local_path  TEXT NOT NULL,
+    entity_id   TEXT,
+    version     INTEGER,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    md5         TEXT,
+    state       TEXT NOT NULL,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (direction, synapse_id, local_path)
+)
+"""
+
+
+class TransferLedger:
+    """
+    Local SQLite record of every file transferred by the download and upload
+    scripts, so a rerun can skip verified work without asking Synapse.
+
+    Rows are keyed by (direction, synapse_id, local_path). For downloads
+    synapse_id is the downloaded entity; for uploads it is the parent the file
+    was uploaded into and entity_id holds the stored entity. A row is STARTED
+    before the bytes move and DONE (with size, mtime and md5) afterwards, so a
+    job killed mid-transfer leaves a STARTED row that marks the local file as
+    partial.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=60)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get(self, direction: str, synapse_id: str, local_path: str) -> Optional[Dict]:
+        """
+        Return the ledger row as a dict, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM transfers WHERE direction = ? AND synapse_id = ? AND local_path = ?",
+                (direction, synapse_id, str(local_path)),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def rows(self, direction: str, state: str = DONE) -> List[Dict]:
+        """
+        All rows of one direction in `state`, ordered by local path.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM transfers WHERE direction = ? AND state = ? ORDER BY local_path",
+                (direction, state),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _upsert(self, direction: str, synapse_id: str, local_path: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO transfers (direction, synapse_id, local_path, {columns}) "
+                f"VALUES (?, ?, ?, {placeholders}) "
+                f"ON CONFLICT (direction, synapse_id, local_path) DO UPDATE SET {updates}",
+                (direction, synapse_id, str(local_path), *fields.values()),
+            )
+            self._conn.commit()
+
+    def start(self, direction: str, synapse_id: str, local_path: str, version: Optional[int] = None) -> None:
+        """
+        Mark a transfer as in progress before any bytes move.
+        """
+        self._upsert(direction, synapse_id, local_path, state=STARTED, version=version)
+
+    def finish(
+        self,
+        direction: str,
+        synapse_id: str,
+        local_path: str,
+        entity_id: Optional[str] = None,
+        version: Optional[int] = None,
+        md5: Optional[str] = None,
+    ) -> None:
+        """
+        Mark a transfer as done and record the local file's size and mtime.
+        """
+        stat = os.stat(local_path)
+        self._upsert(
+            direction,
+            synapse_id,
+            local_path,
+            state=DONE,
+            entity_id=entity_id,
+            version=version,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            md5=md5,
+        )
+
+    def fail(self, direction: str, synapse_id: str, local_path: str) -> None:
+        """
+        Mark a transfer as failed; the local file, if any, is not trusted.
+        """
+        self._upsert(direction, synapse_id, local_path, state=FAILED)
+
+    def merge_from(self, path: Path) -> int:
+        """
+        Copy the rows of another ledger file (e.g. one shard's) into this
+        one. A row already here is replaced only by a more recent one.
+        Returns the number of rows in the other ledger.
+        """
+        columns = ", ".join(COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[3:])
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS other", (str(path),))
+            try:
+                count = self._conn.execute("SELECT COUNT(*) FROM other.transfers").fetchone()[0]
+                self._conn.execute(
+                    f"INSERT INTO transfers ({columns}) SELECT {columns} FROM other.transfers WHERE true "
+                    f"ON CONFLICT (direction, synapse_id, local_path) DO UPDATE SET {updates} "
+                    f"WHERE excluded.updated_at > transfers.updated_at"
+                )
+                self._conn.commit()
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+        return count
+
+    def is_verified(self, direction: str, synapse_id: str, local_path: str, version: Optional[int] = None) -> bool:
+        """
+        True if the transfer is DONE and the local file still has the recorded
+        size and mtime. When `version` is given it must also match the
+        recorded remote version, so a changed remote entity is picked up.
+        """
+        row = self.get(direction, synapse_id, local_path)
+        if not row or row["state"] != DONE:
+            return False
+        if version is not None and row["version"] is not None and int(version) != row["version"]:
+            return False
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return False
+        return stat.st_size == row["size"] and stat.st_mtime_ns == row["mtime_ns"]
+
+    def is_stale(self, direction: str, synapse_id: str, local_path: str, version: Optional[int] = None) -> bool:
+        """
+        True if the file at `local_path` cannot be trusted: a previous
+        transfer to it was started or failed without completing, or the
+        remote `version` differs from the one that was transferred.
+        """
+        row = self.get(direction, synapse_id, local_path)
+        if not row:
+            return False
+        if row["state"] in (STARTED, FAILED):
+            return True
+        return version is not None and row["version"] is not None and int(version) != row["version"]
+
+
+def open_ledger(path: Optional[Path], default_dir: Path, enabled: bool = True) -> Optional[TransferLedger]:
+    """
+    Open the ledger at `path`, or at LEDGER_FILENAME inside `default_dir`.
+    Returns None when the ledger is disabled.
+    """
+    if not enabled:
+        return None
+    ledger_path = Path(path) if path else Path(default_dir) / LEDGER_FILENAME
+    ledger = TransferLedger(ledger_path)
+    print(f"Transfer ledger: {ledger.path}")
+    return ledger
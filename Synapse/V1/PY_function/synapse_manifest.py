@@ -0,0 +1,73 @@
+import csv
+import gzip
+import io
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+
+def open_manifest(path: Path) -> TextIO:
+    """
+    Open a manifest for reading as text.
+    Files ending in '.gz' are decompressed on the fly.
+    """
+    manifest = Path(path).expanduser()
+    if manifest.suffix.lower() == ".gz":
+        return io.TextIOWrapper(gzip.open(manifest, "rb"), encoding="utf-8", newline="")
+    return manifest.open(newline="", encoding="utf-8")
+
+
+def manifest_delimiter(path: Path) -> str:
+    """
+    Tab for .tsv manifests (optionally gzipped), comma otherwise.
+    """
+    suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    return "\t" if suffixes and suffixes[-1] == ".tsv" else ","
+
+
+class ManifestReader(csv.DictReader):
+    """
+    DictReader that strips the carriage returns left by spreadsheet exports
+    from the end of field names and values. Lines are parsed untouched, so
+    quoted fields may still span lines.
+    """
+
+    @property
+    def fieldnames(self) -> Optional[List[str]]:
+        names = csv.DictReader.fieldnames.fget(self)
+        if names is not None and not getattr(self, "_stripped", False):
+            self._fieldnames = names = [name.rstrip("\r") for name in names]
+            self._stripped = True
+        return names
+
+    @fieldnames.setter
+    def fieldnames(self, value: Optional[List[str]]) -> None:
+        self._fieldnames = value
+        self._stripped = False
+
+    def __next__(self) -> Dict[str, str]:
+        row = super().__next__()
+        return {key: value.rstrip("\r") if isinstance(value, str) else value for key, value in row.items()}
+
+
+def iter_manifest_rows(handle: TextIO, path: Path) -> ManifestReader:
+    """
+    ManifestReader over an open manifest, using the delimiter implied by
+    `path`. The handle must be opened with newline="" (see open_manifest()).
+    """
+    return ManifestReader(handle, delimiter=manifest_delimiter(path))
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Yield lists of at most `size` items, reading `items` lazily.
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
@@ -0,0 +1,251 @@
+import heapq
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+# Number of slowest transfers listed in the final summary
+SLOWEST_REPORTED = 5
+
+
+def format_rate(nbytes: float, seconds: float) -> str:
+    """
+    Aggregate throughput as MB/s.
+    """
+    return f"{nbytes / (1024 * 1024) / max(seconds, 1e-9):.1f} MB/s"
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """
+    H:MM:SS, or '?' when unknown.
+    """
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def format_size(nbytes: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1024:
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TB"
+
+
+class TransferMetrics:
+    """
+    Run-wide transfer metrics for the download and upload scripts.
+
+    Every event is appended to an optional JSON-lines log, one object per
+    line with 'ts', 'event' and 'direction': run_start/run_end,
+    transfer_start/transfer_end (status, bytes, duration, retries, error and
+    the time spent in each phase) and phase_start/phase_end around each API
+    call or byte transfer. Work is announced with expect() as the manifest is
+    read, and a progress line with aggregate MB/s and an ETA for the work
+    queued so far is printed every `interval` seconds.
+    """
+
+    def __init__(
+        self,
+        direction: str,
+        event_log: Optional[Path] = None,
+        interval: float = 60.0,
+        printer: Callable[[str], None] = print,
+    ):
+        self.direction = direction
+        self.printer = printer
+        self.started = time.monotonic()
+        self.files_expected = 0
+        self.bytes_expected = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.bytes_skipped = 0
+        self.statuses: Dict[str, int] = {}
+        self.retries = 0
+        self.slowest = []
+        self.finished = None
+        self._lock = threading.Lock()
+        self._handle = None
+        if event_log:
+            path = Path(event_log).expanduser()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = path.open("a", encoding="utf-8")
+            print(f"Event log: {path}")
+        self.emit("run_start")
+
+        self._stop = threading.Event()
+        self._reporter = None
+        if interval and interval > 0:
+            self._reporter = threading.Thread(target=self._report, args=(interval,), daemon=True)
+            self._reporter.start()
+
+    def emit(self, event: str, **fields) -> None:
+        """
+        Append one event to the log, if there is one.
+        """
+        if self._handle is None:
+            return
+        record = {"ts": round(time.time(), 3), "event": event, "direction": self.direction, **fields}
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._handle.write(line + "\n")
+            self._handle.flush()
+
+    def expect(self, files: int = 0, nbytes: int = 0) -> None:
+        """
+        Add queued work to the totals the progress line and ETA are based on.
+        """
+        with self._lock:
+            self.files_expected += files
+            self.bytes_expected += nbytes
+
+    def start(self, synapse_id: str, local_path: str) -> "Transfer":
+        return Transfer(self, synapse_id, local_path)
+
+    def record(self, status: str, nbytes: int, moved: bool, duration: float, retries: int, label: str) -> None:
+        with self._lock:
+            self.files_done += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.retries += retries
+            if moved:
+                self.bytes_done += nbytes
+                entry = (duration, label)
+                if len(self.slowest) < SLOWEST_REPORTED:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+            else:
+                self.bytes_skipped += nbytes
+
+    def progress_line(self) -> str:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            files_done, files_expected = self.files_done, self.files_expected
+            bytes_done = self.bytes_done
+            bytes_left = max(0, self.bytes_expected - self.bytes_done - self.bytes_skipped)
+        eta = None
+        if bytes_done and self.bytes_expected:
+            eta = bytes_left / (bytes_done / max(elapsed, 1e-9))
+        elif files_done and files_expected:
+            eta = (files_expected - files_done) * elapsed / files_done
+        return (
+            f"⏱️  Progress: {files_done} of {files_expected} queued files done, "
+            f"{format_size(bytes_done)} transferred, {format_rate(bytes_done, elapsed)}, "
+            f"elapsed {format_duration(elapsed)}, ETA {format_duration(eta)}"
+        )
+
+    def _report(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.printer(self.progress_line())
+
+    def close(self) -> None:
+        """
+        Stop the progress reporter, print the throughput summary (with the
+        slowest transfers) and write run_end.
+        """
+        self._stop.set()
+        if self._reporter is not None:
+            self._reporter.join()
+        self.finished = time.monotonic()
+        elapsed = self.finished - self.started
+        if self.bytes_done:
+            print(
+                f"   📈 Throughput: {format_size(self.bytes_done)} in {format_duration(elapsed)} "
+                f"({format_rate(self.bytes_done, elapsed)})"
+            )
+        if self.retries:
+            print(f"   🔁 Retries: {self.retries}")
+        for duration, label in sorted(self.slowest, reverse=True):
+            print(f"   🐢 Slow: {duration:.1f}s {label}")
+        self.emit(
+            "run_end",
+            duration=round(elapsed, 3),
+            files=self.files_done,
+            bytes=self.bytes_done,
+            statuses=self.statuses,
+            retries=self.retries,
+        )
+        if self._handle is not None:
+            with self._lock:
+                self._handle.close()
+                self._handle = None
+
+    def write_summary(self, path: Path, counts: Dict[str, int], **fields) -> None:
+        """
+        Write the run's final counts, bytes and duration as JSON, e.g. for
+        merging the summaries of sharded jobs.
+        """
+        elapsed = (self.finished or time.monotonic()) - self.started
+        summary = {
+            "direction": self.direction,
+            "counts": counts,
+            "bytes": self.bytes_done,
+            "seconds": round(elapsed, 3),
+            "retries": self.retries,
+            **fields,
+        }
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        print(f"Summary written to {path}")
+
+
+class Transfer:
+    """
+    Timing of one file transfer. Phases are timed with `with
+    transfer.phase("name"):` and finish() records the outcome. A Transfer
+    without metrics times nothing and writes nothing.
+    """
+
+    def __init__(self, metrics: Optional[TransferMetrics], synapse_id: str, local_path: str):
+        self.metrics = metrics
+        self.synapse_id = synapse_id
+        self.local_path = str(local_path)
+        self.retries = 0
+        self.phases: Dict[str, float] = {}
+        self.started = time.monotonic()
+        self._emit("transfer_start")
+
+    def count_retry(self) -> None:
+        self.retries += 1
+
+    def _emit(self, event: str, **fields) -> None:
+        if self.metrics is not None:
+            self.metrics.emit(event, synapse_id=self.synapse_id, local_path=self.local_path, **fields)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        self._emit("phase_start", phase=name)
+        try:
+            yield
+        except BaseException as exc:
+            duration = time.monotonic() - started
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+            self._emit("phase_end", phase=name, duration=round(duration, 3), ok=False, error=str(exc))
+            raise
+        duration = time.monotonic() - started
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+        self._emit("phase_end", phase=name, duration=round(duration, 3), ok=True)
+
+    def finish(self, status: str, nbytes: int = 0, moved: bool = False, error: Optional[str] = None) -> str:
+        """
+        Record the outcome; `moved` is True when bytes actually crossed the
+        network. Returns `status` so callers can `return transfer.finish(...)`.
+        """
+        duration = time.monotonic() - self.started
+        self._emit(
+            "transfer_end",
+            status=status,
+            bytes=nbytes,
+            duration=round(duration, 3),
+            retries=self.retries,
+            phases={name: round(seconds, 3) for name, seconds in self.phases.items()},
+            error=error,
+        )
+        if self.metrics is not None:
+            self.metrics.record(status, nbytes, moved, duration, self.retries, self.local_path)
+        return status
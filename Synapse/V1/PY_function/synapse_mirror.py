@@ -0,0 +1,146 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from synapseclient import Folder, Synapse
+
+from synapse_retry import RetryPolicy, call_with_retry
+
+# A local directory relative to the mirror root, as its path components; () is the root
+FolderKey = Tuple[str, ...]
+
+
+def common_root(paths: Iterable[str]) -> Optional[Path]:
+    """
+    Deepest directory containing every path, or None if there is none.
+    """
+    root = None
+    for path in paths:
+        directory = os.path.dirname(os.path.abspath(path))
+        root = directory if root is None else os.path.commonpath([root, directory])
+    return Path(root) if root is not None else None
+
+
+class FolderTree:
+    """
+    Synapse folder hierarchy mirroring a local directory tree under
+    `parent_id`.
+
+    Every folder is resolved once and kept in a path -> folder ID cache:
+    the children of a parent are listed with one getChildren call, and
+    folders missing from the listing are created. ensure() resolves the
+    folders a batch of files needs level by level, with the folders of one
+    level listed and created `workers` at a time, so a new project tree
+    costs one round trip per level rather than one per folder.
+    """
+
+    def __init__(
+        self,
+        syn: Synapse,
+        parent_id: str,
+        root: Path,
+        workers: int = 4,
+        retry: Optional[RetryPolicy] = None,
+        printer: Callable[[str], None] = print,
+    ):
+        self.syn = syn
+        self.parent_id = parent_id
+        self.root = Path(os.path.abspath(Path(root).expanduser()))
+        self.workers = max(1, workers)
+        self.retry = retry
+        self.printer = printer
+        self.folders: Dict[FolderKey, str] = {(): parent_id}
+        self.new: Set[str] = set()
+        self.created = 0
+        self.listed = 0
+        self._children: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def key(self, file_path: str) -> Optional[FolderKey]:
+        """
+        The folder of a local file relative to the root, or None when the
+        file is outside the root.
+        """
+        directory = Path(os.path.abspath(Path(file_path).expanduser())).parent
+        try:
+            return directory.relative_to(self.root).parts
+        except ValueError:
+            return None
+
+    def folder_id(self, key: FolderKey) -> Optional[str]:
+        return self.folders.get(key)
+
+    def is_new(self, folder_id: str) -> bool:
+        """
+        True for a folder created by this run, which holds nothing yet.
+        """
+        return folder_id in self.new
+
+    def _list(self, parent_id: str) -> None:
+        folders = {
+            child["name"]: child["id"]
+            for child in call_with_retry(
+                self.retry, parent_id, lambda: list(self.syn.getChildren(parent_id, includeTypes=["folder"]))
+            )
+        }
+        with self._lock:
+            self._children[parent_id] = folders
+            self.listed += 1
+
+    def _resolve(self, key: FolderKey) -> None:
+        parent_id = self.folders[key[:-1]]
+        name = key[-1]
+        folder_id = self._children[parent_id].get(name)
+        if folder_id is None:
+            # Storing an existing name returns that folder, so a concurrent job creating it is harmless
+            folder = call_with_retry(self.retry, name, self.syn.store, Folder(name=name, parent=parent_id))
+            folder_id = folder["id"]
+            with self._lock:
+                self.created += 1
+                self.new.add(folder_id)
+            self.printer(f"📁 CREATED: folder '{'/'.join(key)}' -> Synapse ID {folder_id}")
+        with self._lock:
+            self.folders[key] = folder_id
+            # A new folder has no children to list
+            if folder_id in self.new:
+                self._children[folder_id] = {}
+
+    def ensure(self, keys: Iterable[FolderKey]) -> None:
+        """
+        Resolve every folder in `keys` and their ancestors, shallowest level
+        first. A folder that cannot be listed or created is reported and
+        left out of the cache, and so are its subfolders.
+        """
+        levels: Dict[int, set] = {}
+        for key in keys:
+            for depth in range(1, len(key) + 1):
+                if key[:depth] not in self.folders:
+                    levels.setdefault(depth, set()).add(key[:depth])
+        if not levels:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for depth in sorted(levels):
+                level = [key for key in levels[depth] if key[:-1] in self.folders]
+                parents = sorted({self.folders[key[:-1]] for key in level} - set(self._children))
+                for parent_id, error in zip(parents, pool.map(self._attempt(self._list), parents)):
+                    if error:
+                        self.printer(f"❌ FAILED: Could not list folders in {parent_id}: {error}")
+                level = [key for key in level if self.folders[key[:-1]] in self._children]
+                for key, error in zip(level, pool.map(self._attempt(self._resolve), level)):
+                    if error:
+                        self.printer(f"❌ FAILED: Could not create folder '{'/'.join(key)}': {error}")
+
+    @staticmethod
+    def _attempt(func: Callable) -> Callable:
+        def run(item) -> Optional[Exception]:
+            try:
+                func(item)
+            except Exception as exc:
+                return exc
+            return None
+        return run
+
+    def summary(self) -> str:
+        return f"{len(self.folders) - 1} folders ({self.created} created, {self.listed} listed)"
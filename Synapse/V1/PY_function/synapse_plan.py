@@ -0,0 +1,77 @@
+import csv
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from synapse_metrics import format_size
+
+# Planned action of one file
+DOWNLOAD = "download"
+UPLOAD = "upload"
+SKIP = "skip"
+CONFLICT = "conflict"
+INVALID = "invalid"
+
+PLAN_COLUMNS = ["action", "synapse_id", "local_path", "bytes", "reason"]
+
+
+class TransferPlan:
+    """
+    Action list written by the scripts' --plan mode: one CSV row per file
+    with the action a real run would take (download/upload, skip, conflict
+    or invalid), its size and the reason. Rows are written as they are
+    decided, from any thread, so a plan of millions of files is never held
+    in memory; only the per-action totals are kept for the summary.
+    """
+
+    def __init__(self, path: Path, direction: str):
+        self.path = Path(path).expanduser()
+        self.direction = direction
+        self.totals: Dict[str, Tuple[int, int]] = {}
+        self.largest: Tuple[int, str] = (0, "")
+        self.unknown_sizes = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = self.path.open("w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._handle, fieldnames=PLAN_COLUMNS)
+        self._writer.writeheader()
+
+    def add(self, action: str, synapse_id: str, local_path: str, nbytes: Optional[int], reason: str = "") -> None:
+        """
+        Record one planned file; `nbytes` is None when the size is unknown.
+        """
+        with self._lock:
+            self._writer.writerow({
+                "action": action,
+                "synapse_id": synapse_id or "",
+                "local_path": local_path or "",
+                "bytes": "" if nbytes is None else nbytes,
+                "reason": reason,
+            })
+            files, total = self.totals.get(action, (0, 0))
+            self.totals[action] = (files + 1, total + (nbytes or 0))
+            if nbytes is None and action != INVALID:
+                self.unknown_sizes += 1
+            elif action == self.direction and nbytes > self.largest[0]:
+                self.largest = (nbytes, local_path)
+
+    def close(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Finish the CSV and print the totals per action. Returns
+        {action: (files, bytes)}.
+        """
+        with self._lock:
+            self._handle.close()
+        print(f"\n🗺️  Transfer Plan ({self.direction}):")
+        for action, (files, nbytes) in sorted(self.totals.items()):
+            print(f"   {action}: {files} files, {format_size(nbytes)}")
+        files, nbytes = self.totals.get(self.direction, (0, 0))
+        print(f"   📦 To {self.direction}: {files} files, {format_size(nbytes)}")
+        if self.largest[0]:
+            print(f"   🐘 Largest: {format_size(self.largest[0])} {self.largest[1]}")
+        if self.unknown_sizes:
+            print(f"   ❓ Unknown size: {self.unknown_sizes} files")
+        if self.totals.get(CONFLICT):
+            print("   ⚠️  Conflicts are listed with their reason in the plan")
+        print(f"Plan written to {self.path}")
+        return dict(self.totals)
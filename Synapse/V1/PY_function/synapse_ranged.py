@@ -0,0 +1,268 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from synapse_hashing import md5_file
+from synapse_metrics import format_size
+from synapse_retry import RetryPolicy, call_with_retry, http_status
+
+# Default split of a large file and number of concurrent range requests
+RANGE_CHUNK_BYTES = 64 * 1024 * 1024
+RANGE_STREAMS = 8
+
+# Pre-signed URLs expire (S3 answers 403); each file may fetch a new one this often
+MAX_URL_REFRESHES = 20
+
+WRITE_BLOCK = 4 * 1024 * 1024
+
+FILE_HANDLE_BATCH_URI = "/fileHandle/batch"
+
+
+def presigned_url(syn, synapse_id: str, file_handle_id: str) -> str:
+    """
+    A fresh pre-signed URL for the file handle of `synapse_id`.
+    """
+    body = {
+        "requestedFiles": [{
+            "fileHandleId": str(file_handle_id),
+            "associateObjectId": synapse_id,
+            "associateObjectType": "FileEntity",
+        }],
+        "includeFileHandles": False,
+        "includePreSignedURLs": True,
+    }
+    response = syn.restPOST(FILE_HANDLE_BATCH_URI, json.dumps(body), endpoint=syn.fileHandleEndpoint)
+    result = (response.get("requestedFiles") or [{}])[0]
+    if not result.get("preSignedURL"):
+        raise ValueError(f"no pre-signed URL for file handle {file_handle_id}: {result.get('failureCode')}")
+    return result["preSignedURL"]
+
+
+def fetch_range(url: str, start: int, end: int, fd: int) -> int:
+    """
+    Fetch bytes start..end (inclusive) of a pre-signed URL and write them at
+    the same offsets of the open file `fd`. Returns the number of bytes
+    written; a short or unranged response raises.
+    """
+    import requests
+
+    headers = {"Range": f"bytes={start}-{end}"}
+    with requests.get(url, headers=headers, stream=True, timeout=(30, 300)) as response:
+        response.raise_for_status()
+        if response.status_code != 206 and (start or response.headers.get("Content-Length") != str(end + 1)):
+            raise ValueError(f"server ignored the range request (HTTP {response.status_code})")
+        offset = start
+        for block in response.iter_content(WRITE_BLOCK):
+            os.pwrite(fd, block, offset)
+            offset += len(block)
+    if offset != end + 1:
+        raise ConnectionError(f"range {start}-{end} ended after {offset - start} bytes")
+    return offset - start
+
+
+def is_expired(exc: BaseException) -> bool:
+    """
+    True when a pre-signed URL was refused, usually because it expired.
+    """
+    return http_status(exc) == 403 or re.search(r"\b403\b", str(exc)) is not None
+
+
+class RangeProgress:
+    """
+    Sidecar file of a ranged download: a JSON header identifying the remote
+    content (file handle, size, MD5, chunk size) followed by the index of
+    every chunk written so far, one per line, appended and flushed as each
+    chunk completes. A sidecar whose header does not match the file being
+    fetched is ignored, so a partial file is only resumed for the same
+    content.
+    """
+
+    def __init__(self, path: Path, identity: Dict):
+        self.path = path
+        self.identity = identity
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def load(self) -> Set[int]:
+        """
+        Chunks already written, or an empty set if there is no usable sidecar.
+        """
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return set()
+        if not lines:
+            return set()
+        try:
+            if json.loads(lines[0]) != self.identity:
+                return set()
+        except ValueError:
+            return set()
+        # A line cut short by a killed job is not a completed chunk
+        return {int(line) for line in lines[1:] if line.isdigit()}
+
+    def open(self, resume: bool) -> None:
+        if resume:
+            self._handle = self.path.open("a", encoding="utf-8")
+        else:
+            self._handle = self.path.open("w", encoding="utf-8")
+            self._handle.write(json.dumps(self.identity) + "\n")
+            self._handle.flush()
+
+    def mark(self, index: int) -> None:
+        with self._lock:
+            self._handle.write(f"{index}\n")
+            self._handle.flush()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def remove(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+class RangedDownloader:
+    """
+    Download of single large files over several concurrent HTTP range
+    requests.
+
+    Files of at least `threshold_bytes` are split into `chunk_bytes` chunks
+    fetched `streams` at a time from the file handle's pre-signed URL into
+    a sparse file preallocated at full size (.<name>.part next to the
+    target). A sidecar (.<name>.ranges) records completed chunks, so a job
+    killed halfway resumes with the missing chunks only. An expired URL
+    (403) is replaced by a fresh one, and the finished file is checked
+    against the remote MD5 before it is moved into place.
+    """
+
+    def __init__(
+        self,
+        threshold_bytes: int,
+        chunk_bytes: int = RANGE_CHUNK_BYTES,
+        streams: int = RANGE_STREAMS,
+        printer: Callable[[str], None] = print,
+    ):
+        self.threshold_bytes = max(1, int(threshold_bytes))
+        self.chunk_bytes = max(1024 * 1024, int(chunk_bytes))
+        self.streams = max(1, streams)
+        self.printer = printer
+
+    def wants(self, size: Optional[int], file_handle_id: Optional[str]) -> bool:
+        return bool(file_handle_id) and size is not None and size >= self.threshold_bytes
+
+    def chunks(self, size: int) -> List[Tuple[int, int]]:
+        return [(start, min(start + self.chunk_bytes, size) - 1) for start in range(0, size, self.chunk_bytes)]
+
+    def download(
+        self,
+        syn,
+        synapse_id: str,
+        file_handle_id: str,
+        size: int,
+        md5: Optional[str],
+        output_path: Path,
+        retry: Optional[RetryPolicy] = None,
+        on_retry: Optional[Callable[[], None]] = None,
+    ) -> int:
+        """
+        Fetch the file to `output_path`. Returns the number of bytes fetched
+        by this call (less than `size` when resuming); raises on failure,
+        leaving the partial file and sidecar for the next attempt, except
+        after an MD5 mismatch, which discards them.
+        """
+        partial = output_path.with_name(f".{output_path.name}.part")
+        progress = RangeProgress(
+            output_path.with_name(f".{output_path.name}.ranges"),
+            {"file_handle_id": str(file_handle_id), "size": size, "md5": md5, "chunk_bytes": self.chunk_bytes},
+        )
+        chunks = self.chunks(size)
+        done = progress.load() if partial.exists() else set()
+        done &= set(range(len(chunks)))
+        if done:
+            self.printer(
+                f"🔁 RESUMING: '{output_path.name}' from {len(done)}/{len(chunks)} chunks already downloaded"
+            )
+        with partial.open("r+b" if done else "wb") as handle:
+            # Truncating to full size allocates nothing: chunks fill the holes
+            handle.truncate(size)
+        progress.open(resume=bool(done))
+
+        url_lock = threading.Lock()
+        state = {"url": call_with_retry(retry, synapse_id, presigned_url, syn, synapse_id, file_handle_id), "refreshes": 0}
+        lane = retry.lane(self.streams) if retry is not None else None
+        fetched = [0]
+        fd = os.open(partial, os.O_WRONLY)
+
+        def fetch_chunk(index: int) -> None:
+            start, end = chunks[index]
+            while True:
+                url = state["url"]
+                try:
+                    nbytes = call_with_retry(
+                        lane, f"{synapse_id} bytes {start}-{end}", fetch_range, url, start, end, fd, on_retry=on_retry
+                    )
+                except Exception as exc:
+                    if not is_expired(exc):
+                        raise
+                    with url_lock:
+                        if state["url"] == url:
+                            if state["refreshes"] >= MAX_URL_REFRESHES:
+                                raise
+                            state["refreshes"] += 1
+                            state["url"] = call_with_retry(
+                                retry, synapse_id, presigned_url, syn, synapse_id, file_handle_id
+                            )
+                    continue
+                progress.mark(index)
+                with url_lock:
+                    fetched[0] += nbytes
+                return
+
+        missing = [index for index in range(len(chunks)) if index not in done]
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.streams, max(1, len(missing)))) as pool:
+                # Consuming map() raises the first failed chunk; the others still finish
+                list(pool.map(fetch_chunk, missing))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+            progress.close()
+
+        if md5:
+            actual = md5_file(str(partial))
+            if actual != md5:
+                partial.unlink(missing_ok=True)
+                progress.remove()
+                raise ValueError(f"MD5 mismatch after ranged download ({actual} != {md5})")
+        os.replace(partial, output_path)
+        progress.remove()
+        if state["refreshes"]:
+            self.printer(f"🔑 '{output_path.name}': pre-signed URL refreshed {state['refreshes']} times")
+        return fetched[0]
+
+    def describe(self) -> str:
+        return (
+            f"files from {format_size(self.threshold_bytes)} in {format_size(self.chunk_bytes)} ranges, "
+            f"{self.streams} streams each"
+        )
+
+
+def open_ranged(large_file_mb: float, chunk_mb: float, streams: int, printer: Callable[[str], None] = print):
+    """
+    RangedDownloader for the scripts' flags, or None when `large_file_mb`
+    is 0.
+    """
+    if not large_file_mb:
+        return None
+    ranged = RangedDownloader(
+        int(large_file_mb * 1024 * 1024), int(chunk_mb * 1024 * 1024), streams, printer=printer
+    )
+    print(f"Ranged downloads: {ranged.describe()}")
+    return ranged
@@ -0,0 +1,223 @@
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterator, Optional
+
+# HTTP statuses worth retrying: throttling and server-side failures
+THROTTLED_STATUS = {429}
+TRANSIENT_STATUS = {500, 502, 503, 504}
+
+# Exception class names of transient network errors (requests/urllib3/stdlib)
+TRANSIENT_ERRORS = (
+    "ConnectionError",
+    "ConnectionResetError",
+    "ConnectionAbortedError",
+    "ChunkedEncodingError",
+    "ReadTimeout",
+    "ConnectTimeout",
+    "Timeout",
+    "TimeoutError",
+    "ProtocolError",
+    "IncompleteRead",
+    "RemoteDisconnected",
+)
+
+STATUS_PATTERN = re.compile(r"\b(429|50[0234])\b")
+
+
+def http_status(exc: BaseException) -> Optional[int]:
+    """
+    HTTP status of a failed request: from the attached response when there
+    is one (SynapseHTTPError is a requests HTTPError), otherwise parsed from
+    the message, since the client often re-raises with the status in text.
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return int(status)
+    match = STATUS_PATTERN.search(str(exc))
+    return int(match.group(1)) if match else None
+
+
+def is_throttled(exc: BaseException) -> bool:
+    return http_status(exc) in THROTTLED_STATUS or "too many requests" in str(exc).lower()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    True for throttling, 5xx responses and dropped or timed-out connections.
+    """
+    if is_throttled(exc) or http_status(exc) in TRANSIENT_STATUS:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(exc).__mro__)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Seconds requested by a Retry-After header, if the response has one.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of requests in flight.
+    The limit starts at `initial` and grows by one after every `limit`
+    consecutive successes (additive increase) up to `maximum`; a throttled
+    response halves it (multiplicative decrease), at most once per
+    `cooldown` seconds so a burst of 429s from requests already in flight
+    counts as one signal.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, cooldown: float = 2.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def on_success(self) -> None:
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify()
+
+    def on_throttle(self) -> Optional[int]:
+        """
+        Halve the limit; returns the new limit, or None within the cooldown.
+        """
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return None
+            self._last_decrease = now
+            self._successes = 0
+            self.limit = max(self.minimum, self.limit // 2)
+            return self.limit
+
+
+class RetryPolicy:
+    """
+    Retry transient failures with jittered exponential backoff, optionally
+    gating every attempt through an AdaptiveLimiter.
+    The delay before retry n is drawn uniformly from
+    [0, min(max_delay, base_delay * 2**n)] ("full jitter"), or is the
+    server's Retry-After when it asks for longer.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        limiter: Optional[AdaptiveLimiter] = None,
+        printer: Callable[[str], None] = print,
+    ):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter
+        self.printer = printer
+
+    def lane(self, workers: int) -> "RetryPolicy":
+        """
+        A policy with the same retry settings but its own adaptive limit,
+        starting at `workers` and growing to twice that, for a separate lane
+        of work that should not wait for this policy's slots.
+        """
+        limiter = AdaptiveLimiter(initial=workers, maximum=2 * max(1, workers))
+        return RetryPolicy(self.attempts, self.base_delay, self.max_delay, limiter, self.printer)
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        requested = retry_after(exc)
+        return max(delay, requested) if requested is not None else delay
+
+    def call(self, label: str, func: Callable, *args, on_retry: Optional[Callable[[], None]] = None, **kwargs):
+        """
+        Call func(*args, **kwargs), retrying transient failures; `label`
+        names the entity in retry messages and `on_retry` is called before
+        each retry. The last error, or any non-transient one, is raised.
+        """
+        for attempt in range(self.attempts):
+            try:
+                with self.limiter.slot() if self.limiter is not None else nullcontext():
+                    result = func(*args, **kwargs)
+            except Exception as exc:
+                if attempt == self.attempts - 1 or not is_transient(exc):
+                    raise
+                if is_throttled(exc) and self.limiter is not None:
+                    limit = self.limiter.on_throttle()
+                    if limit is not None:
+                        self.printer(f"🐢 THROTTLED: reducing concurrency to {limit}")
+                delay = self.delay(attempt, exc)
+                self.printer(
+                    f"🔁 RETRY {attempt + 1}/{self.attempts - 1}: '{label}' in {delay:.1f}s after: {exc}"
+                )
+                if on_retry is not None:
+                    on_retry()
+                time.sleep(delay)
+                continue
+            if self.limiter is not None:
+                self.limiter.on_success()
+            return result
+
+
+def call_with_retry(retry: Optional[RetryPolicy], label: str, func: Callable, *args, **kwargs):
+    """
+    retry.call(...), or a plain call when there is no policy.
+    """
+    if retry is None:
+        kwargs.pop("on_retry", None)
+        return func(*args, **kwargs)
+    return retry.call(label, func, *args, **kwargs)
+
+
+def pool_size(workers: int, retry: Optional[RetryPolicy]) -> int:
+    """
+    Threads needed so the adaptive limit, not the pool, bounds concurrency.
+    """
+    if retry is not None and retry.limiter is not None:
+        return max(workers, retry.limiter.maximum)
+    return max(1, workers)
+
+
+def build_retry_policy(
+    workers: int, max_workers: Optional[int], retries: int, printer: Callable[[str], None] = print
+) -> RetryPolicy:
+    """
+    Policy used by the scripts: `retries` extra attempts per call and an
+    adaptive limit that starts at `workers` and may grow to `max_workers`
+    (default 2 * workers).
+    """
+    workers = max(1, workers)
+    maximum = max_workers if max_workers else 2 * workers
+    return RetryPolicy(
+        attempts=retries + 1,
+        limiter=AdaptiveLimiter(initial=workers, maximum=max(workers, maximum)),
+        printer=printer,
+    )
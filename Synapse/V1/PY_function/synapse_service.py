@@ -0,0 +1,520 @@
+import argparse
+import importlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+USAGE = (
+    "python synapse_service.py serve --authToken synapse_token.txt --spool_dir /path/to/spool --max_hours 230\n"
+    "  python synapse_service.py submit --spool_dir /path/to/spool --mode download --project P "
+    "--output_file gatk/job_OUTPUT.txt -- --authToken synapse_token.txt --file_path files.csv --output_dir out/\n"
+    "  python synapse_service.py status --spool_dir /path/to/spool\n"
+    "  python synapse_service.py job --spool_dir /path/to/spool svc20250101120000abcd"
+)
+
+# Spool layout: submitters drop jobs into incoming/; the service moves a job
+# to active/ once it has claimed it and to done/ or failed/ when it ends
+INCOMING = "incoming"
+ACTIVE = "active"
+DONE = "done"
+FAILED = "failed"
+
+STATUS_FILENAME = "service.json"
+
+# Script run for each job mode
+MODES = {"download": "synapse_download", "upload": "synapse_uploading2"}
+
+HEARTBEAT_SECONDS = 30
+# A service whose heartbeat is older than this is taken for dead by submit
+STALE_SECONDS = 300
+
+_print_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    """
+    Print one service line to the service's own output, flushed.
+    """
+    with _print_lock:
+        print(message, file=sys.__stdout__, flush=True)
+
+
+def now() -> str:
+    return time.strftime("%a %b %d %H:%M:%S %Y")
+
+
+def write_json(path: Path, data: Dict) -> None:
+    """
+    Replace `path` atomically, so the service never reads a half-written job.
+    """
+    temp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(temp, path)
+
+
+def open_spool(spool_dir: Path) -> Path:
+    spool = Path(spool_dir).expanduser().resolve()
+    for name in (INCOMING, ACTIVE, DONE, FAILED):
+        (spool / name).mkdir(parents=True, exist_ok=True)
+    return spool
+
+
+def read_status(spool: Path) -> Optional[Dict]:
+    try:
+        return json.loads((spool / STATUS_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def service_alive(spool: Path, max_age: float = STALE_SECONDS) -> bool:
+    """
+    True when a service is serving `spool`: its status file says so and its
+    heartbeat is recent.
+    """
+    status = read_status(spool)
+    if not status or status.get("state") != "serving":
+        return False
+    return time.time() - status.get("heartbeat", 0) <= max_age
+
+
+def new_job_id() -> str:
+    return f"svc{time.strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:4]}"
+
+
+def submit_job(spool: Path, job: Dict) -> Path:
+    """
+    Drop a job into the spool. File names sort by submission time, which is
+    the order jobs of one project are run in.
+    """
+    job.setdefault("job_id", new_job_id())
+    job.setdefault("submitted", time.time())
+    path = spool / INCOMING / f"{time.time_ns():020d}_{job['job_id']}.json"
+    write_json(path, job)
+    return path
+
+
+class FairQueue:
+    """
+    Jobs waiting to run, one FIFO per project, served round-robin: after a
+    job of one project runs, every other project with work waiting gets a
+    turn before the same project runs again. An agent submitting a long
+    stream of manifests for one project therefore cannot starve the others.
+    """
+
+    def __init__(self):
+        self._projects: "OrderedDict[str, Deque[Dict]]" = OrderedDict()
+
+    def add(self, job: Dict) -> None:
+        self._projects.setdefault(job.get("project") or "", deque()).append(job)
+
+    def pop(self) -> Optional[Dict]:
+        for project in list(self._projects):
+            jobs = self._projects.pop(project)
+            if not jobs:
+                continue
+            job = jobs.popleft()
+            # The project goes to the back of the rotation
+            if jobs:
+                self._projects[project] = jobs
+            return job
+        return None
+
+    def counts(self) -> Dict[str, int]:
+        return {project: len(jobs) for project, jobs in self._projects.items() if jobs}
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self._projects.values())
+
+
+class TransferService:
+    """
+    Resident runner for the download and upload scripts.
+
+    One process logs in to Synapse once and keeps the session, with its
+    HTTP connection pool and the imported client, for every job. Jobs are
+    JSON files in the spool's incoming/ directory, each naming a mode
+    (download/upload), a project, the script's arguments and the output
+    file to write. They are run one at a time, fairly across projects, by
+    calling the script's main() with the warm session; its output goes to
+    the job's output file, ending in LSF's "Successfully completed." or
+    "Exited with exit code N." line, and its --summary_json next to it.
+
+    A status file with a heartbeat tells submitters whether the service is
+    up. Jobs left in active/ by a service that was killed are run again on
+    restart; the transfer ledgers make the repeated work cheap.
+    """
+
+    def __init__(
+        self,
+        syn,
+        spool: Path,
+        poll_seconds: float = 5.0,
+        idle_exit_seconds: float = 0.0,
+        max_seconds: float = 0.0,
+        printer: Callable[[str], None] = log,
+    ):
+        self.syn = syn
+        self.spool = spool
+        self.poll_seconds = max(0.1, poll_seconds)
+        self.idle_exit_seconds = idle_exit_seconds
+        self.max_seconds = max_seconds
+        self.printer = printer
+        self.queue = FairQueue()
+        self.started = time.time()
+        self.current: Optional[str] = None
+        self.completed = 0
+        self.failed = 0
+        self.state = "serving"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def write_status(self) -> None:
+        with self._lock:
+            write_json(self.spool / STATUS_FILENAME, {
+                "state": self.state,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "job_id": os.environ.get("LSB_JOBID"),
+                "started": self.started,
+                "heartbeat": time.time(),
+                "current": self.current,
+                "queued": self.queue.counts(),
+                "completed": self.completed,
+                "failed": self.failed,
+            })
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            self.write_status()
+
+    def recover(self) -> int:
+        """
+        Return jobs a killed service left in active/ to incoming/.
+        """
+        jobs = sorted((self.spool / ACTIVE).glob("*.json"))
+        for path in jobs:
+            os.replace(path, self.spool / INCOMING / path.name)
+        return len(jobs)
+
+    def scan(self) -> int:
+        """
+        Claim every new job in incoming/ and queue it. Returns the number
+        of jobs claimed.
+        """
+        claimed = 0
+        for path in sorted((self.spool / INCOMING).glob("*.json")):
+            active = self.spool / ACTIVE / path.name
+            try:
+                os.replace(path, active)
+                job = json.loads(active.read_text(encoding="utf-8"))
+                if job.get("mode") not in MODES:
+                    raise ValueError(f"unknown mode {job.get('mode')!r}")
+                if not isinstance(job.get("args"), list):
+                    raise ValueError("'args' must be a list")
+            except (OSError, ValueError) as exc:
+                self.printer(f"❌ REJECTED: job {path.name}: {exc}")
+                if active.exists():
+                    os.replace(active, self.spool / FAILED / path.name)
+                continue
+            job["spool_file"] = path.name
+            self.queue.add(job)
+            claimed += 1
+        return claimed
+
+    def job_args(self, job: Dict) -> List[str]:
+        args = [str(arg) for arg in job["args"]]
+        if job.get("summary_json") and "--summary_json" not in args:
+            args += ["--summary_json", str(job["summary_json"])]
+        return args
+
+    def run_job(self, job: Dict) -> int:
+        """
+        Run one job with the warm session and return its exit code. Output
+        of the script and of its worker threads goes to the job's output
+        file while it runs; only one job runs at a time, so nothing else is
+        printing.
+        """
+        job_id = job.get("job_id", job["spool_file"])
+        output = Path(job.get("output_file") or self.spool / DONE / f"{job_id}_OUTPUT.txt")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        args = self.job_args(job)
+        started = time.time()
+        with output.open("a", encoding="utf-8") as handle, redirect_stdout(handle), redirect_stderr(handle):
+            print(f"Job <{job_id}>: <{job.get('jobname', job_id)}> run by synapse_service on {socket.gethostname()}")
+            print(f"Project: {job.get('project', '')}")
+            print(f"Started at {now()}")
+            print(f"Command: {MODES[job['mode']]}.py {' '.join(args)}")
+            print("-" * 60, flush=True)
+            try:
+                module = importlib.import_module(MODES[job["mode"]])
+                code = module.main(args, syn=self.syn)
+            except SystemExit as exc:
+                if isinstance(exc.code, str):
+                    print(exc.code)
+                    code = 1
+                else:
+                    code = exc.code or 0
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            code = code or 0
+            print("-" * 60)
+            print("Successfully completed." if code == 0 else f"Exited with exit code {code}.")
+            print(f"Run time : {int(time.time() - started)} sec.")
+            print(f"Terminated at {now()}", flush=True)
+
+        job.update({"output_file": str(output), "exit_code": code, "started": started, "finished": time.time()})
+        spool_file = job.pop("spool_file")
+        write_json(self.spool / (DONE if code == 0 else FAILED) / spool_file, job)
+        (self.spool / ACTIVE / spool_file).unlink(missing_ok=True)
+        return code
+
+    def serve(self) -> None:
+        recovered = self.recover()
+        if recovered:
+            self.printer(f"🔁 Requeued {recovered} jobs left running by a previous service")
+        self.write_status()
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        self.printer(f"Serving spool {self.spool} (pid {os.getpid()} on {socket.gethostname()})")
+        idle_since = time.monotonic()
+        try:
+            while True:
+                if self.max_seconds and time.time() - self.started >= self.max_seconds:
+                    self.printer("⏹️  Reached --max_hours; no new jobs are taken")
+                    break
+                if self.scan():
+                    self.write_status()
+                job = self.queue.pop()
+                if job is None:
+                    if self.idle_exit_seconds and time.monotonic() - idle_since >= self.idle_exit_seconds:
+                        self.printer("⏹️  Idle for --idle_exit_minutes; stopping")
+                        break
+                    time.sleep(self.poll_seconds)
+                    continue
+                with self._lock:
+                    self.current = job.get("job_id")
+                self.write_status()
+                self.printer(f"▶️  {job.get('job_id')}: {job['mode']} for project '{job.get('project', '')}'")
+                started = time.monotonic()
+                code = self.run_job(job)
+                with self._lock:
+                    self.current = None
+                    if code == 0:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                status = "✅ Completed" if code == 0 else f"❌ Exited with code {code}"
+                self.printer(f"{status}: {job.get('job_id')} in {time.monotonic() - started:.0f}s -> {job['output_file']}")
+                self.write_status()
+                idle_since = time.monotonic()
+        finally:
+            # Jobs claimed but not started go back for the next service
+            self.state = "stopped"
+            self._stop.set()
+            while True:
+                job = self.queue.pop()
+                if job is None:
+                    break
+                os.replace(self.spool / ACTIVE / job["spool_file"], self.spool / INCOMING / job["spool_file"])
+            self.write_status()
+        self.printer(f"Stopped: {self.completed} jobs completed, {self.failed} failed")
+
+
+def serve(args: argparse.Namespace) -> int:
+    from synapse_download import synapse_login
+
+    spool = open_spool(args.spool_dir)
+    if service_alive(spool):
+        status = read_status(spool)
+        raise SystemExit(f"A service is already serving {spool} (pid {status.get('pid')} on {status.get('host')})")
+    syn = synapse_login(args.tokenfile_path)
+    # Import the scripts now rather than in the first job
+    for module in MODES.values():
+        importlib.import_module(module)
+    service = TransferService(
+        syn, spool, args.poll_seconds, args.idle_exit_minutes * 60, args.max_hours * 3600
+    )
+    service.serve()
+    return 0
+
+
+def submit(args: argparse.Namespace) -> int:
+    spool = open_spool(args.spool_dir)
+    if not args.force and not service_alive(spool, args.max_age):
+        print(f"No live synapse_service on {spool}; not queued.", file=sys.stderr)
+        return 3
+    script_args = args.script_args[1:] if args.script_args[:1] == ["--"] else args.script_args
+    job = {
+        "mode": args.mode,
+        "project": args.project,
+        "args": script_args,
+        "output_file": str(Path(args.output_file).expanduser().resolve()),
+    }
+    if args.job_id:
+        job["job_id"] = args.job_id
+    if args.jobname:
+        job["jobname"] = args.jobname
+    if args.summary_json:
+        job["summary_json"] = str(Path(args.summary_json).expanduser().resolve())
+    path = submit_job(spool, job)
+    # One line on stdout for the LSF wrappers to capture: job ID, spool file
+    # and the LSF job running the service
+    print(job["job_id"], path, (read_status(spool) or {}).get("job_id") or "-")
+    return 0
+
+
+def find_job(spool: Path, job_id: str) -> Optional[Tuple[str, Path]]:
+    """
+    (spool directory name, path) of the job file with this ID, or None.
+    """
+    for name in (DONE, FAILED, ACTIVE, INCOMING):
+        for path in (spool / name).glob(f"*_{job_id}.json"):
+            return name, path
+    return None
+
+
+def job_state(spool: Path, job_id: str) -> Optional[Dict]:
+    """
+    State of one submitted job in bjobs terms: PEND while waiting, RUN while
+    the service runs it, DONE or EXIT (with its exit code) once it ended.
+    None when no job has this ID.
+    """
+    found = find_job(spool, job_id)
+    if found is None:
+        return None
+    where, path = found
+    try:
+        job = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        job = {}
+    if where in (DONE, FAILED):
+        state = "DONE" if where == DONE else "EXIT"
+    elif where == ACTIVE and (read_status(spool) or {}).get("current") == job_id:
+        state = "RUN"
+    else:
+        state = "PEND"
+    return {
+        "job_id": job_id,
+        "state": state,
+        "exit_code": job.get("exit_code"),
+        "output_file": job.get("output_file"),
+        "spool_file": str(path),
+    }
+
+
+def job(args: argparse.Namespace) -> int:
+    spool = open_spool(args.spool_dir)
+    info = job_state(spool, args.job_id)
+    if info is None:
+        print(f"Job <{args.job_id}> is not found in {spool}")
+        return 1
+    service = read_status(spool) or {}
+    exit_code = f" (exit code {info['exit_code']})" if info["state"] == "EXIT" else ""
+    print(f"Job <{args.job_id}>: {info['state']}{exit_code}")
+    print(f"Output: {info['output_file'] or '-'}")
+    print(f"Spool file: {info['spool_file']}")
+    print(f"Service: LSF job {service.get('job_id') or '-'} on {service.get('host') or '-'}")
+    return 0
+
+
+def status(args: argparse.Namespace) -> int:
+    spool = open_spool(args.spool_dir)
+    info = read_status(spool)
+    if info is None:
+        print(f"No service has served {spool}")
+        return 1
+    age = time.time() - info.get("heartbeat", 0)
+    alive = service_alive(spool)
+    print(f"State: {info.get('state')} ({'alive' if alive else 'not responding'}, heartbeat {age:.0f}s ago)")
+    print(f"Host: {info.get('host')} pid {info.get('pid')} LSF job {info.get('job_id')}")
+    print(f"Running: {info.get('current') or '-'}")
+    print(f"Waiting: {len(list((spool / INCOMING).glob('*.json')))} unclaimed, {info.get('queued') or {}} queued")
+    print(f"Finished: {info.get('completed', 0)} completed, {info.get('failed', 0)} failed")
+    return 0 if alive else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Resident Synapse transfer service: one warm, logged-in session runs the download and "
+            "upload manifests queued in a spool directory, fairly across projects."
+        ),
+        epilog=f"Examples:\n  {USAGE}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the service on a spool directory.")
+    serve_parser.add_argument(
+        "--authToken",
+        "--tokenfile",
+        dest="tokenfile_path",
+        required=True,
+        type=Path,
+        help="Path to a file containing a Synapse personal access token.",
+    )
+    serve_parser.add_argument("--spool_dir", required=True, type=Path, help="Spool directory jobs are submitted to.")
+    serve_parser.add_argument(
+        "--poll_seconds", type=float, default=5, help="Seconds between looks for new jobs when idle (default: 5)."
+    )
+    serve_parser.add_argument(
+        "--idle_exit_minutes", type=float, default=0, help="Stop after this long without jobs; 0 never (default: 0)."
+    )
+    serve_parser.add_argument(
+        "--max_hours",
+        type=float,
+        default=0,
+        help="Take no new jobs after this many hours, e.g. a little under the LSF -W limit; 0 no limit (default: 0).",
+    )
+    serve_parser.set_defaults(func=serve)
+
+    submit_parser = commands.add_parser(
+        "submit", help="Queue one manifest; prints the job ID, spool file and service LSF job ID."
+    )
+    submit_parser.add_argument("--spool_dir", required=True, type=Path, help="Spool directory of the service.")
+    submit_parser.add_argument("--mode", choices=sorted(MODES), required=True)
+    submit_parser.add_argument("--project", required=True, help="Project the job is scheduled under.")
+    submit_parser.add_argument("--output_file", required=True, type=Path, help="File receiving the job's output.")
+    submit_parser.add_argument("--summary_json", type=Path, default=None, help="Passed to the script as --summary_json.")
+    submit_parser.add_argument("--job_id", default=None, help="Job ID (default: generated).")
+    submit_parser.add_argument("--jobname", default=None, help="Job name shown in the output file.")
+    submit_parser.add_argument(
+        "--max_age",
+        type=float,
+        default=STALE_SECONDS,
+        help=f"Refuse (exit 3) when the service heartbeat is older than this many seconds (default: {STALE_SECONDS}).",
+    )
+    submit_parser.add_argument("--force", action="store_true", help="Queue even when no service is running.")
+    submit_parser.add_argument(
+        "script_args", nargs=argparse.REMAINDER, help="Arguments of synapse_download.py/synapse_uploading2.py, after --."
+    )
+    submit_parser.set_defaults(func=submit)
+
+    status_parser = commands.add_parser("status", help="Show the service state and queue.")
+    status_parser.add_argument("--spool_dir", required=True, type=Path, help="Spool directory of the service.")
+    status_parser.set_defaults(func=status)
+
+    job_parser = commands.add_parser("job", help="Show the state of one submitted job, like bjobs.")
+    job_parser.add_argument("--spool_dir", required=True, type=Path, help="Spool directory of the service.")
+    job_parser.add_argument("job_id", help="Job ID printed by submit (svc...).")
+    job_parser.set_defaults(func=job)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import glob
+import heapq
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from synapse_entities import file_size, is_folder_type
+from synapse_ledger import TransferLedger
+from synapse_manifest import iter_manifest_rows, open_manifest
+from synapse_metrics import format_size
+from synapse_retry import build_retry_policy, call_with_retry
+
+USAGE = (
+    "python synapse_shard.py plan --mode download --file_path files_to_download.csv "
+    "--shards 4 --output_dir shards/ --authToken synapse_token.txt\n"
+    "  python synapse_shard.py merge --output shards/summary.json shards/summary_*.json"
+)
+
+PLAN_FILENAME = "plan.json"
+
+
+def shard_name(index: int) -> str:
+    """
+    File name of shard `index` (1-based); the LSF wrapper relies on it.
+    """
+    return f"shard_{index:02d}.csv"
+
+
+def assign_shards(sizes: List[int], shards: int) -> Tuple[List[int], List[int]]:
+    """
+    Bin-pack items into `shards` bins balanced by total bytes: items are
+    placed largest first, each into the currently lightest bin (LPT greedy).
+    Ties keep manifest order, so the same manifest always gives the same
+    plan. Returns (bin of each item, bytes per bin).
+    """
+    shards = max(1, shards)
+    loads = [(0, shard) for shard in range(shards)]
+    heapq.heapify(loads)
+    assignment = [0] * len(sizes)
+    for item in sorted(range(len(sizes)), key=lambda item: (-sizes[item], item)):
+        load, shard = heapq.heappop(loads)
+        assignment[item] = shard
+        heapq.heappush(loads, (load + sizes[item], shard))
+    totals = [0] * shards
+    for load, shard in loads:
+        totals[shard] = load
+    return assignment, totals
+
+
+def manifest_header(path: Path) -> List[str]:
+    """
+    Column names of a manifest.
+    """
+    manifest = Path(path).expanduser()
+    try:
+        with open_manifest(manifest) as handle:
+            fieldnames = iter_manifest_rows(handle, manifest).fieldnames
+    except OSError as exc:
+        raise SystemExit(f"Unable to read manifest '{manifest}': {exc}") from exc
+    if not fieldnames:
+        raise SystemExit(f"Manifest '{manifest}' has no header row.")
+    return list(fieldnames)
+
+
+def iter_rows(path: Path) -> Iterator[Dict[str, str]]:
+    """
+    Stream the rows of a manifest, unmodified. The planner reads the
+    manifest twice (sizes, then shard files) instead of holding it in memory.
+    """
+    manifest = Path(path).expanduser()
+    with open_manifest(manifest) as handle:
+        yield from iter_manifest_rows(handle, manifest)
+
+
+def local_size(path: str) -> int:
+    """
+    Size of a local file; 0 for missing files.
+    """
+    try:
+        return os.path.getsize(os.path.expanduser(path or ""))
+    except OSError:
+        return 0
+
+
+def folder_size(syn, folder_id: str) -> int:
+    """
+    Total bytes of the files under a Synapse folder. Only subfolders are
+    listed; each folder's file bytes come from the children endpoint's
+    sumFileSizesBytes, so files are never enumerated one by one.
+    """
+    total = 0
+    folders = [folder_id]
+    while folders:
+        parent_id = folders.pop()
+        token = None
+        first_page = True
+        while True:
+            body = {"parentId": parent_id, "includeTypes": ["folder"], "includeSumFileSizes": first_page}
+            if token:
+                body["nextPageToken"] = token
+            response = syn.restPOST("/entity/children", body=json.dumps(body))
+            if first_page:
+                total += int(response.get("sumFileSizesBytes") or 0)
+                first_page = False
+            folders.extend(child["id"] for child in response.get("page", []))
+            token = response.get("nextPageToken")
+            if not token:
+                break
+    return total
+
+
+def remote_sizes(syn, synapse_ids: List[str], workers: int) -> List[int]:
+    """
+    Remote sizes of the manifest's synapse_id entities, fetched
+    concurrently: file sizes from their file handles, folder sizes summed
+    over the folder tree. Entities that cannot be read count as 0 bytes.
+    """
+    retry = build_retry_policy(workers, workers, retries=5)
+
+    def size_of(synapse_id: str) -> int:
+        if not synapse_id:
+            return 0
+        try:
+            entity = call_with_retry(retry, synapse_id, syn.get, synapse_id, downloadFile=False)
+            if is_folder_type(entity.get("concreteType", "")):
+                return call_with_retry(retry, synapse_id, folder_size, syn, synapse_id)
+            return file_size(entity) or 0
+        except Exception as exc:
+            print(f"⚠️  Warning: Could not size {synapse_id}: {exc}", flush=True)
+            return 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(size_of, synapse_ids))
+
+
+def write_shards(
+    fieldnames: List[str], rows: Iterable[Dict[str, str]], assignment: List[int], shards: int, output_dir: Path
+) -> List[Path]:
+    """
+    Write one CSV per shard (rows in manifest order); empty shards get
+    just the header so every expected file exists.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = [output_dir / shard_name(shard + 1) for shard in range(shards)]
+    handles = [path.open("w", newline="", encoding="utf-8") for path in paths]
+    try:
+        writers = [csv.DictWriter(handle, fieldnames=fieldnames, extrasaction="ignore") for handle in handles]
+        for writer in writers:
+            writer.writeheader()
+        for row, shard in zip(rows, assignment):
+            writers[shard].writerow(row)
+    finally:
+        for handle in handles:
+            handle.close()
+    return paths
+
+
+def plan(args: argparse.Namespace) -> int:
+    fieldnames = manifest_header(args.file_path)
+    if args.mode == "upload":
+        column = "files" if "files" in fieldnames else fieldnames[0]
+        sizes = [local_size(row.get(column)) for row in iter_rows(args.file_path)]
+    else:
+        if "synapse_id" not in fieldnames:
+            raise SystemExit("Download manifests must contain a 'synapse_id' column.")
+        if args.tokenfile_path is None:
+            raise SystemExit("--authToken is required to size a download manifest.")
+        from synapse_download import synapse_login
+
+        syn = synapse_login(args.tokenfile_path)
+        synapse_ids = [(row.get("synapse_id") or "").strip() for row in iter_rows(args.file_path)]
+        print(f"Fetching remote sizes of {len(synapse_ids)} entities with {args.workers} workers...", flush=True)
+        sizes = remote_sizes(syn, synapse_ids, args.workers)
+
+    assignment, totals = assign_shards(sizes, args.shards)
+    output_dir = args.output_dir.expanduser().resolve()
+    paths = write_shards(fieldnames, iter_rows(args.file_path), assignment, len(totals), output_dir)
+
+    counts = [0] * len(totals)
+    for shard in assignment:
+        counts[shard] += 1
+    summary = {
+        "mode": args.mode,
+        "manifest": str(args.file_path.expanduser().resolve()),
+        "total_bytes": sum(sizes),
+        "shards": [
+            {"path": str(path), "rows": rows_in_shard, "bytes": nbytes}
+            for path, rows_in_shard, nbytes in zip(paths, counts, totals)
+        ],
+    }
+    (output_dir / PLAN_FILENAME).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    print(f"\n📦 Shard Plan ({args.mode}, {len(sizes)} rows, {format_size(sum(sizes))}):")
+    for shard in summary["shards"]:
+        print(f"   {Path(shard['path']).name}: {shard['rows']} rows, {format_size(shard['bytes'])}")
+    print(f"Plan written to {output_dir / PLAN_FILENAME}")
+    return 0
+
+
+def merge_ledgers(target: Path, patterns: List[str]) -> None:
+    """
+    Fold the shards' ledgers into `target`, the ledger that unsharded
+    runs and synapse_verify.py open by default.
+    """
+    paths = sorted({path for pattern in patterns for path in glob.glob(os.path.expanduser(pattern))})
+    ledger = TransferLedger(target)
+    try:
+        for path in paths:
+            try:
+                rows = ledger.merge_from(Path(path))
+            except sqlite3.Error as exc:
+                print(f"⚠️  Warning: Could not merge shard ledger '{path}': {exc}")
+                continue
+            print(f"Merged {rows} rows of {path} into {ledger.path}")
+    finally:
+        ledger.close()
+
+
+def merge(args: argparse.Namespace) -> int:
+    paths = sorted({path for pattern in args.summaries for path in glob.glob(os.path.expanduser(pattern))})
+    counts: Dict[str, int] = {}
+    total_bytes = 0
+    seconds = 0.0
+    shards = []
+    for path in paths:
+        try:
+            summary = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            print(f"⚠️  Warning: Could not read shard summary '{path}': {exc}")
+            continue
+        shards.append(path)
+        for status, count in summary.get("counts", {}).items():
+            counts[status] = counts.get(status, 0) + int(count)
+        total_bytes += int(summary.get("bytes") or 0)
+        seconds = max(seconds, float(summary.get("seconds") or 0))
+
+    if args.ledger and args.shard_ledgers:
+        merge_ledgers(args.ledger, args.shard_ledgers)
+
+    missing = max(0, (args.expected or 0) - len(shards))
+    merged = {
+        "shards": shards,
+        "missing_shards": missing,
+        "counts": counts,
+        "bytes": total_bytes,
+        "seconds": seconds,
+    }
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(merged, indent=2), encoding="utf-8")
+
+    print(f"\n📊 Merged Summary ({len(shards)} shards):")
+    for status, count in sorted(counts.items()):
+        print(f"   {status}: {count} files")
+    print(f"   📦 Transferred: {format_size(total_bytes)} in {seconds:.0f}s (slowest shard)")
+    if missing:
+        print(f"   ❌ Missing: {missing} shard summaries; those shards did not finish")
+    if args.output:
+        print(f"Merged summary written to {args.output}")
+    return 1 if missing or counts.get("failed") else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Split a transfer manifest into shards balanced by bytes for parallel LSF jobs, "
+            "and merge the per-shard summaries afterwards."
+        ),
+        epilog=f"Examples:\n  {USAGE}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = commands.add_parser("plan", help="Write shard_NN.csv files balanced by total bytes.")
+    plan_parser.add_argument("--mode", choices=["download", "upload"], required=True)
+    plan_parser.add_argument("--file_path", required=True, type=Path, help="Manifest to split (CSV/TSV, optionally .gz).")
+    plan_parser.add_argument("--shards", required=True, type=int, help="Number of shards (LSF jobs).")
+    plan_parser.add_argument("--output_dir", required=True, type=Path, help="Directory for the shard CSVs and plan.json.")
+    plan_parser.add_argument(
+        "--authToken",
+        "--tokenfile",
+        dest="tokenfile_path",
+        type=Path,
+        default=None,
+        help="Synapse token file; required for download manifests, whose sizes are remote.",
+    )
+    plan_parser.add_argument(
+        "--workers", type=int, default=8, help="Concurrent metadata requests when sizing downloads (default: 8)."
+    )
+    plan_parser.set_defaults(func=plan)
+
+    merge_parser = commands.add_parser("merge", help="Combine per-shard --summary_json files, and optionally the shard ledgers.")
+    merge_parser.add_argument("summaries", nargs="+", help="Shard summary files or glob patterns.")
+    merge_parser.add_argument("--output", type=Path, default=None, help="Write the merged summary to this file.")
+    merge_parser.add_argument(
+        "--expected", type=int, default=None, help="Number of shards submitted; missing summaries are reported."
+    )
+    merge_parser.add_argument(
+        "--ledger",
+        type=Path,
+        default=None,
+        help="Ledger to fold the --shard_ledgers into, normally the default .synapse_ledger.sqlite.",
+    )
+    merge_parser.add_argument(
+        "--shard_ledgers",
+        nargs="+",
+        default=None,
+        help="Shard ledger files or glob patterns to fold into --ledger.",
+    )
+    merge_parser.set_defaults(func=merge)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from synapse_entities import is_file_type, is_folder_type
+from synapse_ledger import TransferLedger
+from synapse_metrics import format_size
+from synapse_retry import RetryPolicy, call_with_retry
+from synapse_verify import fetch_remote_content
+
+SNAPSHOT_FILENAME = ".synapse_snapshot.sqlite"
+
+# Kind of a snapshot entry
+FILE = "file"
+FOLDER = "folder"
+
+# State of a remote file against its local copy, as answered by delta()
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    root_id         TEXT NOT NULL,
+    synapse_id      TEXT NOT NULL,
+    parent_id       TEXT,
+    kind            TEXT NOT NULL,
+    path            TEXT NOT NULL,
+    version         INTEGER,
+    etag            TEXT,
+    modified_on     TEXT,
+    size            INTEGER,
+    md5             TEXT,
+    file_handle_id  TEXT,
+    PRIMARY KEY (root_id, synapse_id)
+);
+CREATE TABLE IF NOT EXISTS roots (
+    root_id     TEXT PRIMARY KEY,
+    folders     INTEGER,
+    files       INTEGER,
+    bytes       INTEGER,
+    refreshed   REAL NOT NULL
+)
+"""
+
+COLUMNS = ("synapse_id", "parent_id", "kind", "path", "version", "etag", "modified_on", "size", "md5", "file_handle_id")
+
+
+class RemoteSnapshot:
+    """
+    Local SQLite index of remote Synapse folder trees, so repeated downloads
+    of a large tree only fetch metadata for, and only hand to the
+    downloader, the files that changed.
+
+    Every file and folder under a root folder is recorded with its path
+    relative to the root, version, etag, modifiedOn, and for files the
+    size, MD5 and file handle. refresh() lists the tree again and reuses
+    the recorded size and MD5 of every file whose version and modifiedOn
+    are unchanged; only new or modified files cost an entity GET and a
+    share of a /fileHandle/batch request. delta() then compares the tree
+    with the local copy.
+
+    Every folder is still listed on refresh: a Synapse folder's etag and
+    modifiedOn do not change when files are added to or changed inside
+    it, so the folder metadata cannot tell which subtrees to skip.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=60)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def entries(self, root_id: str, kind: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        The recorded entries of a tree by Synapse ID, optionally of one kind.
+        """
+        query = "SELECT * FROM entries WHERE root_id = ?"
+        params: Tuple = (root_id,)
+        if kind:
+            query += " AND kind = ?"
+            params += (kind,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {row["synapse_id"]: dict(row) for row in rows}
+
+    def root(self, root_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM roots WHERE root_id = ?", (root_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _list_tree(
+        self, syn, root_id: str, workers: int, retry: Optional[RetryPolicy]
+    ) -> Tuple[Dict[str, Dict], List[str]]:
+        """
+        List every folder under `root_id`, one level at a time with
+        `workers` folders listed at once. Returns the entries found, without
+        size or MD5, and the folders that could not be listed.
+        """
+        def list_children(folder_id: str) -> List[Dict]:
+            return call_with_retry(retry, folder_id, lambda: list(syn.getChildren(folder_id)))
+
+        found: Dict[str, Dict] = {}
+        unlisted: List[str] = []
+        level = [(root_id, "")]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            while level:
+                futures = [(folder_id, path, pool.submit(list_children, folder_id)) for folder_id, path in level]
+                level = []
+                for folder_id, path, future in futures:
+                    try:
+                        children = future.result()
+                    except Exception:
+                        unlisted.append(folder_id)
+                        continue
+                    for child in children:
+                        child_type = child.get("type") or child.get("concreteType", "")
+                        child_path = f"{path}/{child.get('name')}" if path else child.get("name")
+                        if is_file_type(child_type):
+                            kind = FILE
+                        elif is_folder_type(child_type):
+                            kind = FOLDER
+                            level.append((child.get("id"), child_path))
+                        else:
+                            continue
+                        found[child.get("id")] = {
+                            "synapse_id": child.get("id"),
+                            "parent_id": folder_id,
+                            "kind": kind,
+                            "path": child_path,
+                            "version": child.get("versionNumber"),
+                            "modified_on": child.get("modifiedOn"),
+                        }
+        return found, unlisted
+
+    def refresh(
+        self,
+        syn,
+        root_id: str,
+        workers: int = 4,
+        retry: Optional[RetryPolicy] = None,
+        printer: Callable[[str], None] = print,
+    ) -> Dict[str, int]:
+        """
+        Bring the snapshot of `root_id` up to date with Synapse. Files whose
+        version and modifiedOn match the snapshot keep their recorded
+        metadata; the others are looked up. Entries that disappeared are
+        dropped, except under folders that could not be listed, which keep
+        their previous entries. Returns counts of what was found and done.
+        """
+        started = time.monotonic()
+        previous = self.entries(root_id)
+        found, unlisted = self._list_tree(syn, root_id, workers, retry)
+        for folder_id in unlisted:
+            printer(f"⚠️  Warning: Could not list children of {folder_id}; keeping its previous snapshot")
+
+        lookup = []
+        for entry in found.values():
+            if entry["kind"] != FILE:
+                continue
+            known = previous.get(entry["synapse_id"])
+            if (
+                known is not None
+                and known["size"] is not None
+                and known["version"] == entry["version"]
+                and known["modified_on"] == entry["modified_on"]
+            ):
+                entry.update({key: known[key] for key in ("etag", "size", "md5", "file_handle_id")})
+            else:
+                lookup.append({"synapse_id": entry["synapse_id"], "version": entry["version"]})
+        if lookup:
+            fetch_remote_content(syn, lookup, workers, retry)
+            for record in lookup:
+                if record.get("detail"):
+                    printer(f"⚠️  Warning: No metadata for {record['synapse_id']}: {record['detail']}")
+                found[record["synapse_id"]].update({
+                    "etag": record.get("etag"),
+                    "size": record.get("remote_size"),
+                    "md5": record.get("remote_md5"),
+                    "file_handle_id": record.get("file_handle_id"),
+                })
+
+        # Keep what was under folders that could not be listed this time
+        kept = set(unlisted)
+        changed = True
+        while changed:
+            changed = False
+            for synapse_id, entry in previous.items():
+                if entry["parent_id"] in kept and synapse_id not in found:
+                    found[synapse_id] = entry
+                    if entry["kind"] == FOLDER and synapse_id not in kept:
+                        kept.add(synapse_id)
+                        changed = True
+        removed = [synapse_id for synapse_id in previous if synapse_id not in found]
+
+        files = [entry for entry in found.values() if entry["kind"] == FILE]
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE root_id = ?", (root_id,))
+            self._conn.executemany(
+                f"INSERT INTO entries (root_id, {', '.join(COLUMNS)}) VALUES (?, {', '.join('?' for _ in COLUMNS)})",
+                [(root_id, *(entry.get(column) for column in COLUMNS)) for entry in found.values()],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO roots (root_id, folders, files, bytes, refreshed) VALUES (?, ?, ?, ?, ?)",
+                (root_id, len(found) - len(files), len(files), sum(entry.get("size") or 0 for entry in files), time.time()),
+            )
+            self._conn.commit()
+
+        counts = {
+            "folders": len(found) - len(files),
+            "files": len(files),
+            "looked_up": len(lookup),
+            "reused": len(files) - len(lookup),
+            "removed": len(removed),
+            "unlisted": len(unlisted),
+        }
+        printer(
+            f"🗂️  Snapshot of {root_id}: {counts['files']} files in {counts['folders']} folders "
+            f"({format_size(sum(entry.get('size') or 0 for entry in files))}); metadata fetched for "
+            f"{counts['looked_up']}, reused for {counts['reused']}, {counts['removed']} removed remotely, "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+        return counts
+
+    def delta(
+        self, root_id: str, local_root: Path, ledger: Optional[TransferLedger] = None
+    ) -> Dict[str, List[Dict]]:
+        """
+        Compare the snapshot of `root_id` with its local copy under
+        `local_root`. Every file is NEW (no local file), UNCHANGED or
+        CHANGED, decided as prepare_download() does: unchanged when the
+        ledger has verified its download at the current version, changed
+        when the ledger marks it stale, and otherwise (no ledger, or a file
+        the ledger has no row for) unchanged when the local size matches.
+        Entries are download plan entries
+        (synapse_id, save_path, version, size, md5, file_handle_id); CHANGED
+        entries also carry 'overwrite', so the local copy is replaced.
+        """
+        local_root = Path(local_root)
+        delta: Dict[str, List[Dict]] = {NEW: [], CHANGED: [], UNCHANGED: []}
+        for entry in sorted(self.entries(root_id, FILE).values(), key=lambda entry: entry["path"]):
+            save_path = str(local_root / entry["path"])
+            file_info = {
+                "synapse_id": entry["synapse_id"],
+                "save_path": save_path,
+                "version": entry["version"],
+                "size": entry["size"],
+                "md5": entry["md5"],
+                "file_handle_id": entry["file_handle_id"],
+            }
+            try:
+                local_size = os.path.getsize(save_path)
+            except OSError:
+                delta[NEW].append(file_info)
+                continue
+            if ledger is not None and ledger.is_verified("download", entry["synapse_id"], save_path, entry["version"]):
+                same = True
+            elif ledger is not None and ledger.is_stale("download", entry["synapse_id"], save_path, entry["version"]):
+                same = False
+            else:
+                same = entry["size"] is not None and local_size == entry["size"]
+            if not same:
+                file_info["overwrite"] = True
+            delta[UNCHANGED if same else CHANGED].append(file_info)
+        return delta
+
+
+def open_snapshot(path: Optional[Path], default_dir: Path, enabled: bool = True) -> Optional[RemoteSnapshot]:
+    """
+    Open the snapshot index at `path`, or at SNAPSHOT_FILENAME inside
+    `default_dir`. Returns None when snapshots are disabled.
+    """
+    if not enabled:
+        return None
+    snapshot = RemoteSnapshot(Path(path) if path else Path(default_dir) / SNAPSHOT_FILENAME)
+    print(f"Remote snapshot index: {snapshot.path}")
+    return snapshot
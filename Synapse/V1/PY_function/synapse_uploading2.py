@@ -1,12 +1,31 @@
 import argparse
-import csv
+import inspect
+import json
+import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from itertools import chain
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from synapseclient import File, Synapse
 from synapseclient.core.exceptions import SynapseError
-from typing import List, Dict
+
+from synapse_hashing import FileHasher, HashCache, default_hash_cache_path, md5_file
+from synapse_ledger import TransferLedger, open_ledger
+from synapse_manifest import chunked, iter_manifest_rows, open_manifest
+from synapse_metrics import Transfer, TransferMetrics
+from synapse_mirror import FolderTree, common_root
+from synapse_plan import CONFLICT, INVALID, SKIP, UPLOAD, TransferPlan
+from synapse_retry import RetryPolicy, build_retry_policy, call_with_retry, pool_size
+
+# synapseclient's upload_file_handle, imported on first use by
+# load_upload_file_handle() since it pulls in the multipart upload machinery
+_NOT_LOADED = object()
+upload_file_handle = _NOT_LOADED
+
 #files,resourceType,dataType,specimenID,assay,/path/to/file1.bam,genomic,exome,WU-734_Tumor,WGS,/path/to/file2.fastq,sequence,RNA,WU-561_Normal,RNAseq
 
 
@@ -14,9 +33,37 @@ USAGE = (
     "python synapse_uploading.py "
     "--authToken synapse_token.txt "
     "--file_path files_to_upload.csv "
-    "--parent_id syn12345"
+    "--parent_id syn12345 "
+    "--workers 4"
 )
 
+# Outcome of a single CSV row
+UPLOADED = "uploaded"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# Outcome of an annotation-only row
+UPDATED = "updated"
+
+# Manifest columns that are never applied as annotations
+NON_ANNOTATION_COLUMNS = ("files", "synapse_id", "org_files")
+
+# Remote state of a local file, as answered by ParentIndex.compare() and compare_existing()
+NEW = "new"
+SAME = "same"
+CHANGED = "changed"
+
+# Worker threads print through log() so their lines never interleave
+_print_lock = threading.Lock()
+
+
+def log(message: str) -> None:
+    """
+    Print one progress line, flushed, without interleaving with other threads.
+    """
+    with _print_lock:
+        print(message, flush=True)
+
 
 def synapse_login(token_file_path: Path) -> Synapse:
     token_path = token_file_path.expanduser()
@@ -41,28 +88,65 @@ def synapse_login(token_file_path: Path) -> Synapse:
     return syn
 
 
-def load_file_list(csv_path: Path) -> List[Dict[str, str]]:
+def accepts_known_md5(function: Callable) -> bool:
+    """
+    True if an upload_file_handle takes the precomputed 'md5' and
+    'file_size' keyword arguments (older clients hash the file themselves).
+    """
+    try:
+        parameters = inspect.signature(function).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    names = {parameter.name for parameter in parameters}
+    return {"md5", "file_size"} <= names or any(
+        parameter.kind is inspect.Parameter.VAR_KEYWORD for parameter in parameters
+    )
+
+
+def load_upload_file_handle() -> Optional[Callable]:
+    """
+    Return the client's upload_file_handle, importing it on first use.
+    None for a client without it, or whose upload_file_handle cannot take
+    a precomputed MD5: syn.store() then hashes the file itself.
+    """
+    global upload_file_handle
+    if upload_file_handle is _NOT_LOADED:
+        try:
+            from synapseclient.core.upload.upload_functions import upload_file_handle as loaded
+        except ImportError:
+            loaded = None
+        upload_file_handle = loaded if loaded is not None and accepts_known_md5(loaded) else None
+    return upload_file_handle
+
+
+def manifest_file_column(fieldnames: List[str]) -> str:
     """
-    Load a CSV that contains at least a 'files' column and optionally
+    The column holding local file paths: 'files', or else the first column.
+    """
+    return "files" if "files" in fieldnames else fieldnames[0]
+
+
+def iter_file_list(csv_path: Path) -> Iterator[Dict[str, str]]:
+    """
+    Stream a manifest that contains at least a 'files' column and optionally
     annotation columns like resourceType, dataType, specimenID, assay.
-    Returns a list of dicts, one per row.
+    Yields one dict per row without loading the whole file. CSV and TSV
+    (.tsv) manifests are accepted, optionally gzip-compressed (.gz).
     """
     csv_file = csv_path.expanduser()
     try:
-        with csv_file.open(newline="", encoding="utf-8") as handle:
-            reader = csv.DictReader(handle)
+        with open_manifest(csv_file) as handle:
+            reader = iter_manifest_rows(handle, csv_file)
             if reader.fieldnames is None:
                 raise SystemExit("CSV file must contain a header row with a 'files' column.")
 
-            column = "files" if "files" in reader.fieldnames else reader.fieldnames[0]
+            column = manifest_file_column(reader.fieldnames)
 
-            rows = []
             for row in reader:
                 if not row.get(column):
                     continue
                 row["files"] = str(Path(row[column]).expanduser())
-                rows.append(row)
-            return rows
+                yield row
     except OSError as exc:
         raise SystemExit(f"Unable to read CSV file '{csv_file}': {exc}") from exc
 
@@ -108,56 +192,653 @@ def check_synapse_id(syn: Synapse, parent_id: str) -> None:
             raise SystemExit(f"Pipeline stopped: Cannot access Synapse ID '{parent_id}'") from exc  
 
 
-def upload_files(syn: Synapse, parent_id: str, rows: List[Dict[str, str]]) -> None:
+class ParentIndex:
+    """
+    In-memory index of the entities directly under a Synapse parent.
+    The children are listed once (getChildren pages through the results), so
+    skip decisions are answered locally instead of with one findEntityId call
+    per CSV row. Each name maps to (id, md5, size); md5 and size are fetched
+    lazily, and only for names that collide with a local file.
+    """
+
+    def __init__(self, syn: Synapse, parent_id: str):
+        self.syn = syn
+        self.parent_id = parent_id
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def build(self) -> "ParentIndex":
+        for child in self.syn.getChildren(self.parent_id):
+            self._entries[child["name"]] = {"id": child["id"], "md5": None, "size": None, "resolved": False}
+        return self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, name: str) -> Optional[str]:
+        """
+        Return the Synapse ID of the child called `name`, or None.
+        """
+        entry = self._entries.get(name)
+        return entry["id"] if entry else None
+
+    def add(self, name: str, synapse_id: str, md5: Optional[str] = None, size: Optional[int] = None) -> None:
+        """
+        Record an entity stored during this run so later rows see it.
+        """
+        with self._lock:
+            self._entries[name] = {"id": synapse_id, "md5": md5, "size": size, "resolved": md5 is not None}
+
+    def remote_content(self, name: str) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Return (md5, size) of the remote file called `name`, fetching its file
+        handle on first use.
+        """
+        entry = self._entries[name]
+        if not entry["resolved"]:
+            md5, size = file_handle_content(self.syn, entry["id"])
+            with self._lock:
+                entry["md5"] = md5
+                entry["size"] = size
+                entry["resolved"] = True
+        return entry["md5"], entry["size"]
+
+    def compare(self, file_path: Path, md5_of: Callable[[str], str]) -> str:
+        """
+        Compare a local file with the remote child of the same name.
+        Returns NEW if no such child exists, SAME if size and MD5 match, and
+        CHANGED for the same name with different content. The local MD5 is
+        only computed, with `md5_of`, when the sizes agree.
+        """
+        if self.lookup(file_path.name) is None:
+            return NEW
+        return compare_content(file_path, *self.remote_content(file_path.name), md5_of)
+
+
+def file_handle_content(syn: Synapse, synapse_id: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Return (md5, size) of the file handle of entity `synapse_id`.
+    """
+    entity = syn.get(synapse_id, downloadFile=False)
+    file_handle = entity.get("_file_handle") or {}
+    size = file_handle.get("contentSize")
+    return file_handle.get("contentMd5"), int(size) if size is not None else None
+
+
+def compare_content(
+    file_path: Path, remote_md5: Optional[str], remote_size: Optional[int], md5_of: Callable[[str], str]
+) -> str:
+    """
+    SAME if a local file has the remote size and MD5, CHANGED otherwise.
+    The local MD5 is only computed, with `md5_of`, when the sizes agree.
+    """
+    if remote_size is not None and remote_size != file_path.stat().st_size:
+        return CHANGED
+    if remote_md5 is None or remote_md5 != md5_of(str(file_path)):
+        return CHANGED
+    return SAME
+
+
+def compare_existing(
+    syn: Synapse,
+    existing_id: str,
+    file_path: Path,
+    md5_of: Callable[[str], str],
+    index: Optional[ParentIndex] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> str:
+    """
+    Compare a local file with `existing_id`, the remote file of the same
+    name: through `index` when the parent could be listed, otherwise with
+    the entity's own file handle. Returns SAME or CHANGED.
+    """
+    if index is not None:
+        return index.compare(file_path, md5_of)
+    remote_md5, remote_size = call_with_retry(retry, file_path.name, file_handle_content, syn, existing_id)
+    return compare_content(file_path, remote_md5, remote_size, md5_of)
+
+
+def store_file(
+    syn: Synapse,
+    parent_id: str,
+    file_path: Path,
+    annotations: Dict[str, str],
+    md5: Optional[str] = None,
+    transfer: Optional[Transfer] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Dict:
+    """
+    Upload a local file into parent_id as a File entity with annotations.
+    When the MD5 is already known the file handle is created with it, so
+    the client does not read the whole file again just to hash it.
+    The bytes ("upload") and the entity API call ("store") are timed as
+    separate phases of `transfer` and retried separately under `retry`, so
+    a failed store does not send the bytes again.
+    """
+    transfer = transfer or Transfer(None, parent_id, str(file_path))
+    entity = None
+    upload_handle = load_upload_file_handle() if md5 is not None else None
+    if upload_handle is not None:
+        with transfer.phase("upload"):
+            file_handle = call_with_retry(
+                retry,
+                str(file_path),
+                upload_handle,
+                syn,
+                parent_id,
+                str(file_path),
+                md5=md5,
+                file_size=file_path.stat().st_size,
+                on_retry=transfer.count_retry,
+            )
+        entity = File(parent=parent_id, name=file_path.name, dataFileHandleId=file_handle["id"])
+    if entity is None:
+        entity = File(str(file_path), parent=parent_id)
+
+    # Attach annotations
+    if annotations:
+        entity.annotations = annotations
+    with transfer.phase("store"):
+        return call_with_retry(retry, str(file_path), syn.store, entity, on_retry=transfer.count_retry)
+
+
+def upload_single_file(
+    syn: Synapse,
+    parent_id: str,
+    row: Dict[str, str],
+    index: Optional[ParentIndex] = None,
+    on_change: str = "skip",
+    ledger: Optional[TransferLedger] = None,
+    hasher: Optional[FileHasher] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> str:
+    """
+    Upload the file of one CSV row to Synapse.
+    The MD5 comes from `hasher` (cached, or computed ahead of time in its
+    process pool) when one is given.
+    If a file with the same name already exists in the parent it is skipped,
+    unless on_change is "version": then its content is compared (with the
+    entity's file handle when the parent could not be listed) and a new
+    version is uploaded when it differs. A file the ledger recorded as
+    uploaded, and which has not changed locally since, is skipped without
+    any remote check.
+    Returns UPLOADED, SKIPPED or FAILED.
+    """
+    file_path = Path(row["files"])
+    transfer = Transfer(metrics, parent_id, row["files"])
+    if not file_path.exists():
+        log(f"❌ FAILED: File '{file_path}' listed in CSV does not exist.")
+        return transfer.finish(FAILED, error="local file does not exist")
+
+    local_path = str(file_path.resolve())
+    size = file_path.stat().st_size
+    if ledger is not None and ledger.is_verified("upload", parent_id, local_path):
+        log(f"⏭️  SKIPPED: '{file_path}' already uploaded (ledger)")
+        return transfer.finish(SKIPPED, size)
+
+    filename = file_path.name
+    new_version = False
+    try:
+        with transfer.phase("lookup"):
+            if index is not None:
+                existing_id = index.lookup(filename)
+            else:
+                existing_id = call_with_retry(retry, filename, syn.findEntityId, filename, parent_id)
+
+        if existing_id and on_change == "version":
+            with transfer.phase("compare"):
+                state = compare_existing(
+                    syn, existing_id, file_path, hasher.md5 if hasher is not None else md5_file, index, retry
+                )
+            if state == SAME:
+                if ledger is not None:
+                    ledger.finish("upload", parent_id, local_path, entity_id=existing_id)
+                log(f"⏭️  SKIPPED: '{file_path}' is unchanged in Synapse (ID: {existing_id})")
+                return transfer.finish(SKIPPED, size)
+            log(f"🔄 CHANGED: '{file_path}' differs from Synapse ID {existing_id}; uploading a new version")
+            new_version = True
+        elif existing_id:
+            log(f"⏭️  SKIPPED: '{file_path}' already exists in Synapse (ID: {existing_id})")
+            return transfer.finish(SKIPPED, size)
+
+    except Exception as e:
+        log(f"⚠️  Warning: Could not check for existing files: {e}")
+        # Continue with upload if we can't check for existing files
+
+    # File doesn't exist, proceed with upload
+    # Extract annotations if present
+    annotations = {}
+    for key in ["resourceType", "dataType", "specimenID", "assay"]:
+        if key in row and row[key]:
+            annotations[key] = row[key]
+
+    try:
+        if ledger is not None:
+            ledger.start("upload", parent_id, local_path)
+        with transfer.phase("hash"):
+            md5 = hasher.md5(local_path) if hasher is not None else None
+        stored = store_file(syn, parent_id, file_path, annotations, md5, transfer, retry)
+        if index is not None:
+            index.add(filename, stored['id'])
+        if ledger is not None:
+            file_handle = stored.get('_file_handle') or {}
+            ledger.finish(
+                "upload",
+                parent_id,
+                local_path,
+                entity_id=stored['id'],
+                version=stored.get('versionNumber'),
+                md5=file_handle.get('contentMd5') or md5,
+            )
+        version_note = " (new version)" if new_version else ""
+        log(f"✅ UPLOADED: '{file_path}' -> Synapse ID {stored['id']}{version_note}")
+        return transfer.finish(UPLOADED, size, moved=True)
+    except Exception as e:
+        log(f"❌ FAILED: Could not upload '{file_path}': {e}")
+        if ledger is not None:
+            ledger.fail("upload", parent_id, local_path)
+        return transfer.finish(FAILED, size, error=str(e))
+
+
+def build_parent_index(syn: Synapse, parent_id: str) -> Optional[ParentIndex]:
+    """
+    List the parent's children once into a ParentIndex.
+    Returns None if the listing fails, in which case rows fall back to one
+    findEntityId lookup each.
+    """
+    try:
+        index = ParentIndex(syn, parent_id).build()
+    except Exception as e:
+        print(f"⚠️  Warning: Could not list existing files in {parent_id}: {e}")
+        print("   Falling back to one existence check per file.")
+        return None
+    print(f"Indexed {len(index)} existing entities in {parent_id}")
+    return index
+
+
+def local_size(path: str) -> int:
+    """
+    Size of a local file, 0 if it cannot be read.
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def needs_upload_hash(
+    row: Dict[str, str],
+    parent_id: str,
+    index: Optional[ParentIndex],
+    on_change: str,
+    ledger: Optional[TransferLedger],
+) -> bool:
+    """
+    Cheap local guess of whether a row will need its MD5, so hashing can
+    start early: the file exists and is neither skipped by the ledger nor,
+    in skip mode, by an existing name in the parent.
+    """
+    file_path = Path(row["files"])
+    if not file_path.is_file():
+        return False
+    if ledger is not None and ledger.is_verified("upload", parent_id, str(file_path.resolve())):
+        return False
+    return on_change == "version" or index is None or index.lookup(file_path.name) is None
+
+
+def upload_files(
+    syn: Synapse,
+    parent_id: str,
+    rows: Iterable[Dict[str, str]],
+    workers: int = 1,
+    on_change: str = "skip",
+    ledger: Optional[TransferLedger] = None,
+    chunk_size: int = 1000,
+    hasher: Optional[FileHasher] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+    small_file_bytes: int = 0,
+    small_workers: int = 0,
+    tree: Optional[FolderTree] = None,
+) -> Dict[str, int]:
     """
     Upload files to Synapse, skipping files that already exist.
+    Existing names are looked up in a ParentIndex built with one listing of
+    the parent. Up to `workers` rows are processed at once, so the hashing and
+    transfer of one file overlap with those of the others.
+    Rows are read `chunk_size` at a time, so a streamed manifest is never
+    held in memory as a whole. With a hasher, the checksums of a chunk's
+    files are queued in its process pool before their uploads start.
+    Each chunk's files and bytes are announced to `metrics` for progress/ETA.
+    With a `retry` policy the pool is sized to its adaptive limit, which then
+    decides how many transfers run at once.
+    Files smaller than `small_file_bytes` go to a lane of their own with
+    `small_workers` threads and adaptive limit: their cost is per-request
+    latency rather than bandwidth, so they run at a much higher concurrency
+    than the large files, and are hashed in the worker thread instead of
+    the process pool. Synapse has no bulk upload endpoint, so each is still
+    a separate upload and store, with its annotations.
+    With a FolderTree, each file goes into the folder mirroring its local
+    directory: the folders a chunk needs are resolved (listed or created)
+    level by level before its uploads start, and each folder gets its own
+    ParentIndex, listed once; folders created by this run are not listed.
+    A failing row is reported and counted without stopping the rest.
     """
-    uploaded_count = 0
-    skipped_count = 0
+    counts = {UPLOADED: 0, SKIPPED: 0, FAILED: 0}
+    index = build_parent_index(syn, parent_id) if tree is None else None
+    indexes: Dict[str, Optional[ParentIndex]] = {}
+    small_lane = bool(small_file_bytes and small_workers)
+    small_retry = retry.lane(small_workers) if small_lane and retry is not None else retry
+    small_files = 0
+
+    with ThreadPoolExecutor(max_workers=pool_size(workers, retry)) as pool, (
+        ThreadPoolExecutor(max_workers=pool_size(small_workers, small_retry)) if small_lane else nullcontext()
+    ) as small_pool:
+        for chunk in chunked(rows, chunk_size):
+            sizes = [local_size(row["files"]) for row in chunk]
+            if metrics is not None:
+                metrics.expect(len(chunk), sum(sizes))
+            parents = [parent_id] * len(chunk)
+            if tree is not None:
+                keys = [tree.key(row["files"]) for row in chunk]
+                tree.ensure(key for key in keys if key is not None)
+                parents = [tree.folder_id(key) if key is not None else None for key in keys]
+                unindexed = sorted({folder_id for folder_id in parents if folder_id} - set(indexes))
+                for folder_id, folder_index in zip(unindexed, pool.map(
+                    lambda folder_id: ParentIndex(syn, folder_id) if tree.is_new(folder_id)
+                    else build_parent_index(syn, folder_id),
+                    unindexed,
+                )):
+                    indexes[folder_id] = folder_index
+            futures = {}
+            for row, size, row_parent in zip(chunk, sizes, parents):
+                if row_parent is None:
+                    log(f"❌ FAILED: No Synapse folder for '{row['files']}' (outside the mirror root or not created)")
+                    counts[Transfer(metrics, parent_id, row["files"]).finish(FAILED, error="no mirror folder")] += 1
+                    continue
+                row_index = indexes[row_parent] if tree is not None else index
+                if small_lane and 0 < size < small_file_bytes:
+                    small_files += 1
+                    future = small_pool.submit(
+                        upload_single_file, syn, row_parent, row, row_index, on_change, ledger, None, metrics, small_retry
+                    )
+                else:
+                    if hasher is not None and needs_upload_hash(row, row_parent, row_index, on_change, ledger):
+                        hasher.submit(row["files"])
+                    future = pool.submit(
+                        upload_single_file, syn, row_parent, row, row_index, on_change, ledger, hasher, metrics, retry
+                    )
+                futures[future] = row
+            for future in as_completed(futures):
+                try:
+                    status = future.result()
+                except Exception as e:
+                    log(f"❌ FAILED: Could not upload '{futures[future]['files']}': {e}")
+                    status = FAILED
+                counts[status] += 1
     
-    for row in rows:
-        file_path = Path(row["files"])
-        if not file_path.exists():
-            raise SystemExit(f"File '{file_path}' listed in CSV does not exist.")
+    # Print summary
+    print(f"\n📊 Upload Summary:")
+    print(f"   ✅ Uploaded: {counts[UPLOADED]} files")
+    print(f"   ⏭️  Skipped: {counts[SKIPPED]} files")
+    print(f"   ❌ Failed: {counts[FAILED]} files")
+    print(f"   📁 Total processed: {sum(counts.values())} files")
+    if small_files:
+        print(f"   🐜 Small-file lane: {small_files} files with {small_workers} workers")
+    if tree is not None:
+        print(f"   📁 Mirrored folders: {tree.summary()}")
+    return counts
+
+
+def plan_upload_action(
+    syn: Synapse,
+    parent_id: str,
+    row: Dict[str, str],
+    index: Optional[ParentIndex] = None,
+    on_change: str = "skip",
+    ledger: Optional[TransferLedger] = None,
+    hasher: Optional[FileHasher] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Tuple[str, str, Optional[str]]:
+    """
+    The action upload_single_file() would take for one row, why, and the ID
+    of the existing entity of the same name (if any). Remote sizes are
+    fetched only for names that already exist, and files are hashed only in
+    version mode when the sizes agree. In skip mode a name whose remote size
+    differs from the local file is a CONFLICT: a real run leaves it as is.
+    """
+    file_path = Path(row["files"])
+    if not file_path.is_file():
+        return INVALID, "local file does not exist", None
+    if ledger is not None and ledger.is_verified("upload", parent_id, str(file_path.resolve())):
+        return SKIP, "uploaded and unchanged (ledger)", None
 
-        # Check if file already exists in Synapse using findEntityId (more efficient)
-        filename = file_path.name
+    filename = file_path.name
+    if index is not None:
+        existing_id = index.lookup(filename)
+    else:
+        existing_id = call_with_retry(retry, filename, syn.findEntityId, filename, parent_id)
+    if not existing_id:
+        return UPLOAD, "new file", None
+    if on_change == "version":
+        md5_of = hasher.md5 if hasher is not None else md5_file
+        if compare_existing(syn, existing_id, file_path, md5_of, index, retry) == SAME:
+            return SKIP, "unchanged in Synapse", existing_id
+        return UPLOAD, "new version: content differs", existing_id
+    if index is None:
+        return SKIP, "name exists in Synapse", existing_id
+    _, remote_size = index.remote_content(filename)
+    if remote_size is not None and remote_size != file_path.stat().st_size:
+        return CONFLICT, "name exists in Synapse with a different size; kept (use --on_change version)", existing_id
+    return SKIP, "name exists in Synapse", existing_id
+
+
+def plan_uploads(
+    syn: Synapse,
+    parent_id: str,
+    rows: Iterable[Dict[str, str]],
+    plan: TransferPlan,
+    workers: int = 1,
+    on_change: str = "skip",
+    ledger: Optional[TransferLedger] = None,
+    chunk_size: int = 1000,
+    hasher: Optional[FileHasher] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Dict[str, Tuple[int, int]]:
+    """
+    --plan mode: decide the action of every row against one listing of the
+    parent, `workers` rows at a time, and write it to `plan` without
+    uploading anything. Returns the plan's totals per action.
+    """
+    index = build_parent_index(syn, parent_id)
+
+    def decide(row: Dict[str, str]) -> None:
         try:
-            existing_id = syn.findEntityId(filename, parent_id)
-            if existing_id:
-                print(f"⏭️  SKIPPED: '{file_path}' already exists in Synapse (ID: {existing_id})", flush=True)
-                skipped_count += 1
-                continue
-                
+            action, reason, existing_id = plan_upload_action(
+                syn, parent_id, row, index, on_change, ledger, hasher, retry
+            )
         except Exception as e:
-            print(f"⚠️  Warning: Could not check for existing files: {e}")
-            # Continue with upload if we can't check for existing files
+            action, reason, existing_id = INVALID, f"could not be checked: {e}", None
+        size = local_size(row["files"]) if action != INVALID else None
+        plan.add(action, existing_id, row["files"], size, reason)
+
+    with ThreadPoolExecutor(max_workers=pool_size(workers, retry)) as pool:
+        for chunk in chunked(rows, chunk_size):
+            list(pool.map(decide, chunk))
+    return plan.close()
 
-        # File doesn't exist, proceed with upload
-        entity = File(str(file_path), parent=parent_id)
 
-        # Extract annotations if present
-        annotations = {}
-        for key in ["resourceType", "dataType", "specimenID", "assay"]:
-            if key in row and row[key]:
-                annotations[key] = row[key]
+def manifest_annotation_columns(csv_path: Path, requested: Optional[List[str]] = None) -> List[str]:
+    """
+    Annotation columns of a manifest: `requested` if given (each must exist),
+    otherwise every column except the file column and NON_ANNOTATION_COLUMNS.
+    """
+    csv_file = csv_path.expanduser()
+    with open_manifest(csv_file) as handle:
+        fieldnames = iter_manifest_rows(handle, csv_file).fieldnames or []
+    if requested:
+        missing = [column for column in requested if column not in fieldnames]
+        if missing:
+            raise SystemExit(f"Annotation columns not found in the CSV: {', '.join(missing)}")
+        return requested
+    file_column = manifest_file_column(fieldnames) if fieldnames else None
+    return [
+        column for column in fieldnames
+        if column != file_column and column not in NON_ANNOTATION_COLUMNS
+    ]
 
-        # Attach annotations
-        if annotations:
-            entity.annotations = annotations
 
+def annotation_entry(value: str, current_type: Optional[str]) -> Dict:
+    """
+    Synapse annotation (annotations2 format) for a CSV value. Numeric types
+    of an existing annotation are kept when the value still parses as one;
+    everything else is stored as STRING, as the upload path does.
+    """
+    if current_type in ("LONG", "DOUBLE"):
         try:
-            stored = syn.store(entity)
-            print(f"✅ UPLOADED: '{file_path}' -> Synapse ID {stored['id']}", flush=True)
-            uploaded_count += 1
-        except Exception as e:
-            print(f"❌ FAILED: Could not upload '{file_path}': {e}", flush=True)
-    
-    # Print summary
-    print(f"\n📊 Upload Summary:")
-    print(f"   ✅ Uploaded: {uploaded_count} files")
-    print(f"   ⏭️  Skipped: {skipped_count} files")
-    print(f"   📁 Total processed: {uploaded_count + skipped_count} files")
+            int(value) if current_type == "LONG" else float(value)
+            return {"type": current_type, "value": [value]}
+        except ValueError:
+            pass
+    return {"type": "STRING", "value": [value]}
+
+
+def annotation_changes(current: Dict[str, Dict], values: Dict[str, str]) -> Dict[str, Dict]:
+    """
+    The annotations among `values` that differ from `current`
+    (annotations2 format); values are compared as strings.
+    """
+    changes = {}
+    for key, value in values.items():
+        existing = current.get(key) or {}
+        if [str(item) for item in existing.get("value") or []] == [value]:
+            continue
+        changes[key] = annotation_entry(value, existing.get("type"))
+    return changes
+
+
+def update_annotations(
+    syn: Synapse,
+    entity_id: str,
+    values: Dict[str, str],
+    transfer: Optional[Transfer] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Dict[str, Dict]:
+    """
+    Merge `values` into the annotations of `entity_id` without touching its
+    file. The current annotations are read first and nothing is written when
+    every value already matches. A concurrent edit (HTTP 412, stale etag) is
+    retried once against fresh annotations. Returns the changes written.
+    """
+    transfer = transfer or Transfer(None, entity_id, "")
+    uri = f"/entity/{entity_id}/annotations2"
+    for attempt in range(2):
+        with transfer.phase("get_annotations"):
+            current = call_with_retry(retry, entity_id, syn.restGET, uri, on_retry=transfer.count_retry)
+        changes = annotation_changes(current.get("annotations") or {}, values)
+        if not changes:
+            return {}
+        body = dict(current, annotations={**(current.get("annotations") or {}), **changes})
+        try:
+            with transfer.phase("set_annotations"):
+                call_with_retry(retry, entity_id, syn.restPUT, uri, json.dumps(body), on_retry=transfer.count_retry)
+            return changes
+        except SynapseError as exc:
+            if attempt == 0 and "412" in str(exc):
+                continue
+            raise
+    return changes
+
+
+def annotate_single_row(
+    syn: Synapse,
+    parent_id: str,
+    row: Dict[str, str],
+    columns: List[str],
+    index: Optional[ParentIndex] = None,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> str:
+    """
+    Apply the annotation columns of one CSV row to its existing entity.
+    The entity is the row's 'synapse_id' when the manifest has one, otherwise
+    the child of parent_id named like the local file. Empty cells are left
+    alone. Returns UPDATED, SKIPPED (nothing changed) or FAILED.
+    """
+    filename = Path(row["files"]).name
+    transfer = Transfer(metrics, parent_id, row["files"])
+    values = {column: row[column] for column in columns if row.get(column)}
+    try:
+        entity_id = row.get("synapse_id")
+        if not entity_id:
+            with transfer.phase("lookup"):
+                if index is not None:
+                    entity_id = index.lookup(filename)
+                else:
+                    entity_id = call_with_retry(retry, filename, syn.findEntityId, filename, parent_id)
+        if not entity_id:
+            log(f"❌ FAILED: '{filename}' not found in Synapse parent {parent_id}")
+            return transfer.finish(FAILED, error="entity not found")
+        if not values:
+            log(f"⏭️  SKIPPED: '{filename}' has no annotation values in the CSV")
+            return transfer.finish(SKIPPED)
+
+        changes = update_annotations(syn, entity_id, values, transfer, retry)
+        if not changes:
+            log(f"⏭️  SKIPPED: annotations of '{filename}' ({entity_id}) are unchanged")
+            return transfer.finish(SKIPPED)
+        log(f"🏷️  UPDATED: '{filename}' ({entity_id}): {', '.join(sorted(changes))}")
+        return transfer.finish(UPDATED)
+    except Exception as e:
+        log(f"❌ FAILED: Could not update annotations of '{filename}': {e}")
+        return transfer.finish(FAILED, error=str(e))
+
+
+def annotate_files(
+    syn: Synapse,
+    parent_id: str,
+    rows: Iterable[Dict[str, str]],
+    columns: List[str],
+    workers: int = 1,
+    chunk_size: int = 1000,
+    use_index: bool = True,
+    metrics: Optional[TransferMetrics] = None,
+    retry: Optional[RetryPolicy] = None,
+) -> Dict[str, int]:
+    """
+    Annotation-only mode: update the annotations of already-uploaded
+    entities from the manifest without uploading any file content.
+    Rows are processed `chunk_size` at a time with `workers` concurrent
+    read-diff-write cycles; names are resolved with one listing of the
+    parent unless `use_index` is False (manifests with a synapse_id column).
+    """
+    counts = {UPDATED: 0, SKIPPED: 0, FAILED: 0}
+    index = build_parent_index(syn, parent_id) if use_index else None
+    print(f"Applying annotation columns: {', '.join(columns) or '(none)'}")
+
+    with ThreadPoolExecutor(max_workers=pool_size(workers, retry)) as pool:
+        for chunk in chunked(rows, chunk_size):
+            if metrics is not None:
+                metrics.expect(len(chunk))
+            futures = {
+                pool.submit(annotate_single_row, syn, parent_id, row, columns, index, metrics, retry): row
+                for row in chunk
+            }
+            for future in as_completed(futures):
+                try:
+                    status = future.result()
+                except Exception as e:
+                    log(f"❌ FAILED: Could not update annotations of '{futures[future]['files']}': {e}")
+                    status = FAILED
+                counts[status] += 1
+
+    print(f"\n📊 Annotation Summary:")
+    print(f"   🏷️  Updated: {counts[UPDATED]} entities")
+    print(f"   ⏭️  Unchanged: {counts[SKIPPED]} entities")
+    print(f"   ❌ Failed: {counts[FAILED]} entities")
+    print(f"   📁 Total processed: {sum(counts.values())} rows")
+    return counts
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -178,38 +859,270 @@ def build_parser() -> argparse.ArgumentParser:
         "--file_path",
         required=True,
         type=Path,
-        help="Path to a CSV file with a 'files' column listing local file paths.",
+        help="Path to a CSV/TSV file (optionally .gz) with a 'files' column listing local file paths.",
     )
     parser.add_argument(
         "--parent_id",
         required=True,
         help="Synapse ID of the destination project or folder (e.g., syn123).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of files uploaded concurrently (default: 4).",
+    )
+    parser.add_argument(
+        "--on_change",
+        choices=["skip", "version"],
+        default="skip",
+        help=(
+            "What to do when a file with the same name already exists in the parent: "
+            "'skip' it (default), or compare size/MD5 and upload a new 'version' if the content differs."
+        ),
+    )
+    parser.add_argument(
+        "--ledger",
+        type=Path,
+        default=None,
+        help=(
+            "SQLite transfer ledger used to skip files already uploaded and unchanged since "
+            "(default: .synapse_ledger.sqlite next to the CSV file)."
+        ),
+    )
+    parser.add_argument(
+        "--no_ledger",
+        action="store_true",
+        help="Do not use a transfer ledger; skip decisions rely on the Synapse parent listing only.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=1000,
+        help="Manifest rows read and uploaded per chunk, which bounds memory use (default: 1000).",
+    )
+    parser.add_argument(
+        "--hash_workers",
+        type=int,
+        default=2,
+        help="Processes computing file MD5s ahead of the uploads (default: 2).",
+    )
+    parser.add_argument(
+        "--hash_cache",
+        type=Path,
+        default=None,
+        help=(
+            "SQLite MD5 cache keyed by device, inode, size and mtime "
+            "(default: md5_cache.sqlite in SYNAPSE_CACHE_FOLDER)."
+        ),
+    )
+    parser.add_argument(
+        "--event_log",
+        type=Path,
+        default=None,
+        help="Append a JSON-lines event per transfer and phase (timings, bytes, retries, errors) to this file.",
+    )
+    parser.add_argument(
+        "--progress_interval",
+        type=float,
+        default=60,
+        help="Seconds between progress lines with aggregate MB/s and ETA; 0 disables them (default: 60).",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Retries per request on throttling (429), 5xx and connection errors, with jittered backoff (default: 5).",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=None,
+        help=(
+            "Upper bound for the adaptive number of concurrent uploads, which starts at --workers, "
+            "halves when Synapse throttles and grows back while it is healthy (default: 2 x --workers)."
+        ),
+    )
+    parser.add_argument(
+        "--small_file_mb",
+        type=float,
+        default=8,
+        help=(
+            "Files below this size (e.g. .bai indices) are uploaded in a separate high-concurrency lane; "
+            "0 disables it (default: 8)."
+        ),
+    )
+    parser.add_argument(
+        "--small_workers",
+        type=int,
+        default=None,
+        help="Concurrent uploads in the small-file lane (default: 4 x --workers).",
+    )
+    parser.add_argument(
+        "--mirror_root",
+        default=None,
+        help=(
+            "Recreate the local directory tree under --parent_id: each file is uploaded into the Synapse "
+            "folder matching its directory relative to this root, creating folders as needed. 'auto' uses "
+            "the deepest directory containing every file in the CSV."
+        ),
+    )
+    parser.add_argument(
+        "--annotations_only",
+        action="store_true",
+        help=(
+            "Do not upload anything: update the annotations of the entities already in --parent_id "
+            "(or named by a 'synapse_id' column) from the CSV, writing only those that changed."
+        ),
+    )
+    parser.add_argument(
+        "--annotation_columns",
+        default=None,
+        help=(
+            "Comma-separated CSV columns to apply in --annotations_only mode "
+            "(default: every column except files, synapse_id and org_files)."
+        ),
+    )
+    parser.add_argument(
+        "--summary_json",
+        type=Path,
+        default=None,
+        help="Write the final counts, bytes and duration to this JSON file (used to merge sharded jobs).",
+    )
+    parser.add_argument(
+        "--plan",
+        type=Path,
+        default=None,
+        help=(
+            "Dry run: compare every row with the ledger and the files already in --parent_id, then write "
+            "the action of each (upload/skip/conflict/invalid, with sizes) to this CSV. Nothing is uploaded."
+        ),
+    )
     return parser
 
 
-def main(argv=None) -> int:
+def main(argv=None, syn: Optional[Synapse] = None) -> int:
+    """
+    Run the upload script. `syn` is a logged-in session to reuse
+    (synapse_service.py); without one, the token file is used to log in.
+    """
     parser = build_parser()
     args = parser.parse_args(argv)
+    if args.plan and args.annotations_only:
+        parser.error("--plan cannot be combined with --annotations_only")
+    if args.mirror_root and (args.plan or args.annotations_only):
+        parser.error("--mirror_root cannot be combined with --plan or --annotations_only")
 
     # Login to Synapse
-    syn = synapse_login(args.tokenfile_path)
+    if syn is None:
+        syn = synapse_login(args.tokenfile_path)
     
     # Check if the Synapse parent ID exists and print its description
     check_synapse_id(syn, args.parent_id)
     
-    # Load file list from CSV
-    file_paths = load_file_list(args.file_path)
+    # Stream file list from CSV
+    file_paths = iter_file_list(args.file_path)
+    first_row = next(file_paths, None)
 
-    if not file_paths:
+    if first_row is None:
         print("No files found in the CSV; nothing to upload.", flush=True)
+        if args.summary_json:
+            TransferMetrics("upload", interval=0).write_summary(
+                args.summary_json, {UPLOADED: 0, SKIPPED: 0, FAILED: 0}, manifest=str(args.file_path)
+            )
+        return 0
+    file_paths = chain([first_row], file_paths)
+
+    if args.annotations_only:
+        requested = [column.strip() for column in (args.annotation_columns or "").split(",") if column.strip()]
+        columns = manifest_annotation_columns(args.file_path, requested)
+        metrics = TransferMetrics("annotate", args.event_log, args.progress_interval, printer=log)
+        retry = build_retry_policy(args.workers, args.max_workers, args.retries, printer=log)
+        try:
+            counts = annotate_files(
+                syn,
+                args.parent_id,
+                file_paths,
+                columns,
+                args.workers,
+                args.chunk_size,
+                use_index="synapse_id" not in first_row,
+                metrics=metrics,
+                retry=retry,
+            )
+        except SynapseError as exc:
+            raise SystemExit(f"Synapse annotation update failed: {exc}") from exc
+        finally:
+            metrics.close()
+        if args.summary_json:
+            metrics.write_summary(args.summary_json, counts, manifest=str(args.file_path))
+        print("Annotation update complete.", flush=True)
         return 0
 
+    ledger = open_ledger(args.ledger, args.file_path.expanduser().resolve().parent, enabled=not args.no_ledger)
+    retry = build_retry_policy(args.workers, args.max_workers, args.retries, printer=log)
+    if args.plan:
+        # Files are only hashed to compare content in version mode
+        hasher = None
+        if args.on_change == "version":
+            hasher = FileHasher(args.hash_workers, HashCache(args.hash_cache or default_hash_cache_path()))
+        try:
+            plan_uploads(
+                syn,
+                args.parent_id,
+                file_paths,
+                TransferPlan(args.plan, UPLOAD),
+                args.workers,
+                args.on_change,
+                ledger,
+                args.chunk_size,
+                hasher,
+                retry,
+            )
+        finally:
+            if hasher is not None:
+                hasher.close()
+            if ledger is not None:
+                ledger.close()
+        return 0
+
+    tree = None
+    if args.mirror_root:
+        if args.mirror_root == "auto":
+            root = common_root(row["files"] for row in iter_file_list(args.file_path))
+        else:
+            root = Path(args.mirror_root)
+        tree = FolderTree(syn, args.parent_id, root, args.workers, retry, printer=log)
+        print(f"Mirroring {tree.root} into {args.parent_id}")
+
+    hasher = FileHasher(args.hash_workers, HashCache(args.hash_cache or default_hash_cache_path()))
+    metrics = TransferMetrics("upload", args.event_log, args.progress_interval, printer=log)
     try:
-        upload_files(syn, args.parent_id, file_paths)
+        counts = upload_files(
+            syn,
+            args.parent_id,
+            file_paths,
+            args.workers,
+            args.on_change,
+            ledger,
+            args.chunk_size,
+            hasher,
+            metrics,
+            retry,
+            small_file_bytes=int(args.small_file_mb * 1024 * 1024),
+            small_workers=args.small_workers or 4 * max(1, args.workers),
+            tree=tree,
+        )
     except SynapseError as exc:
         raise SystemExit(f"Synapse upload failed: {exc}") from exc
+    finally:
+        metrics.close()
+        hasher.close()
+        if ledger is not None:
+            ledger.close()
 
+    if args.summary_json:
+        metrics.write_summary(args.summary_json, counts, manifest=str(args.file_path))
     print("Upload complete.", flush=True)
     return 0
 
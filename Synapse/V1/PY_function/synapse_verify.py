@@ -0,0 +1,334 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from synapse_hashing import FileHasher
+from synapse_ledger import TransferLedger, open_ledger
+from synapse_metrics import format_size
+from synapse_retry import RetryPolicy, build_retry_policy, call_with_retry
+
+USAGE = (
+    "python synapse_verify.py --authToken synapse_token.txt "
+    "--output_dir /path/to/downloads --workers 8 --hash_workers 4 --requeue"
+)
+
+# Outcome of verifying one downloaded file
+VERIFIED = "verified"
+MISSING = "missing"
+SIZE_MISMATCH = "size_mismatch"
+MD5_MISMATCH = "md5_mismatch"
+UNKNOWN = "unknown"
+
+REPORT_FILENAME = "verify_report.csv"
+REPORT_COLUMNS = ["status", "synapse_id", "local_path", "local_size", "remote_size", "local_md5", "remote_md5", "detail"]
+
+# File handles per /fileHandle/batch request
+FILE_HANDLE_BATCH_SIZE = 100
+
+
+def downloaded_files(ledger: TransferLedger, roots: Optional[Iterable[Path]] = None) -> List[Dict]:
+    """
+    One record per download the ledger holds as done, optionally limited
+    to files under one of the directories in `roots`.
+    """
+    prefixes = tuple(os.path.join(str(root), "") for root in roots) if roots is not None else ("",)
+    return [
+        {"synapse_id": row["synapse_id"], "local_path": row["local_path"], "version": row["version"]}
+        for row in ledger.rows("download")
+        if row["local_path"].startswith(prefixes)
+    ]
+
+
+def entity_metadata(syn, synapse_id: str, version: Optional[int] = None) -> Dict:
+    """
+    The entity as Synapse returns it, at `version` when one is given.
+    """
+    uri = f"/entity/{synapse_id}/version/{version}" if version else f"/entity/{synapse_id}"
+    return syn.restGET(uri)
+
+
+def fetch_remote_content(
+    syn, records: List[Dict], workers: int = 4, retry: Optional[RetryPolicy] = None
+) -> None:
+    """
+    Fill in 'remote_size' and 'remote_md5' (and the entity's 'etag') of
+    every record.
+    Synapse has no bulk lookup from entity to file handle, so the handle
+    IDs are read `workers` entities at a time; the handles themselves,
+    with their MD5 and size, then come FILE_HANDLE_BATCH_SIZE per
+    /fileHandle/batch request. Records that cannot be resolved get a
+    'detail' instead.
+    """
+    def lookup(record: Dict) -> None:
+        try:
+            entity = call_with_retry(
+                retry, record["synapse_id"], entity_metadata, syn, record["synapse_id"], record.get("version")
+            )
+        except Exception as exc:
+            record["detail"] = f"entity lookup failed: {exc}"
+            return
+        handle_id = entity.get("dataFileHandleId")
+        record["file_handle_id"] = str(handle_id) if handle_id is not None else None
+        record["etag"] = entity.get("etag")
+
+    def fetch_batch(batch: List[Dict]) -> None:
+        body = json.dumps({
+            "requestedFiles": [
+                {
+                    "fileHandleId": record["file_handle_id"],
+                    "associateObjectId": record["synapse_id"],
+                    "associateObjectType": "FileEntity",
+                }
+                for record in batch
+            ],
+            "includeFileHandles": True,
+            "includePreSignedURLs": False,
+        })
+        try:
+            response = call_with_retry(
+                retry, "file handle batch", syn.restPOST, "/fileHandle/batch", body, endpoint=syn.fileHandleEndpoint
+            )
+        except Exception as exc:
+            for record in batch:
+                record["detail"] = f"file handle lookup failed: {exc}"
+            return
+        handles = {
+            str(result.get("fileHandleId")): result.get("fileHandle") or {}
+            for result in response.get("requestedFiles", [])
+        }
+        for record in batch:
+            file_handle = handles.get(record["file_handle_id"])
+            if not file_handle:
+                record["detail"] = "file handle not returned"
+                continue
+            size = file_handle.get("contentSize")
+            record["remote_size"] = int(size) if size is not None else None
+            record["remote_md5"] = file_handle.get("contentMd5")
+
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lookup, records))
+        resolved = [record for record in records if record.get("file_handle_id")]
+        batches = [
+            resolved[start:start + FILE_HANDLE_BATCH_SIZE]
+            for start in range(0, len(resolved), FILE_HANDLE_BATCH_SIZE)
+        ]
+        list(pool.map(fetch_batch, batches))
+
+
+def verify_files(
+    syn,
+    records: List[Dict],
+    workers: int = 4,
+    hash_workers: int = 2,
+    retry: Optional[RetryPolicy] = None,
+    printer: Callable[[str], None] = print,
+) -> Dict[str, int]:
+    """
+    Compare every downloaded file with Synapse and set its 'status'.
+    Missing files and files whose size differs from the remote one (e.g. a
+    truncated copy) are flagged without reading them; the others are
+    hashed in `hash_workers` processes, largest first, and compared with
+    the remote MD5. Hashes are always computed from the file, never taken
+    from a cache. Returns the number of files per status.
+    """
+    fetch_remote_content(syn, records, workers, retry)
+
+    to_hash = []
+    for record in records:
+        try:
+            record["local_size"] = os.path.getsize(record["local_path"])
+        except OSError:
+            record["status"] = MISSING
+            continue
+        if record.get("remote_size") is None and not record.get("remote_md5"):
+            record["status"] = UNKNOWN
+        elif record.get("remote_size") is not None and record["local_size"] != record["remote_size"]:
+            record["status"] = SIZE_MISMATCH
+        elif not record.get("remote_md5"):
+            record["status"] = UNKNOWN
+            record["detail"] = record.get("detail") or "no remote MD5"
+        else:
+            to_hash.append(record)
+
+    total = sum(record["local_size"] for record in to_hash)
+    printer(f"🔍 Hashing {len(to_hash)} files ({format_size(total)}) with {hash_workers} processes...")
+    hasher = FileHasher(hash_workers)
+    try:
+        to_hash.sort(key=lambda record: record["local_size"], reverse=True)
+        futures = [(record, hasher.submit(record["local_path"])) for record in to_hash]
+        for record, future in futures:
+            try:
+                record["local_md5"] = future.result()
+            except Exception as exc:
+                record["status"] = UNKNOWN
+                record["detail"] = f"could not hash: {exc}"
+                continue
+            record["status"] = VERIFIED if record["local_md5"] == record["remote_md5"] else MD5_MISMATCH
+    finally:
+        hasher.close()
+
+    counts: Dict[str, int] = {}
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+        if record["status"] != VERIFIED:
+            printer(f"❌ {record['status'].upper()}: '{record['local_path']}' ({record['synapse_id']})")
+    return counts
+
+
+def write_report(path: Path, records: List[Dict]) -> int:
+    """
+    Write every file that did not verify to a CSV report. Returns the
+    number of rows written.
+    """
+    bad = [record for record in records if record["status"] != VERIFIED]
+    path = Path(path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=REPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for record in bad:
+            writer.writerow({column: record.get(column, "") for column in REPORT_COLUMNS})
+    return len(bad)
+
+
+def requeue(ledger: TransferLedger, records: List[Dict], manifest_path: Optional[Path] = None) -> List[Dict]:
+    """
+    Mark the files that are missing or differ from Synapse as failed in the
+    ledger, so the next download run fetches them again, and optionally
+    write them as a download manifest (synapse_id, save_path); save_path is
+    the file's directory, as synapse_download.py expects. Files whose
+    remote content is unknown are left alone. Returns the requeued records.
+    """
+    bad = [record for record in records if record["status"] in (MISSING, SIZE_MISMATCH, MD5_MISMATCH)]
+    for record in bad:
+        ledger.fail("download", record["synapse_id"], record["local_path"])
+    if manifest_path is not None and bad:
+        with Path(manifest_path).open("w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(["synapse_id", "save_path"])
+            for record in bad:
+                writer.writerow([record["synapse_id"], str(Path(record["local_path"]).parent)])
+    return bad
+
+
+def print_summary(counts: Dict[str, int]) -> None:
+    print("\n🔍 Verification Summary:")
+    print(f"   ✅ Verified: {counts.get(VERIFIED, 0)} files")
+    for status in (MISSING, SIZE_MISMATCH, MD5_MISMATCH, UNKNOWN):
+        if counts.get(status):
+            print(f"   ❌ {status.replace('_', ' ').capitalize()}: {counts[status]} files")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Verify downloaded files against the size and MD5 of their Synapse file handles, "
+            "using the download ledger to find them."
+        ),
+        epilog=f"Example:\n  {USAGE}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--authToken",
+        "--tokenfile",
+        dest="tokenfile_path",
+        required=True,
+        type=Path,
+        help="Path to a file containing a Synapse personal access token.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        required=True,
+        type=Path,
+        help=(
+            "Download directory to verify; only ledger entries under it are checked, unless --all_paths "
+            "is given."
+        ),
+    )
+    parser.add_argument(
+        "--all_paths",
+        action="store_true",
+        help=(
+            "Check every download in the ledger, including files that manifests saved to absolute "
+            "save_paths outside --output_dir."
+        ),
+    )
+    parser.add_argument(
+        "--ledger",
+        type=Path,
+        default=None,
+        help="Download ledger listing the files (default: <output_dir>/.synapse_ledger.sqlite).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Concurrent Synapse metadata requests (default: 4).",
+    )
+    parser.add_argument(
+        "--hash_workers",
+        type=int,
+        default=4,
+        help="Processes hashing local files (default: 4).",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Retries per request on throttling (429), 5xx and connection errors (default: 5).",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help=f"CSV listing every file that did not verify (default: <output_dir>/{REPORT_FILENAME}).",
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help=(
+            "Mark missing and mismatched files as failed in the ledger, so the next download run fetches "
+            "them again, and write them to <report>_requeue.csv as a download manifest."
+        ),
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    from synapse_download import synapse_login
+
+    output_dir = args.output_dir.expanduser().resolve()
+    ledger_path = args.ledger or output_dir / ".synapse_ledger.sqlite"
+    if not ledger_path.exists():
+        raise SystemExit(f"No download ledger at '{ledger_path}'; nothing to verify.")
+    ledger = open_ledger(ledger_path, output_dir)
+    try:
+        records = downloaded_files(ledger, None if args.all_paths else [output_dir])
+        where = f"in {ledger_path}" if args.all_paths else f"under {output_dir}"
+        print(f"Verifying {len(records)} downloaded files {where}...")
+        syn = synapse_login(args.tokenfile_path)
+        retry = build_retry_policy(args.workers, None, args.retries)
+        counts = verify_files(syn, records, args.workers, args.hash_workers, retry)
+        report = args.report or output_dir / REPORT_FILENAME
+        if write_report(report, records):
+            print(f"Mismatch report written to {report}")
+        if args.requeue:
+            manifest = report.with_name(f"{report.stem}_requeue.csv")
+            requeued = requeue(ledger, records, manifest)
+            if requeued:
+                print(f"🔁 Requeued {len(requeued)} files: marked failed in the ledger and listed in {manifest}")
+    finally:
+        ledger.close()
+    print_summary(counts)
+    return 1 if any(status != VERIFIED for status in counts if counts[status]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -31,6 +31,10 @@ cores=8
 # Fastq to BAM settings (higher memory for alignment)
 synapse_memory="20G"
 synapse_cores=4
+synapse_shards=4    # LSF jobs used by sh_files/1_Docker_synapse_sharded.sh
+synapse_cache_max_gb=100    # Size cap of the shared download cache in $GATK_HOME/.synapseCache/managed
+synapse_mirror_root=""    # Uploads: local root whose directory tree is recreated under synapse_parent_id ("auto" or empty for flat)
+synapse_service_spool="${SYNAPSE_SERVICE_SPOOL:-}"    # Spool of a running synapse_service.py (sh_files/1_Docker_synapse_service.sh); empty for one LSF job per CSV
     
 # if there is gpu
 PATH="/opt/conda/bin:/usr/local/cuda/bin:$PATH"
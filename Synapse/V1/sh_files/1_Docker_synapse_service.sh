@@ -0,0 +1,63 @@
+#!/usr/bin/bash
+#########################################################################
+# Start the resident Synapse transfer service as one long LSF job.
+# The service logs in once and runs every manifest that
+# 1_Docker_synapse_download.sh / 1_Docker_synapse_uploading2.sh queue in
+# its spool while synapse_service_spool is set in config_synapse.sh.
+#
+# Usage: 1_Docker_synapse_service.sh <config_synapse.sh> [spool_dir]
+#########################################################################
+
+# Load configuration file
+CONFIG_FILE="$1"
+
+if [[ -f "$CONFIG_FILE" ]]; then
+    source "$CONFIG_FILE"
+else
+    echo "Error: Config file '$CONFIG_FILE' not found!"
+    exit 1
+fi
+
+spool_dir="${2:-${synapse_service_spool:-$Working_engine/synapse_service}}"
+
+# Check required variables
+required_vars=(token_file_path PY_function_path GATK_path GATK_HOME)
+for var in "${required_vars[@]}"; do
+  if [ -z "${!var}" ]; then
+    echo "Error: Required variable $var is not set."
+    exit 1
+  fi
+done
+
+echo "Memory Allocation: $synapse_memory"
+echo "Cores: $synapse_cores"
+echo "Time Limit: $timeLimit"
+echo "Spool: $spool_dir"
+
+docker="$docker_synapse"
+echo "Docker is $docker"
+
+# Refuse a second service on the same spool
+if python3 ${PY_function_path}/synapse_service.py status --spool_dir "$spool_dir" >/dev/null 2>&1; then
+  echo "A synapse_service is already serving $spool_dir:"
+  python3 ${PY_function_path}/synapse_service.py status --spool_dir "$spool_dir"
+  exit 1
+fi
+
+jobname="synapse_service_$(date +%Y%m%d_%H%M%S)"
+output_file="$GATK_path/${jobname}_OUTPUT.txt"
+# Stop taking new manifests two hours before the LSF time limit
+max_hours=$(( timeLimit > 4 ? timeLimit - 2 : timeLimit ))
+# Submit the job to LSF and capture the job ID
+job_id=$(bsub -cwd "$GATK_HOME" -q general -n "$synapse_cores" -M "$synapse_memory" -G compute-hirbea \
+        -a "docker($docker)" -W "${timeLimit}:00" \
+        -o "$output_file" \
+        -J "$jobname" \
+        -R "rusage[mem=$synapse_memory] span[hosts=1]" /bin/bash -c \
+        "mkdir -p $GATK_HOME/.synapseCache && export SYNAPSE_CACHE_FOLDER=$GATK_HOME/.synapseCache && source /opt/conda/etc/profile.d/conda.sh && conda activate synapseclient && python3 ${PY_function_path}/synapse_service.py serve --authToken ${token_file_path} --spool_dir ${spool_dir} --max_hours ${max_hours}" | grep -o '<[0-9]*>' | sed 's/[<>]//g')
+
+echo "Synapse transfer service submitted with ID: $job_id"
+echo "Set synapse_service_spool=\"$spool_dir\" in config_synapse.sh (or export SYNAPSE_SERVICE_SPOOL) to queue manifests to it."
+
+# Save job id, output file name and spool to a file
+echo "$job_id $jobname $output_file $spool_dir" >> $GATK_path/${job_id}_INFO.txt
@@ -0,0 +1,123 @@
+#!/usr/bin/bash
+# Sharded Synapse transfer: one planning job splits the CSV into
+# $synapse_shards shards balanced by bytes, one transfer job per shard runs
+# on its own host, and a final job merges the per-shard summaries.
+# Usage: 1_Docker_synapse_sharded.sh config_synapse.sh download|upload
+#########################################################################
+#Part1
+# Must include all part 1 for the bsub running
+
+# Load configuration file
+CONFIG_FILE="$1"
+MODE="${2:-download}"
+
+if [[ -f "$CONFIG_FILE" ]]; then
+    source "$CONFIG_FILE"
+else
+    echo "Error: Config file '$CONFIG_FILE' not found!"
+    exit 1
+fi
+
+if [[ "$MODE" != "download" && "$MODE" != "upload" ]]; then
+    echo "Error: Mode must be 'download' or 'upload', got '$MODE'."
+    exit 1
+fi
+
+# Check required variables
+if [[ "$MODE" == "download" ]]; then
+    required_vars=(csv_file token_file_path Project_path)
+else
+    required_vars=(csv_file synapse_parent_id token_file_path)
+fi
+for var in "${required_vars[@]}"; do
+  if [ -z "${!var}" ]; then
+    echo "Error: Required variable $var is not set."
+    exit 1
+  fi
+done
+# Each shard would derive its own root from its part of the CSV
+if [[ "$MODE" == "upload" && "${synapse_mirror_root:-}" == "auto" ]]; then
+    echo "Error: synapse_mirror_root=auto is not supported for sharded uploads; set the local root directory."
+    exit 1
+fi
+# GATK_path is set in config.sh
+echo $GATK_path
+
+shards="${synapse_shards:-4}"
+echo "Memory Allocation: $synapse_memory"
+echo "Cores: $synapse_cores"
+echo "Time Limit: $timeLimit"
+echo "Shards: $shards"
+
+####################################################################################
+# Part2
+# Need to add correct docker for running
+docker="$docker_synapse"
+echo "Docker is $docker"
+###############################################################################
+# part 3
+# Need correct input file and PY function to run
+echo "csv_file is $csv_file"
+echo "$token_file_path"
+
+jobname="${Project}_synapse_${MODE}_sharded_$(date +%Y%m%d_%H%M%S)"
+shard_dir="$GATK_path/${jobname}_shards"
+mkdir -p "$shard_dir"
+env_setup="mkdir -p $GATK_HOME/.synapseCache && export SYNAPSE_CACHE_FOLDER=$GATK_HOME/.synapseCache && source /opt/conda/etc/profile.d/conda.sh && conda activate synapseclient"
+
+if [[ "$MODE" == "download" ]]; then
+    output_dir="${Project_path}/downloads"
+    mkdir -p "$output_dir"
+    ledger_dir="$output_dir"
+else
+    ledger_dir="$(dirname "$csv_file")"
+fi
+
+submit() {
+    # submit <name> <dependency or ""> <command>; prints the job ID
+    local name="$1" dependency="$2" command="$3"
+    local dependency_args=()
+    if [[ -n "$dependency" ]]; then
+        dependency_args=(-w "$dependency")
+    fi
+    bsub -cwd "$GATK_HOME" -q general -n "$synapse_cores" -M "$synapse_memory" -G compute-hirbea \
+        -a "docker($docker)" -W "${timeLimit}:00" \
+        -o "$GATK_path/${name}_OUTPUT.txt" \
+        -J "$name" "${dependency_args[@]}" \
+        -R "rusage[mem=$synapse_memory] span[hosts=1]" /bin/bash -c \
+        "$env_setup && $command" | grep -o '<[0-9]*>' | sed 's/[<>]//g'
+}
+
+# Plan: size every row (local sizes for uploads, remote for downloads) and bin-pack by bytes
+plan_job=$(submit "${jobname}_plan" "" \
+    "python3 ${PY_function_path}/synapse_shard.py plan --mode ${MODE} --file_path ${csv_file} --shards ${shards} --output_dir ${shard_dir} --authToken ${token_file_path} --workers ${synapse_cores:-4}")
+echo "Shard planning job submitted with ID: $plan_job"
+
+# One transfer job per shard, each with its own ledger so hosts never share a SQLite file
+shard_jobs=()
+shard_ledgers=()
+for ((i = 1; i <= shards; i++)); do
+    n=$(printf "%02d" "$i")
+    shard_csv="${shard_dir}/shard_${n}.csv"
+    shard_ledger="${ledger_dir}/.synapse_ledger_shard_${n}.sqlite"
+    shard_ledgers+=("$shard_ledger")
+    common="--authToken ${token_file_path} --file_path ${shard_csv} --workers ${synapse_cores:-4} --ledger ${shard_ledger} --event_log $GATK_path/${jobname}_${n}_EVENTS.jsonl --summary_json ${shard_dir}/summary_${n}.json"
+    if [[ "$MODE" == "download" ]]; then
+        command="python3 ${PY_function_path}/synapse_download.py ${common} --output_dir ${output_dir} --cache_max_gb ${synapse_cache_max_gb:-100}"
+    else
+        command="python3 ${PY_function_path}/synapse_uploading2.py ${common} --parent_id ${synapse_parent_id} ${synapse_mirror_root:+--mirror_root ${synapse_mirror_root}}"
+    fi
+    shard_job=$(submit "${jobname}_${n}" "done(${plan_job})" "$command")
+    echo "Shard ${n} job submitted with ID: $shard_job"
+    shard_jobs+=("ended(${shard_job})")
+done
+
+# Merge once every shard has ended, whether it succeeded or not; the shard
+# ledgers are folded into the default ledger, which verify and unsharded reruns open
+merge_dependency=$(IFS="&"; echo "${shard_jobs[*]}" | sed 's/&/ \&\& /g')
+merge_job=$(submit "${jobname}_merge" "$merge_dependency" \
+    "python3 ${PY_function_path}/synapse_shard.py merge '${shard_dir}/summary_*.json' --expected ${shards} --output ${shard_dir}/summary.json --ledger ${ledger_dir}/.synapse_ledger.sqlite --shard_ledgers ${shard_ledgers[*]}")
+echo "Summary merge job submitted with ID: $merge_job"
+
+# Save job ids, output file name and shard directory to a file
+echo "$merge_job $jobname $GATK_path/${jobname}_merge_OUTPUT.txt $shard_dir" >> $GATK_path/${merge_job}_INFO.txt
@@ -48,18 +48,40 @@ echo "$token_file_path"
 
 jobname="${Project}_synapse_upload_$(date +%Y%m%d_%H%M%S)"
 output_file="$GATK_path/${jobname}_OUTPUT.txt"
-# Submit the job to LSF and capture the job ID
-job_id=$(bsub -cwd "$GATK_HOME" -q general -n "$synapse_cores" -M "$synapse_memory" -G compute-hirbea \
-        -a "docker($docker)" -W "${timeLimit}:00" \
-        -o "$output_file" \
-        -J "$jobname" \
-        -R "rusage[mem=$synapse_memory] span[hosts=1]" /bin/bash -c \
-        "mkdir -p $GATK_HOME/.synapseCache && export SYNAPSE_CACHE_FOLDER=$GATK_HOME/.synapseCache && source /opt/conda/etc/profile.d/conda.sh && conda activate synapseclient && python3 ${PY_function_path}/synapse_uploading2.py --authToken ${token_file_path} --file_path ${csv_file} --parent_id ${synapse_parent_id}" | grep -o '<[0-9]*>' | sed 's/[<>]//g')
+# Arguments of the Python script, for the service or the LSF job
+py_args="--authToken ${token_file_path} --file_path ${csv_file} --parent_id ${synapse_parent_id} --workers ${synapse_cores:-4} ${synapse_mirror_root:+--mirror_root ${synapse_mirror_root}} --event_log $GATK_path/${jobname}_EVENTS.jsonl"
+
+# With synapse_service_spool set, hand the manifest to the resident transfer service
+# (sh_files/1_Docker_synapse_service.sh) instead of starting a new job; if no service
+# is up, submit exits non-zero and the job goes to LSF as usual
+# submit prints the service job ID, its spool file and the LSF job running the service
+job_id=""
+spool_job=""
+service_job=""
+if [ -n "$synapse_service_spool" ]; then
+  read -r job_id spool_job service_job <<< "$(python3 ${PY_function_path}/synapse_service.py submit --spool_dir "$synapse_service_spool" \
+          --mode upload --project "$Project" --jobname "$jobname" --output_file "$output_file" \
+          --summary_json "$GATK_path/${jobname}_SUMMARY.json" -- $py_args)"
+  if [ -n "$job_id" ]; then
+    echo "Queued to synapse_service at $synapse_service_spool (service LSF job $service_job)"
+    echo "Check with: python3 ${PY_function_path}/synapse_service.py job --spool_dir $synapse_service_spool $job_id"
+  fi
+fi
+if [ -z "$job_id" ]; then
+  # Submit the job to LSF and capture the job ID
+  job_id=$(bsub -cwd "$GATK_HOME" -q general -n "$synapse_cores" -M "$synapse_memory" -G compute-hirbea \
+          -a "docker($docker)" -W "${timeLimit}:00" \
+          -o "$output_file" \
+          -J "$jobname" \
+          -R "rusage[mem=$synapse_memory] span[hosts=1]" /bin/bash -c \
+          "mkdir -p $GATK_HOME/.synapseCache && export SYNAPSE_CACHE_FOLDER=$GATK_HOME/.synapseCache && source /opt/conda/etc/profile.d/conda.sh && conda activate synapseclient && python3 ${PY_function_path}/synapse_uploading2.py $py_args" | grep -o '<[0-9]*>' | sed 's/[<>]//g')
+fi
    
 echo "Synapse upload job submitted with ID: $job_id"
 
 # Save job id, output file name and synapse_parent_id to a file
-echo "$job_id $jobname $output_file $synapse_parent_id" >> $GATK_path/${job_id}_INFO.txt
+# (service jobs add their spool file and the service's LSF job ID)
+echo "$job_id $jobname $output_file $synapse_parent_id${spool_job:+ $spool_job $service_job}" >> $GATK_path/${job_id}_INFO.txt
   
 
 
@@ -0,0 +1,36 @@
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "PY_function"))
+
+# The units under test never talk to Synapse; the scripts only need the
+# client's names at import time, so stand-ins are registered when
+# synapseclient is not installed
+if importlib.util.find_spec("synapseclient") is None:
+    class SynapseError(Exception):
+        pass
+
+    class SynapseHTTPError(SynapseError):
+        pass
+
+    class _Entity(dict):
+        def __init__(self, *args, **kwargs):
+            super().__init__(kwargs)
+
+    client = types.ModuleType("synapseclient")
+    client.Synapse = type("Synapse", (), {})
+    client.File = type("File", (_Entity,), {})
+    client.Folder = type("Folder", (_Entity,), {})
+    core = types.ModuleType("synapseclient.core")
+    exceptions = types.ModuleType("synapseclient.core.exceptions")
+    exceptions.SynapseError = SynapseError
+    exceptions.SynapseHTTPError = SynapseHTTPError
+    client.core = core
+    core.exceptions = exceptions
+    sys.modules.update({
+        "synapseclient": client,
+        "synapseclient.core": core,
+        "synapseclient.core.exceptions": exceptions,
+    })
@@ -0,0 +1,40 @@
+import hashlib
+
+from synapse_cache import ManagedCache
+
+
+def store(cache, path, content):
+    path.write_bytes(content)
+    md5 = hashlib.md5(content).hexdigest()
+    assert cache.store(path, md5)
+    return md5
+
+
+def test_stored_file_is_served_to_another_target(tmp_path):
+    cache = ManagedCache(tmp_path / "cache", 10 ** 6)
+    md5 = store(cache, tmp_path / "a.bam", b"content")
+
+    assert cache.fetch(md5, 7, tmp_path / "copy" / "b.bam")
+    assert (tmp_path / "copy" / "b.bam").read_bytes() == b"content"
+    assert not list((tmp_path / "cache" / "objects").rglob("*.tmp"))
+
+
+def test_modified_linked_copy_is_a_miss(tmp_path):
+    cache = ManagedCache(tmp_path / "cache", 10 ** 6)
+    md5 = store(cache, tmp_path / "a.bam", b"content")
+    with open(tmp_path / "a.bam", "r+b") as handle:
+        handle.write(b"C")
+
+    assert not cache.fetch(md5, 7, tmp_path / "b.bam")
+    assert cache.misses == 1
+
+
+def test_trim_evicts_only_objects_the_cache_alone_holds(tmp_path):
+    cache = ManagedCache(tmp_path / "cache", 0)
+    kept = store(cache, tmp_path / "a.bam", b"kept")
+    evicted = store(cache, tmp_path / "b.bam", b"evicted")
+    (tmp_path / "b.bam").unlink()
+
+    assert cache.trim() == len(b"evicted")
+    assert cache.contains(kept, 4)
+    assert not cache.contains(evicted, 7)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import sqlite3
+
+import pytest
+
+import synapse_download
+from synapse_download import DOWNLOADED, FAILED, download_single_file, probe_file_sizes, resolve_rows
+
+FILE = "org.sagebionetworks.repo.model.FileEntity"
+FOLDER = "org.sagebionetworks.repo.model.Folder"
+
+
+class HeaderStub:
+    """
+    The part of SynapseIdValidator resolve_rows() uses: entity headers by ID.
+    """
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def resolve(self, synapse_ids):
+        list(synapse_ids)
+
+    def header(self, synapse_id):
+        return self.headers.get(synapse_id)
+
+
+def test_resolve_rows_treats_save_path_as_a_directory(tmp_path):
+    validator = HeaderStub({
+        "syn1": {"type": FILE, "name": "a.bam"},
+        "syn2": {"type": FOLDER, "name": "reads"},
+        "syn3": {"type": FILE, "name": "b.bam"},
+    })
+    rows = [
+        {"synapse_id": "syn1", "save_path": "batch1"},
+        {"synapse_id": "syn2", "save_path": "batch1"},
+        {"synapse_id": "syn3", "save_path": str(tmp_path / "elsewhere")},
+    ]
+
+    file_plan, folder_plan, unresolved, duplicates = resolve_rows(validator, rows, tmp_path)
+
+    assert [(entry["synapse_id"], entry["save_path"]) for entry in file_plan] == [
+        ("syn1", str(tmp_path / "batch1" / "a.bam")),
+        ("syn3", str(tmp_path / "elsewhere" / "b.bam")),
+    ]
+    assert folder_plan == [("syn2", tmp_path / "batch1" / "reads")]
+    assert (unresolved, duplicates) == (0, 0)
+
+
+def test_resolve_rows_counts_invalid_missing_and_duplicate_rows(tmp_path):
+    validator = HeaderStub({"syn1": {"type": FILE, "name": "a.bam"}})
+    rows = [
+        {"synapse_id": "syn1", "save_path": "x"},
+        {"synapse_id": "syn1", "save_path": "x"},
+        {"synapse_id": "syn9", "save_path": "x"},
+        {"synapse_id": "syn1", "save_path": ""},
+    ]
+
+    file_plan, folder_plan, unresolved, duplicates = resolve_rows(validator, rows, tmp_path)
+
+    assert len(file_plan) == 1
+    assert folder_plan == []
+    assert (unresolved, duplicates) == (2, 1)
+
+
+def test_download_many_passes_per_entry_overwrite(monkeypatch, tmp_path):
+    seen = {}
+
+    def fake_download(syn, synapse_id, save_path, overwrite, *args):
+        seen[synapse_id] = overwrite
+        return DOWNLOADED
+
+    monkeypatch.setattr(synapse_download, "download_single_file", fake_download)
+    plan = [
+        {"synapse_id": "syn1", "save_path": str(tmp_path / "a")},
+        {"synapse_id": "syn2", "save_path": str(tmp_path / "b"), "overwrite": True},
+    ]
+
+    counts = synapse_download.download_many(None, plan, workers=1)
+
+    assert counts[DOWNLOADED] == 2
+    assert seen == {"syn1": False, "syn2": True}
+
+
+
+class HandleStub:
+    """
+    Entity and file handle lookups of a Synapse session, without syn.get().
+    """
+
+    fileHandleEndpoint = "file"
+
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    def restGET(self, uri):
+        self.calls.append(uri)
+        return {"id": uri.split("/")[2], "dataFileHandleId": "fh1", "etag": "e"}
+
+    def restPOST(self, uri, body, endpoint=None):
+        self.calls.append(uri)
+        request = json.loads(body)
+        return {"requestedFiles": [
+            {
+                "fileHandleId": item["fileHandleId"],
+                "fileHandle": {"contentSize": len(self.content), "contentMd5": hashlib.md5(self.content).hexdigest()},
+                "preSignedURL": "https://example.org/fh1",
+            }
+            for item in request["requestedFiles"]
+        ]}
+
+    def get(self, *args, **kwargs):
+        raise AssertionError("probed files must not be looked up again")
+
+
+def test_probe_looks_up_handles_in_batches():
+    syn = HandleStub(b"data")
+    plan = [{"synapse_id": "syn1", "version": 1}, {"synapse_id": "syn2", "version": 1}, {"synapse_id": "syn3", "size": 9}]
+
+    probe_file_sizes(syn, plan, workers=2)
+
+    assert sorted(syn.calls) == ["/entity/syn1/version/1", "/entity/syn2/version/1", "/fileHandle/batch"]
+    assert plan[0] == {
+        "synapse_id": "syn1", "version": 1, "size": 4, "md5": hashlib.md5(b"data").hexdigest(), "file_handle_id": "fh1",
+    }
+    assert plan[2] == {"synapse_id": "syn3", "size": 9}
+
+
+def test_probed_file_is_fetched_from_its_handle(monkeypatch, tmp_path):
+    content = b"data"
+    monkeypatch.setattr(synapse_download, "fetch_url", lambda url, destination: destination.write_bytes(content))
+    syn = HandleStub(content)
+    md5 = hashlib.md5(content).hexdigest()
+
+    status = download_single_file(syn, "syn1", str(tmp_path / "a.bam"), md5=md5, size=4, file_handle_id="fh1")
+
+    assert status == DOWNLOADED
+    assert (tmp_path / "a.bam").read_bytes() == content
+    assert syn.calls == ["/fileHandle/batch"]
+
+
+def test_fetch_from_handle_rejects_wrong_content(monkeypatch, tmp_path):
+    monkeypatch.setattr(synapse_download, "fetch_url", lambda url, destination: destination.write_bytes(b"oops"))
+
+    status = download_single_file(
+        HandleStub(b"data"), "syn1", str(tmp_path / "a.bam"), md5=hashlib.md5(b"data").hexdigest(), size=4,
+        file_handle_id="fh1",
+    )
+
+    assert status == FAILED
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_main_closes_metrics_ledger_and_snapshot_when_a_download_fails(monkeypatch, tmp_path):
+    validator = HeaderStub({"syn1": {"type": FILE, "name": "a.bam"}})
+    validator.invalid = []
+    opened = {}
+
+    def failing_download(*args, **kwargs):
+        raise RuntimeError("connection lost")
+
+    def track(name, factory):
+        def wrapper(*args, **kwargs):
+            opened[name] = factory(*args, **kwargs)
+            return opened[name]
+        monkeypatch.setattr(synapse_download, name, wrapper)
+
+    monkeypatch.setattr(synapse_download, "validate_manifest", lambda *args: validator)
+    monkeypatch.setattr(synapse_download, "download_many", failing_download)
+    for name in ("TransferMetrics", "open_ledger", "open_snapshot"):
+        track(name, getattr(synapse_download, name))
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("synapse_id,save_path\nsyn1,batch1\n")
+
+    with pytest.raises(RuntimeError):
+        synapse_download.main([
+            "--tokenfile", str(tmp_path / "token"), "--file_path", str(manifest),
+            "--output_dir", str(tmp_path / "out"), "--no_cache", "--snapshot",
+        ], syn=object())
+
+    assert opened["TransferMetrics"]._stop.is_set()
+    for name in ("open_ledger", "open_snapshot"):
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened[name]._conn.execute("SELECT 1")
@@ -0,0 +1,30 @@
+import hashlib
+
+from synapse_hashing import HashCache, file_key, md5_file
+
+
+def test_md5_file_across_block_boundaries(tmp_path):
+    path = tmp_path / "a.bam"
+    content = bytes(range(256)) * 41
+    path.write_bytes(content)
+    expected = hashlib.md5(content).hexdigest()
+    for block_size in (1, 256, 1000, len(content), len(content) + 1):
+        assert md5_file(str(path), block_size) == expected
+
+
+def test_md5_file_of_empty_file(tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    assert md5_file(str(path)) == hashlib.md5(b"").hexdigest()
+
+
+def test_hash_cache_entry_follows_the_file(tmp_path):
+    path = tmp_path / "a.bam"
+    path.write_bytes(b"data")
+    cache = HashCache(tmp_path / "cache.sqlite")
+    cache.put(file_key(str(path)), "md5")
+    assert cache.get(file_key(str(path))) == "md5"
+
+    path.write_bytes(b"changed data")
+    assert cache.get(file_key(str(path))) is None
+    cache.close()
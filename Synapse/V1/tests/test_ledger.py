@@ -0,0 +1,54 @@
+import os
+
+from synapse_ledger import TransferLedger
+
+
+def finished(ledger, tmp_path, name="a.bam", version=1):
+    local = tmp_path / name
+    local.write_bytes(b"data")
+    ledger.start("download", "syn1", str(local), version)
+    ledger.finish("download", "syn1", str(local), version=version)
+    return local
+
+
+def test_verified_until_the_file_or_version_changes(tmp_path):
+    ledger = TransferLedger(tmp_path / "ledger.sqlite")
+    local = finished(ledger, tmp_path)
+    assert ledger.is_verified("download", "syn1", str(local), 1)
+    assert not ledger.is_verified("download", "syn1", str(local), 2)
+
+    local.write_bytes(b"changed data")
+    assert not ledger.is_verified("download", "syn1", str(local), 1)
+
+
+def test_started_and_failed_transfers_are_stale(tmp_path):
+    ledger = TransferLedger(tmp_path / "ledger.sqlite")
+    local = tmp_path / "a.bam"
+    assert not ledger.is_stale("download", "syn1", str(local))
+
+    ledger.start("download", "syn1", str(local), 1)
+    assert ledger.is_stale("download", "syn1", str(local), 1)
+
+    local.write_bytes(b"data")
+    ledger.finish("download", "syn1", str(local), version=1)
+    assert not ledger.is_stale("download", "syn1", str(local), 1)
+    assert ledger.is_stale("download", "syn1", str(local), 2)
+
+    ledger.fail("download", "syn1", str(local))
+    assert ledger.is_stale("download", "syn1", str(local), 1)
+
+
+def test_merge_from_keeps_the_newer_row(tmp_path):
+    target = TransferLedger(tmp_path / "target.sqlite")
+    shard = TransferLedger(tmp_path / "shard.sqlite")
+    local = finished(shard, tmp_path)
+    shard.finish("download", "syn2", str(local), version=1)
+    target.fail("download", "syn2", str(local))
+    shard.close()
+
+    assert target.merge_from(tmp_path / "shard.sqlite") == 2
+
+    assert target.get("download", "syn1", str(local))["state"] == "done"
+    # The target's row was written after the shard's and is kept
+    assert target.get("download", "syn2", str(local))["state"] == "failed"
+    assert os.path.exists(tmp_path / "shard.sqlite")
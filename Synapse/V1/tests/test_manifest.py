@@ -0,0 +1,32 @@
+import gzip
+
+from synapse_manifest import iter_manifest_rows, manifest_delimiter, open_manifest
+
+EXPORT = b'files,note\r\r\n/a.bam,"line1\r\nline2"\r\r\n/b.bam,plain\r\n'
+
+
+def read(path):
+    with open_manifest(path) as handle:
+        reader = iter_manifest_rows(handle, path)
+        return reader.fieldnames, list(reader)
+
+
+def test_spreadsheet_carriage_returns_are_stripped(tmp_path):
+    path = tmp_path / "manifest.csv"
+    path.write_bytes(EXPORT)
+    fieldnames, rows = read(path)
+    assert fieldnames == ["files", "note"]
+    assert rows[1] == {"files": "/b.bam", "note": "plain"}
+
+
+def test_quoted_newlines_are_kept(tmp_path):
+    path = tmp_path / "manifest.csv"
+    path.write_bytes(EXPORT)
+    assert read(path)[1][0]["note"] == "line1\r\nline2"
+
+
+def test_gzip_suffix_is_case_insensitive(tmp_path):
+    path = tmp_path / "MANIFEST.TSV.GZ"
+    path.write_bytes(gzip.compress(EXPORT.replace(b",", b"\t")))
+    assert manifest_delimiter(path) == "\t"
+    assert [row["files"] for row in read(path)[1]] == ["/a.bam", "/b.bam"]
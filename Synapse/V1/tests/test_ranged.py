@@ -0,0 +1,38 @@
+import json
+
+from synapse_ranged import RangeProgress
+
+IDENTITY = {"file_handle_id": "123", "size": 1000, "md5": "abc", "chunk": 100}
+
+
+def test_progress_resumes_marked_chunks(tmp_path):
+    progress = RangeProgress(tmp_path / "a.bam.ranges", IDENTITY)
+    progress.open(resume=False)
+    progress.mark(0)
+    progress.mark(3)
+    progress.close()
+
+    assert RangeProgress(tmp_path / "a.bam.ranges", IDENTITY).load() == {0, 3}
+
+
+def test_progress_of_other_content_is_ignored(tmp_path):
+    progress = RangeProgress(tmp_path / "a.bam.ranges", IDENTITY)
+    progress.open(resume=False)
+    progress.mark(1)
+    progress.close()
+
+    assert RangeProgress(tmp_path / "a.bam.ranges", dict(IDENTITY, md5="other")).load() == set()
+
+
+def test_progress_ignores_a_cut_short_line(tmp_path):
+    path = tmp_path / "a.bam.ranges"
+    path.write_text(json.dumps(IDENTITY) + "\n2\n5\n1", encoding="utf-8")
+    path.write_text(path.read_text(encoding="utf-8") + "x", encoding="utf-8")
+
+    assert RangeProgress(path, IDENTITY).load() == {2, 5}
+
+
+def test_progress_without_sidecar_is_empty(tmp_path):
+    progress = RangeProgress(tmp_path / "missing.ranges", IDENTITY)
+    assert progress.load() == set()
+    progress.remove()
@@ -0,0 +1,86 @@
+import pytest
+
+from synapse_retry import AdaptiveLimiter, RetryPolicy, call_with_retry, http_status, is_transient
+
+
+class Throttled(Exception):
+    def __init__(self):
+        super().__init__("429 Client Error: Too Many Requests")
+
+
+def test_http_status_from_message():
+    assert http_status(Exception("503 Server Error")) == 503
+    assert http_status(Exception("not found")) is None
+
+
+def test_transient_errors():
+    assert is_transient(Throttled())
+    assert is_transient(ConnectionResetError())
+    assert not is_transient(ValueError("400 Client Error"))
+
+
+def test_limiter_grows_after_limit_successes():
+    limiter = AdaptiveLimiter(initial=2, maximum=3)
+    limiter.on_success()
+    assert limiter.limit == 2
+    limiter.on_success()
+    assert limiter.limit == 3
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.limit == 3
+
+
+def test_limiter_halves_once_per_cooldown():
+    limiter = AdaptiveLimiter(initial=8, maximum=16, cooldown=60)
+    assert limiter.on_throttle() == 4
+    assert limiter.on_throttle() is None
+    assert limiter.limit == 4
+
+
+def test_limiter_never_drops_below_minimum():
+    limiter = AdaptiveLimiter(initial=1, maximum=4, cooldown=0)
+    assert limiter.on_throttle() == 1
+
+
+def test_policy_retries_transient_errors_then_succeeds(monkeypatch):
+    monkeypatch.setattr("synapse_retry.time.sleep", lambda seconds: None)
+    limiter = AdaptiveLimiter(initial=4, maximum=8, cooldown=0)
+    policy = RetryPolicy(attempts=3, limiter=limiter, printer=lambda message: None)
+    calls = []
+    retries = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Throttled()
+        return "ok"
+
+    assert policy.call("syn1", flaky, on_retry=lambda: retries.append(1)) == "ok"
+    assert len(calls) == 3
+    assert len(retries) == 2
+    # Halved twice to 1, then one success grows it back to 2
+    assert limiter.limit == 2
+
+
+def test_policy_raises_non_transient_errors_at_once():
+    policy = RetryPolicy(attempts=5, printer=lambda message: None)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        policy.call("syn1", broken)
+    assert len(calls) == 1
+
+
+def test_policy_raises_last_error_when_attempts_run_out(monkeypatch):
+    monkeypatch.setattr("synapse_retry.time.sleep", lambda seconds: None)
+    policy = RetryPolicy(attempts=2, printer=lambda message: None)
+    with pytest.raises(Throttled):
+        policy.call("syn1", lambda: (_ for _ in ()).throw(Throttled()))
+
+
+def test_call_with_retry_without_policy_drops_on_retry():
+    assert call_with_retry(None, "syn1", lambda value: value * 2, 21, on_retry=lambda: None) == 42
@@ -0,0 +1,40 @@
+from synapse_service import DONE, FairQueue, job_state, open_spool, submit_job, write_json
+
+
+def test_fair_queue_round_robin_across_projects():
+    queue = FairQueue()
+    for project, name in (("A", "a1"), ("A", "a2"), ("A", "a3"), ("B", "b1"), ("B", "b2")):
+        queue.add({"project": project, "name": name})
+
+    order = []
+    while True:
+        job = queue.pop()
+        if job is None:
+            break
+        order.append(job["name"])
+
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+    assert len(queue) == 0
+
+
+def test_fair_queue_new_project_gets_the_next_turn():
+    queue = FairQueue()
+    queue.add({"project": "A", "name": "a1"})
+    queue.add({"project": "A", "name": "a2"})
+    assert queue.pop()["name"] == "a1"
+    queue.add({"project": "B", "name": "b1"})
+    assert queue.pop()["name"] == "a2"
+    assert queue.pop()["name"] == "b1"
+    assert queue.counts() == {}
+
+
+def test_job_state_follows_the_spool(tmp_path):
+    spool = open_spool(tmp_path / "spool")
+    path = submit_job(spool, {"job_id": "svc1", "mode": "download", "args": [], "output_file": "out.txt"})
+    assert job_state(spool, "svc1")["state"] == "PEND"
+
+    write_json(spool / DONE / path.name, {"job_id": "svc1", "exit_code": 0, "output_file": "out.txt"})
+    path.unlink()
+    info = job_state(spool, "svc1")
+    assert (info["state"], info["output_file"]) == ("DONE", "out.txt")
+    assert job_state(spool, "svc2") is None
@@ -0,0 +1,43 @@
+import json
+
+from synapse_ledger import TransferLedger
+from synapse_shard import assign_shards, main
+
+
+def test_assign_shards_balances_bytes_largest_first():
+    assignment, totals = assign_shards([10, 1, 7, 3, 6, 5], 2)
+    assert sorted(totals) == [16, 16]
+    for shard, total in enumerate(totals):
+        assert sum(size for size, bin_ in zip([10, 1, 7, 3, 6, 5], assignment) if bin_ == shard) == total
+
+
+def test_assign_shards_is_deterministic_on_ties():
+    assert assign_shards([4, 4, 4, 4], 2) == ([0, 1, 0, 1], [8, 8])
+    assert assign_shards([4, 4, 4, 4], 2) == assign_shards([4, 4, 4, 4], 2)
+
+
+def test_assign_shards_with_more_shards_than_items():
+    assignment, totals = assign_shards([5], 3)
+    assert assignment == [0]
+    assert totals == [5, 0, 0]
+
+
+def test_merge_folds_shard_ledgers_into_default_ledger(tmp_path):
+    for n in (1, 2):
+        ledger = TransferLedger(tmp_path / f".synapse_ledger_shard_0{n}.sqlite")
+        local = tmp_path / f"file{n}"
+        local.write_text("x")
+        ledger.finish("download", f"syn{n}", str(local), version=1)
+        ledger.close()
+        (tmp_path / f"summary_0{n}.json").write_text(json.dumps({"counts": {"downloaded": 1}}))
+
+    code = main([
+        "merge", str(tmp_path / "summary_*.json"), "--expected", "2",
+        "--ledger", str(tmp_path / ".synapse_ledger.sqlite"),
+        "--shard_ledgers", str(tmp_path / ".synapse_ledger_shard_*.sqlite"),
+    ])
+
+    assert code == 0
+    ledger = TransferLedger(tmp_path / ".synapse_ledger.sqlite")
+    assert [row["synapse_id"] for row in ledger.rows("download")] == ["syn1", "syn2"]
+    ledger.close()
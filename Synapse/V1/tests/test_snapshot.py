@@ -0,0 +1,112 @@
+import json
+
+from synapse_ledger import TransferLedger
+from synapse_snapshot import CHANGED, NEW, UNCHANGED, RemoteSnapshot
+
+FILE = "org.sagebionetworks.repo.model.FileEntity"
+FOLDER = "org.sagebionetworks.repo.model.Folder"
+
+
+class TreeStub:
+    """
+    A Synapse folder tree answering the calls RemoteSnapshot.refresh() makes.
+    """
+
+    fileHandleEndpoint = "file"
+
+    def __init__(self):
+        self.children = {
+            "syn1": [
+                {"id": "syn2", "name": "a.bam", "type": FILE, "versionNumber": 1, "modifiedOn": "t1"},
+                {"id": "syn3", "name": "sub", "type": FOLDER},
+            ],
+            "syn3": [{"id": "syn4", "name": "b.bam", "type": FILE, "versionNumber": 1, "modifiedOn": "t1"}],
+        }
+        self.sizes = {"syn2": 4, "syn4": 6}
+        self.lookups = 0
+
+    def getChildren(self, folder_id):
+        return iter(self.children.get(folder_id, []))
+
+    def restGET(self, uri):
+        self.lookups += 1
+        synapse_id = uri.split("/")[2]
+        return {"id": synapse_id, "dataFileHandleId": f"fh{synapse_id}", "etag": "e"}
+
+    def restPOST(self, uri, body, endpoint=None):
+        requested = json.loads(body)["requestedFiles"]
+        return {"requestedFiles": [
+            {
+                "fileHandleId": item["fileHandleId"],
+                "fileHandle": {"contentSize": self.sizes[item["associateObjectId"]], "contentMd5": "md5"},
+            }
+            for item in requested
+        ]}
+
+
+def write_local(root, sizes):
+    for relative, size in sizes.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+
+
+def test_refresh_reuses_metadata_of_unmodified_files(tmp_path):
+    tree = TreeStub()
+    snapshot = RemoteSnapshot(tmp_path / "snapshot.sqlite")
+
+    assert snapshot.refresh(tree, "syn1", printer=lambda message: None)["looked_up"] == 2
+    tree.children["syn3"][0].update(versionNumber=2, modifiedOn="t2")
+    counts = snapshot.refresh(tree, "syn1", printer=lambda message: None)
+
+    assert (counts["looked_up"], counts["reused"]) == (1, 1)
+    assert tree.lookups == 3
+    assert snapshot.entries("syn1")["syn4"]["path"] == "sub/b.bam"
+
+
+def test_delta_by_size_without_ledger(tmp_path):
+    snapshot = RemoteSnapshot(tmp_path / "snapshot.sqlite")
+    snapshot.refresh(TreeStub(), "syn1", printer=lambda message: None)
+    local = tmp_path / "out"
+    write_local(local, {"a.bam": 4})
+    delta = snapshot.delta("syn1", local)
+    assert [entry["synapse_id"] for entry in delta[UNCHANGED]] == ["syn2"]
+    assert [entry["synapse_id"] for entry in delta[NEW]] == ["syn4"]
+
+    write_local(local, {"sub/b.bam": 5})
+    delta = snapshot.delta("syn1", local)
+    assert [entry["synapse_id"] for entry in delta[CHANGED]] == ["syn4"]
+    # Changed files must replace the local copy when downloaded
+    assert delta[CHANGED][0]["overwrite"] is True
+    assert "overwrite" not in delta[UNCHANGED][0]
+
+
+def test_delta_with_ledger_falls_back_to_size_without_a_row(tmp_path):
+    snapshot = RemoteSnapshot(tmp_path / "snapshot.sqlite")
+    snapshot.refresh(TreeStub(), "syn1", printer=lambda message: None)
+    local = tmp_path / "out"
+    write_local(local, {"a.bam": 4, "sub/b.bam": 6})
+    ledger = TransferLedger(tmp_path / "ledger.sqlite")
+    ledger.finish("download", "syn2", str(local / "a.bam"), version=1)
+
+    delta = snapshot.delta("syn1", local, ledger)
+
+    # Pulled before the ledger existed: same size, so not downloaded again
+    assert [entry["synapse_id"] for entry in delta[UNCHANGED]] == ["syn2", "syn4"]
+    assert delta[CHANGED] == []
+
+
+def test_delta_with_ledger_replaces_stale_files(tmp_path):
+    snapshot = RemoteSnapshot(tmp_path / "snapshot.sqlite")
+    snapshot.refresh(TreeStub(), "syn1", printer=lambda message: None)
+    local = tmp_path / "out"
+    write_local(local, {"a.bam": 4, "sub/b.bam": 6})
+    ledger = TransferLedger(tmp_path / "ledger.sqlite")
+    ledger.start("download", "syn2", str(local / "a.bam"), 1)
+    ledger.finish("download", "syn4", str(local / "sub" / "b.bam"), version=0)
+
+    delta = snapshot.delta("syn1", local, ledger)
+
+    # Interrupted, and downloaded at an older version: both replaced
+    assert [entry["synapse_id"] for entry in delta[CHANGED]] == ["syn2", "syn4"]
+    assert all(entry["overwrite"] for entry in delta[CHANGED])
@@ -0,0 +1,71 @@
+import hashlib
+
+from synapse_plan import SKIP, UPLOAD
+from synapse_uploading2 import SKIPPED, UPLOADED, accepts_known_md5, annotation_changes, plan_upload_action, upload_single_file
+
+
+def test_annotation_changes_skips_matching_values():
+    current = {
+        "assay": {"type": "STRING", "value": ["WGS"]},
+        "reads": {"type": "LONG", "value": [100]},
+    }
+    changes = annotation_changes(current, {"assay": "WGS", "reads": "100", "tissue": "lung"})
+    assert changes == {"tissue": {"type": "STRING", "value": ["lung"]}}
+
+
+def test_annotation_changes_keeps_numeric_types_that_still_parse():
+    current = {"reads": {"type": "LONG", "value": [100]}, "score": {"type": "DOUBLE", "value": [1.5]}}
+    changes = annotation_changes(current, {"reads": "200", "score": "high"})
+    assert changes == {
+        "reads": {"type": "LONG", "value": ["200"]},
+        "score": {"type": "STRING", "value": ["high"]},
+    }
+
+
+def test_accepts_known_md5_checks_the_signature():
+    def current(syn, parent, path, md5=None, file_size=None, mimetype=None):
+        pass
+
+    def older(syn, parent, path, mimetype=None):
+        pass
+
+    assert accepts_known_md5(current)
+    assert not accepts_known_md5(older)
+    assert accepts_known_md5(lambda *args, **kwargs: None)
+
+
+class UnlistedParent:
+    """
+    A parent whose listing failed: rows look names up one by one.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.stored = []
+
+    def findEntityId(self, name, parent):
+        return "syn9"
+
+    def get(self, synapse_id, downloadFile=True):
+        return {"id": synapse_id, "_file_handle": {
+            "contentMd5": hashlib.md5(self.content).hexdigest(), "contentSize": len(self.content),
+        }}
+
+    def store(self, entity):
+        self.stored.append(entity)
+        return {"id": "syn9", "versionNumber": 2}
+
+
+def test_version_mode_without_parent_index_compares_the_entity(tmp_path):
+    path = tmp_path / "a.bam"
+    path.write_bytes(b"data")
+    row = {"files": str(path)}
+
+    syn = UnlistedParent(b"data")
+    assert upload_single_file(syn, "syn1", row, index=None, on_change="version") == SKIPPED
+    assert plan_upload_action(syn, "syn1", row, index=None, on_change="version")[0] == SKIP
+
+    syn = UnlistedParent(b"other")
+    assert plan_upload_action(syn, "syn1", row, index=None, on_change="version")[0] == UPLOAD
+    assert upload_single_file(syn, "syn1", row, index=None, on_change="version") == UPLOADED
+    assert len(syn.stored) == 1
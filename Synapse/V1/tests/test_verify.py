@@ -0,0 +1,41 @@
+import csv
+
+from synapse_ledger import TransferLedger
+from synapse_verify import MD5_MISMATCH, MISSING, VERIFIED, downloaded_files, requeue
+
+
+def ledger_with_downloads(tmp_path):
+    ledger = TransferLedger(tmp_path / "ledger.sqlite")
+    for synapse_id, path in (("syn1", tmp_path / "out" / "a.bam"), ("syn2", tmp_path / "elsewhere" / "b.bam")):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"data")
+        ledger.finish("download", synapse_id, str(path), version=1)
+    return ledger
+
+
+def test_downloaded_files_limited_to_roots(tmp_path):
+    ledger = ledger_with_downloads(tmp_path)
+    assert [record["synapse_id"] for record in downloaded_files(ledger, [tmp_path / "out"])] == ["syn1"]
+    assert len(downloaded_files(ledger, [tmp_path / "out", tmp_path / "elsewhere"])) == 2
+    assert len(downloaded_files(ledger)) == 2
+
+
+def test_requeue_writes_directories_as_save_path(tmp_path):
+    ledger = ledger_with_downloads(tmp_path)
+    records = downloaded_files(ledger)
+    statuses = {"syn1": MD5_MISMATCH, "syn2": VERIFIED}
+    for record in records:
+        record["status"] = statuses[record["synapse_id"]]
+    records.append({"synapse_id": "syn3", "local_path": str(tmp_path / "out" / "c.bam"), "status": MISSING})
+
+    bad = requeue(ledger, records, tmp_path / "requeue.csv")
+
+    assert [record["synapse_id"] for record in bad] == ["syn1", "syn3"]
+    with open(tmp_path / "requeue.csv", newline="", encoding="utf-8") as handle:
+        rows = list(csv.DictReader(handle))
+    # synapse_download.py appends the entity name to save_path
+    assert [(row["synapse_id"], row["save_path"]) for row in rows] == [
+        ("syn1", str(tmp_path / "out")),
+        ("syn3", str(tmp_path / "out")),
+    ]
+    assert ledger.get("download", "syn1", str(tmp_path / "out" / "a.bam"))["state"] == "failed"